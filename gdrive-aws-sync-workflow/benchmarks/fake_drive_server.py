@@ -0,0 +1,373 @@
+"""
+Local stand-in for the Drive v3 API used by the transfer benchmarks and API load tests.
+
+Serves a synthetic "Dataset" tree (class folders, optional sub-folders and
+files) with deterministic content, so ``DriveToS3Transfer`` (with
+``drive_endpoint``) and the API (with ``DRIVE_ENDPOINT_URL``) can run
+against it. Supported calls are the ones they make: ``files.list`` (by
+name, ``name contains`` or parent), ``files.get`` (metadata and
+``alt=media`` with HTTP Range), ``changes.getStartPageToken`` and
+multipart/mixed batch requests.
+"""
+import argparse
+import email
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+ROOT_ID = "root"
+DATASET_ID = "dataset"
+# Every file body is a window onto this block, so content costs no memory per file
+BLOCK_SIZE = 1024 * 1024
+
+_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+def parse_size(value: str) -> int:
+    """Parse ``512KB``, ``8MB`` or a plain byte count"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*", value.upper())
+    if not match:
+        raise ValueError(f"invalid size: {value}")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+class SizeDistribution:
+    """
+    File size distribution given as a spec string.
+
+    ``fixed:1MB``, ``uniform:100KB:20MB`` or ``lognormal:2MB:1.0`` (median and
+    sigma). Several specs may be mixed with weights:
+    ``90*uniform:50KB:500KB,10*fixed:200MB``.
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        self.parts: List[Tuple[float, str, List[str]]] = []
+        for item in spec.split(','):
+            weight, _, dist = item.rpartition('*')
+            kind, *params = dist.split(':')
+            if kind not in ('fixed', 'uniform', 'lognormal'):
+                raise ValueError(f"unknown size distribution: {kind}")
+            self.parts.append((float(weight or 1), kind, params))
+
+    def sample(self, rng: random.Random) -> int:
+        _, kind, params = rng.choices(self.parts, weights=[part[0] for part in self.parts])[0]
+        if kind == 'fixed':
+            return parse_size(params[0])
+        if kind == 'uniform':
+            return rng.randint(parse_size(params[0]), parse_size(params[1]))
+        median, sigma = parse_size(params[0]), float(params[1])
+        return max(1, int(rng.lognormvariate(0, sigma) * median))
+
+@dataclass
+class FakeFile:
+    id: str
+    name: str
+    mime_type: str
+    parent: str
+    size: int = 0
+    offset: int = 0
+
+    def resource(self) -> dict:
+        resource = {
+            'kind': 'drive#file',
+            'id': self.id,
+            'name': self.name,
+            'mimeType': self.mime_type,
+            'parents': [self.parent],
+            'trashed': False,
+            'modifiedTime': '2024-01-01T00:00:00.000Z',
+        }
+        if self.mime_type != FOLDER_MIME_TYPE:
+            resource['size'] = str(self.size)
+            resource['md5Checksum'] = hashlib.md5(f"{self.id}:{self.size}".encode()).hexdigest()
+        return resource
+
+class FakeDrive:
+    """Synthetic Drive tree plus the request handling shared by plain and batch calls"""
+
+    def __init__(self, classes: int, files_per_class: int, sizes: SizeDistribution,
+                 subfolders: int = 0, seed: int = 0, latency: float = 0.0,
+                 media_latency: float = 0.0, bandwidth: Optional[float] = None,
+                 error_rate: float = 0.0):
+        """
+        Args:
+            classes (int): Class folders under ``Dataset``
+            files_per_class (int): Files in each class folder (spread over sub-folders)
+            sizes (SizeDistribution): File size distribution
+            subfolders (int): Sub-folders per class folder
+            seed (int): Seed for sizes and content
+            latency (float): Seconds added to every metadata response
+            media_latency (float): Seconds added before the first byte of media responses
+            bandwidth (Optional[float]): Per-connection media bandwidth cap in bytes/s
+            error_rate (float): Share of requests answered with a 429 rate-limit error
+        """
+        self.latency = latency
+        self.media_latency = media_latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.block = random.Random(seed).randbytes(BLOCK_SIZE)
+
+        self.files: Dict[str, FakeFile] = {}
+        self.children: Dict[str, List[str]] = {}
+        self._add(FakeFile(DATASET_ID, "Dataset", FOLDER_MIME_TYPE, ROOT_ID))
+        rng = random.Random(seed)
+        for class_index in range(classes):
+            class_id = f"class{class_index:04d}"
+            self._add(FakeFile(class_id, f"class_{class_index:04d}", FOLDER_MIME_TYPE, DATASET_ID))
+            parents = [class_id]
+            for sub_index in range(subfolders):
+                sub_id = f"{class_id}sub{sub_index:03d}"
+                self._add(FakeFile(sub_id, f"part_{sub_index:03d}", FOLDER_MIME_TYPE, class_id))
+                parents.append(sub_id)
+            for file_index in range(files_per_class):
+                file_id = f"{class_id}f{file_index:06d}"
+                self._add(FakeFile(
+                    file_id, f"img_{file_index:06d}.jpg", "image/jpeg",
+                    parents[file_index % len(parents)],
+                    size=sizes.sample(rng), offset=rng.randrange(BLOCK_SIZE)
+                ))
+
+    def _add(self, file: FakeFile) -> None:
+        self.files[file.id] = file
+        self.children.setdefault(file.parent, []).append(file.id)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(file.size for file in self.files.values())
+
+    def content(self, file: FakeFile, start: int, end: int) -> bytes:
+        """Bytes ``start..end`` (inclusive) of a file"""
+        out = bytearray()
+        position = (file.offset + start) % BLOCK_SIZE
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = self.block[position:position + remaining]
+            out += chunk
+            remaining -= len(chunk)
+            position = 0
+        return bytes(out)
+
+    def throttled(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < self.error_rate
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]]) -> Tuple[int, dict]:
+        """Answer a JSON API call; returns ``(status, body)``"""
+        if self.throttled():
+            return 429, _error(429, "rateLimitExceeded", "Rate limit exceeded")
+        if self.latency:
+            time.sleep(self.latency)
+
+        params = {key: values[-1] for key, values in query.items()}
+        if path == "/drive/v3/files" and method == "GET":
+            return self._list(params)
+        if path == "/drive/v3/changes/startPageToken":
+            return 200, {'kind': 'drive#startPageToken', 'startPageToken': '1'}
+        if path == "/drive/v3/changes":
+            return 200, {'kind': 'drive#changeList', 'changes': [], 'newStartPageToken': '1'}
+        match = re.fullmatch(r"/drive/v3/files/([^/]+)", path)
+        if match and method == "GET":
+            file = self.files.get(match.group(1))
+            if file is None:
+                return 404, _error(404, "notFound", f"File not found: {match.group(1)}")
+            return 200, file.resource()
+        return 404, _error(404, "notFound", f"Unsupported call: {method} {path}")
+
+    def _list(self, params: Dict[str, str]) -> Tuple[int, dict]:
+        query = params.get('q', '')
+        name = re.search(r"name\s*=\s*'([^']*)'", query)
+        parent = re.search(r"'([^']+)' in parents", query)
+        if parent:
+            ids = self.children.get(parent.group(1), [])
+        elif name:
+            ids = [file.id for file in self.files.values() if file.name == name.group(1)]
+        else:
+            ids = list(self.files)
+
+        matches = [self.files[file_id] for file_id in ids]
+        contains = re.search(r"name contains '([^']*)'", query)
+        if contains:
+            matches = [file for file in matches if contains.group(1).lower() in file.name.lower()]
+        if "mimeType = 'application/vnd.google-apps.folder'" in query.replace("mimeType='", "mimeType = '"):
+            matches = [file for file in matches if file.mime_type == FOLDER_MIME_TYPE]
+
+        page_size = min(1000, int(params.get('pageSize', 100)))
+        start = int(params.get('pageToken') or 0)
+        body = {'kind': 'drive#fileList', 'files': [file.resource() for file in matches[start:start + page_size]]}
+        if start + page_size < len(matches):
+            body['nextPageToken'] = str(start + page_size)
+        return 200, body
+
+def _error(code: int, reason: str, message: str) -> dict:
+    return {'error': {'code': code, 'message': message, 'errors': [{'reason': reason, 'message': message}]}}
+
+def discovery_document(base_url: str) -> bytes:
+    """The static Drive v3 discovery document, re-pointed at ``base_url``"""
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = json.loads(get_static_doc("drive", "v3"))
+    document['rootUrl'] = f"{base_url}/"
+    document['mtlsRootUrl'] = f"{base_url}/"
+    document['baseUrl'] = f"{base_url}/{document['servicePath']}"
+    return json.dumps(document).encode()
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    drive: FakeDrive = None
+    discovery: bytes = b""
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json",
+              headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith("/discovery/"):
+            self._send(200, self.discovery)
+            return
+        if query.get('alt') == ['media']:
+            self._media(url.path.rsplit('/', 1)[-1])
+            return
+        status, body = self.drive.handle("GET", url.path, query)
+        self._send(status, json.dumps(body).encode())
+
+    def _media(self, file_id: str) -> None:
+        drive = self.drive
+        file = drive.files.get(file_id)
+        if file is None or file.mime_type == FOLDER_MIME_TYPE:
+            self._send(404, json.dumps(_error(404, "notFound", f"File not found: {file_id}")).encode())
+            return
+        if drive.throttled():
+            self._send(429, json.dumps(_error(429, "rateLimitExceeded", "Rate limit exceeded")).encode())
+            return
+        if drive.media_latency:
+            time.sleep(drive.media_latency)
+
+        start, end, status, headers = 0, file.size - 1, 200, {}
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else file.size - 1, file.size - 1)
+            if start >= file.size:
+                self._send(416, b"", headers={'Content-Range': f"bytes */{file.size}"})
+                return
+            status = 206
+            headers['Content-Range'] = f"bytes {start}-{end}/{file.size}"
+
+        body = drive.content(file, start, end) if file.size else b""
+        if drive.bandwidth:
+            time.sleep(len(body) / drive.bandwidth)
+        self._send(status, body, content_type="image/jpeg", headers=headers)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if urlsplit(self.path).path.startswith("/batch"):
+            self._batch(body)
+            return
+        self._send(404, json.dumps(_error(404, "notFound", "Unsupported call")).encode())
+
+    def _batch(self, body: bytes) -> None:
+        """Answer a multipart/mixed batch request, one JSON response per part"""
+        message = email.message_from_bytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        boundary = f"batch_{random.getrandbits(64):016x}"
+        out = []
+        for part in message.get_payload():
+            request_line = part.get_payload().lstrip().split('\n', 1)[0].strip()
+            method, target, _ = request_line.split(' ', 2)
+            url = urlsplit(target)
+            status, response = self.drive.handle(method, url.path, parse_qs(url.query))
+            content_id = part['Content-ID'].strip('<>')
+            payload = json.dumps(response)
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n{payload}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        self._send(200, "".join(out).encode(), content_type=f"multipart/mixed; boundary={boundary}")
+
+def start_server(drive: FakeDrive, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the fake Drive on a daemon thread; the bound port is ``server.server_address[1]``"""
+    server = ThreadingHTTPServer((host, port), FakeDriveHandler)
+    server.daemon_threads = True
+    handler = type("BoundFakeDriveHandler", (FakeDriveHandler,), {
+        'drive': drive,
+        'discovery': discovery_document(f"http://{host}:{server.server_address[1]}"),
+    })
+    server.RequestHandlerClass = handler
+    threading.Thread(target=server.serve_forever, name="fake-drive", daemon=True).start()
+    return server
+
+def add_tree_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--classes", type=int, default=4, help="Class folders (default: 4)")
+    parser.add_argument("--files-per-class", type=int, default=50, help="Files per class folder (default: 50)")
+    parser.add_argument("--subfolders", type=int, default=0, help="Sub-folders per class folder (default: 0)")
+    parser.add_argument("--sizes", default="uniform:100KB:2MB",
+                        help="Size distribution, e.g. fixed:1MB, uniform:100KB:2MB, lognormal:1MB:1.0, "
+                             "or weighted mixes like 90*uniform:50KB:500KB,10*fixed:64MB")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for sizes and content (default: 0)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per metadata call")
+    parser.add_argument("--media-latency-ms", type=float, default=0.0, help="Added latency before media bodies")
+    parser.add_argument("--bandwidth-mbps", type=float, default=None, help="Per-connection media bandwidth cap in MB/s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 429 (default: 0)")
+
+def drive_from_args(args: argparse.Namespace) -> FakeDrive:
+    return FakeDrive(
+        classes=args.classes,
+        files_per_class=args.files_per_class,
+        sizes=SizeDistribution(args.sizes),
+        subfolders=args.subfolders,
+        seed=args.seed,
+        latency=args.latency_ms / 1000,
+        media_latency=args.media_latency_ms / 1000,
+        bandwidth=args.bandwidth_mbps * 1024 * 1024 if args.bandwidth_mbps else None,
+        error_rate=args.error_rate
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Google Drive v3 server with a synthetic Dataset tree.")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port (default: 8765)")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    drive = drive_from_args(args)
+    server = start_server(drive, args.host, args.port)
+    logging.info(
+        f"Fake Drive with {len(drive.files)} items ({drive.total_bytes / 1024 ** 2:.1f} MiB) "
+        f"on http://{args.host}:{server.server_address[1]}"
+    )
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
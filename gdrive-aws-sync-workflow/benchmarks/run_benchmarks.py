@@ -0,0 +1,220 @@
+"""
+Offline throughput benchmark for gdrive-s3-transfer.py.
+
+Starts the fake Drive server and a local S3 (moto's threaded server, or an
+existing endpoint such as the LocalStack container from docker-compose.yaml),
+then runs the transfer CLI once per concurrency setting in a fresh
+subprocess and reports files/s, MB/s and peak RSS.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import boto3
+
+from fake_drive_server import add_tree_arguments, drive_from_args, start_server
+
+TRANSFER_SCRIPT = Path(__file__).resolve().parent.parent / "gdrive-s3-transfer.py"
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def start_moto() -> str:
+    """Start moto's S3 server in-process and return its endpoint URL"""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit(
+            "moto is not installed: pip install 'moto[server]', "
+            "or pass --s3-endpoint http://localhost:4566 with LocalStack running"
+        )
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    return f"http://{host}:{port}"
+
+def read_peak_rss(pid: int) -> Optional[float]:
+    """Peak RSS in MiB of a running process, from /proc on Linux"""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def run_transfer(drive_url: str, s3_url: str, bucket: str, workers: int, mode: str,
+                 extra_args: List[str], workdir: Path) -> dict:
+    """Run one transfer in a subprocess and collect its report and peak RSS"""
+    workdir.mkdir(parents=True)
+    report_path = workdir / "report.json"
+    command = [
+        sys.executable, str(TRANSFER_SCRIPT),
+        "--drive-endpoint", drive_url,
+        "--s3-endpoint", s3_url,
+        "--download-workers", str(workers),
+        "--upload-workers", str(workers),
+        "--queue-size", str(workers * 4),
+        "--manifest", str(workdir / "manifest.db"),
+        "--journal", str(workdir / "journal.db"),
+        "--report", str(report_path),
+        # The fake server is local, so the API limiters must not be the bottleneck
+        "--drive-rate", "100000",
+        "--s3-rate", "100000",
+    ]
+    if mode == "streaming":
+        command.append("--streaming")
+    command += extra_args
+
+    env = dict(os.environ, BUCKET_NAME=bucket)
+    env.pop("SERVICE_ACCOUNT_FILE", None)
+    env.setdefault("Accesskey", "testing")
+    env.setdefault("Secretaccesskey", "testing")
+
+    started = time.perf_counter()
+    with open(workdir / "transfer.log", "wb") as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        # Not ru_maxrss: a child inherits the high-water mark of this process, which hosts moto
+        peak_rss = 0.0
+        while process.poll() is None:
+            peak_rss = max(peak_rss, read_peak_rss(process.pid) or 0.0)
+            time.sleep(0.1)
+    wall = time.perf_counter() - started
+    exit_code = process.returncode
+
+    report = json.loads(report_path.read_text()) if report_path.exists() else {}
+    elapsed = report.get('elapsed_seconds') or wall
+    uploaded = report.get('files', {}).get('uploaded_files', 0)
+    upload_bytes = report.get('stages', {}).get('upload', {}).get('bytes', 0)
+    return {
+        'mode': mode,
+        'workers': workers,
+        'exit_code': exit_code,
+        'files': uploaded,
+        'failed': report.get('files', {}).get('failed_files'),
+        'bytes': upload_bytes,
+        'elapsed_seconds': round(elapsed, 3),
+        'wall_seconds': round(wall, 3),
+        'files_per_second': round(uploaded / elapsed, 2),
+        'mb_per_second': round(upload_bytes / elapsed / 1024 ** 2, 2),
+        # Sampled every 100 ms while the transfer runs
+        'peak_rss_mb': round(peak_rss, 1),
+        'bottleneck': report.get('bottleneck'),
+    }
+
+def compare(results: List[dict], baseline_path: str, max_regression: float) -> List[str]:
+    """Return the configurations whose files/s fell more than ``max_regression`` below the baseline"""
+    baseline: Dict[str, dict] = {
+        f"{run['mode']}/{run['workers']}": run
+        for run in json.loads(Path(baseline_path).read_text())['results']
+    }
+    regressions = []
+    for run in results:
+        key = f"{run['mode']}/{run['workers']}"
+        previous = baseline.get(key)
+        if not previous or not previous['files_per_second']:
+            continue
+        change = run['files_per_second'] / previous['files_per_second'] - 1
+        if change < -max_regression:
+            regressions.append(
+                f"{key}: {run['files_per_second']} files/s vs {previous['files_per_second']} ({change:+.0%})"
+            )
+    return regressions
+
+def print_table(results: List[dict]) -> None:
+    print(f"{'mode':<10} {'workers':>7} {'files':>6} {'files/s':>9} {'MB/s':>8} {'RSS MB':>8} {'busiest':>10}")
+    for run in results:
+        print(
+            f"{run['mode']:<10} {run['workers']:>7} {run['files']:>6} {run['files_per_second']:>9} "
+            f"{run['mb_per_second']:>8} {run['peak_rss_mb']:>8} {str(run['bottleneck']):>10}"
+        )
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark gdrive-s3-transfer.py against a fake Drive and local S3.")
+    parser.add_argument("--workers", default="1,4,8",
+                        help="Comma-separated download/upload worker counts to run (default: 1,4,8)")
+    parser.add_argument("--modes", default="temp,streaming",
+                        help="Comma-separated transfer modes: temp, streaming (default: both)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per configuration (default: 1)")
+    parser.add_argument("--s3-endpoint", default=None,
+                        help="Use this S3 endpoint (e.g. LocalStack on http://localhost:4566) instead of moto")
+    parser.add_argument("--output", default="benchmark-results.json", help="Results file (default: benchmark-results.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare files/s against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed files/s drop versus --baseline before failing (default: 0.25)")
+    parser.add_argument("--transfer-arg", action="append", default=[],
+                        help="Extra argument passed to every transfer run (repeatable)")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+
+    drive = drive_from_args(args)
+    drive_server = start_server(drive)
+    drive_url = f"http://127.0.0.1:{drive_server.server_address[1]}"
+    s3_url = args.s3_endpoint or start_moto()
+    logging.info(
+        f"Fake Drive: {len(drive.files)} items, {drive.total_bytes / 1024 ** 2:.1f} MiB at {drive_url}; S3 at {s3_url}"
+    )
+
+    s3_client = boto3.client(
+        's3', endpoint_url=s3_url, region_name="us-east-1",
+        aws_access_key_id=os.getenv('Accesskey', 'testing'),
+        aws_secret_access_key=os.getenv('Secretaccesskey', 'testing')
+    )
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="transfer-bench-") as tmp:
+        for mode in args.modes.split(','):
+            for workers in (int(value) for value in args.workers.split(',')):
+                for attempt in range(args.repeat):
+                    # A fresh bucket per run, so nothing is skipped as already transferred
+                    bucket = f"bench-{mode}-{workers}-{attempt}-{int(time.time())}"
+                    s3_client.create_bucket(Bucket=bucket)
+                    run = run_transfer(
+                        drive_url, s3_url, bucket, workers, mode, args.transfer_arg,
+                        Path(tmp) / bucket
+                    )
+                    logging.info(
+                        f"{mode} x{workers}: {run['files_per_second']} files/s, "
+                        f"{run['mb_per_second']} MB/s, peak RSS {run['peak_rss_mb']} MB"
+                    )
+                    results.append(run)
+
+    print_table(results)
+    output = {
+        'tree': {
+            'classes': args.classes,
+            'files_per_class': args.files_per_class,
+            'subfolders': args.subfolders,
+            'sizes': args.sizes,
+            'seed': args.seed,
+            'total_bytes': drive.total_bytes,
+            'latency_ms': args.latency_ms,
+            'media_latency_ms': args.media_latency_ms,
+        },
+        'results': results,
+    }
+    Path(args.output).write_text(json.dumps(output, indent=2))
+    logging.info(f"Wrote {args.output}")
+
+    failed = [run for run in results if run['exit_code'] != 0]
+    for run in failed:
+        logging.error(f"Transfer failed: {run['mode']} x{run['workers']} (exit code {run['exit_code']})")
+
+    regressions = compare(results, args.baseline, args.max_regression) if args.baseline else []
+    for regression in regressions:
+        logging.error(f"Throughput regression: {regression}")
+
+    return 1 if failed or regressions else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,333 @@
+"""
+Load test for general-api-service.py.
+
+Starts the fake Drive server, runs the API in a subprocess pointed at it
+(``DRIVE_ENDPOINT_URL``), then sends a weighted mix of ``/folders``,
+``/folders/{id}/contents``, ``/folders/{id}/path`` and ``/transfer`` calls
+from a growing number of concurrent clients. Each client sends its next
+request as soon as the previous one returns. For every concurrency level
+it reports p50/p95/p99 latency, throughput and error rate, overall and
+per endpoint.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from fake_drive_server import DATASET_ID, FOLDER_MIME_TYPE, FakeDrive, add_tree_arguments, drive_from_args, start_server
+
+API_SCRIPT = Path(__file__).resolve().parent.parent / "general-api-service.py"
+ENDPOINTS = ("folders", "contents", "path", "transfer")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse ``folders=40,contents=30,path=20,transfer=10`` into endpoint weights"""
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint in mix: {name} (expected one of {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(samples: List[Tuple[str, float, int]], seconds: float) -> dict:
+    """Latency percentiles, throughput and error rate of ``(endpoint, latency, status)`` samples"""
+    latencies = sorted(latency for _, latency, _ in samples)
+    errors = sum(1 for _, _, status in samples if status == 0 or status >= 400)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else None,
+        'requests_per_second': round(len(samples) / seconds, 2),
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+    }
+
+class RequestMix:
+    """Pick the next request of a client: an endpoint by weight, and a random target in the fake tree"""
+
+    def __init__(self, drive: FakeDrive, mix: Dict[str, float], page_size: Optional[int], seed: int):
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.page_size = page_size
+        self.classes = drive.children.get(DATASET_ID, [])
+        self.folders = [file.id for file in drive.files.values() if file.mime_type == FOLDER_MIME_TYPE]
+        self.files = [file.id for file in drive.files.values() if file.mime_type != FOLDER_MIME_TYPE]
+        self.class_names = [drive.files[class_id].name for class_id in self.classes]
+        self._local = threading.local()
+        self._seed = seed
+
+    def _rng(self) -> random.Random:
+        rng = getattr(self._local, 'rng', None)
+        if rng is None:
+            rng = self._local.rng = random.Random(f"{self._seed}:{threading.get_ident()}")
+        return rng
+
+    def next(self) -> Tuple[str, str, str, dict]:
+        """Return ``(endpoint, method, path, params)``"""
+        rng = self._rng()
+        name = rng.choices(self.names, weights=self.weights)[0]
+        paged = {'page_size': self.page_size} if self.page_size else {}
+        if name == "folders":
+            # Half browse the Dataset folder, half search by name
+            if rng.random() < 0.5:
+                return name, "GET", "/folders", dict(paged, parent_id=DATASET_ID)
+            return name, "GET", "/folders", dict(paged, query=rng.choice(self.class_names))
+        if name == "contents":
+            return name, "GET", f"/folders/{rng.choice(self.folders)}/contents", paged
+        if name == "path":
+            return name, "GET", f"/folders/{rng.choice(self.files or self.folders)}/path", {}
+        return name, "POST", "/transfer", {'folder_id': rng.choice(self.classes)}
+
+def run_stage(api_url: str, mix: RequestMix, concurrency: int, duration: float,
+              warmup: float, timeout: float) -> List[Tuple[str, float, int]]:
+    """
+    Run ``concurrency`` closed-loop clients for ``warmup + duration`` seconds.
+
+    Returns:
+        List[Tuple[str, float, int]]: ``(endpoint, seconds, status)`` of the requests
+            started after the warm-up; status 0 means no response (timeout, refused)
+    """
+    samples: List[Tuple[str, float, int]] = []
+    samples_lock = threading.Lock()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def client() -> None:
+        session = requests.Session()
+        own = []
+        while True:
+            begin = time.perf_counter()
+            if begin >= stop_at:
+                break
+            endpoint, method, path, params = mix.next()
+            try:
+                response = session.request(method, api_url + path, params=params, timeout=timeout)
+                status = response.status_code
+            except requests.RequestException:
+                status = 0
+            if begin >= measure_from:
+                own.append((endpoint, time.perf_counter() - begin, status))
+        session.close()
+        with samples_lock:
+            samples.extend(own)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="client") as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    return samples
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_api(drive_url: str, workdir: Path, api_env: Dict[str, str], startup_timeout: float = 30.0
+              ) -> Tuple[subprocess.Popen, str]:
+    """Run general-api-service.py against the fake Drive and wait until it answers"""
+    port = free_port()
+    env = dict(os.environ)
+    env.pop("SERVICE_ACCOUNT_FILE", None)
+    env.update({
+        'HOST': "127.0.0.1",
+        'PORT': str(port),
+        'DRIVE_ENDPOINT_URL': drive_url,
+        'JOB_DB': str(workdir / "jobs.db"),
+        'JOB_WORKDIR': str(workdir / "jobs"),
+        # Jobs are only queued: /transfer is measured, not the transfers themselves
+        'JOB_WORKERS': "0",
+        # The fake server is local, so the Drive limiter must not be the bottleneck
+        'DRIVE_RATE_LIMIT': "100000",
+        'DRIVE_MAX_CONCURRENCY': "64",
+    })
+    env.update(api_env)
+
+    with open(workdir / "api.log", "wb") as log:
+        process = subprocess.Popen([sys.executable, str(API_SCRIPT)], cwd=workdir, env=env,
+                                   stdout=log, stderr=subprocess.STDOUT)
+    api_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if requests.get(f"{api_url}/", timeout=1).ok:
+                return process, api_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    tail = (workdir / "api.log").read_text(errors="replace")[-2000:]
+    raise SystemExit(f"API did not start within {startup_timeout:.0f}s:\n{tail}")
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak RSS of a running process, from /proc on Linux"""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def compare(stages: List[dict], baseline_path: str, max_regression: float) -> List[str]:
+    """Return the concurrency levels whose throughput fell, or p95 rose, more than ``max_regression``"""
+    baseline = {stage['concurrency']: stage['overall'] for stage in json.loads(Path(baseline_path).read_text())['stages']}
+    regressions = []
+    for stage in stages:
+        previous = baseline.get(stage['concurrency'])
+        current = stage['overall']
+        if not previous:
+            continue
+        if previous['requests_per_second'] and \
+                current['requests_per_second'] < previous['requests_per_second'] * (1 - max_regression):
+            regressions.append(
+                f"x{stage['concurrency']}: {current['requests_per_second']} req/s "
+                f"vs {previous['requests_per_second']}"
+            )
+        if previous['p95_ms'] and current['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            regressions.append(f"x{stage['concurrency']}: p95 {current['p95_ms']} ms vs {previous['p95_ms']} ms")
+    return regressions
+
+def print_table(stages: List[dict]) -> None:
+    print(f"{'clients':>7} {'endpoint':<9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for stage in stages:
+        rows = [("all", stage['overall'])] + list(stage['endpoints'].items())
+        for name, row in rows:
+            print(
+                f"{stage['concurrency']:>7} {name:<9} {row['requests_per_second']:>9} {str(row['p50_ms']):>9} "
+                f"{str(row['p95_ms']):>9} {str(row['p99_ms']):>9} {row['error_rate'] or 0:>7.2%}"
+            )
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test general-api-service.py against a fake Drive.")
+    parser.add_argument("--concurrency", default="1,8,32,64",
+                        help="Comma-separated concurrent client counts, one stage each (default: 1,8,32,64)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per stage (default: 20)")
+    parser.add_argument("--warmup", type=float, default=2.0,
+                        help="Seconds at the start of each stage that are not measured (default: 2)")
+    parser.add_argument("--mix", default="folders=40,contents=30,path=20,transfer=10",
+                        help="Endpoint weights (default: folders=40,contents=30,path=20,transfer=10)")
+    parser.add_argument("--page-size", type=int, default=None,
+                        help="Request listings one page of this size instead of whole")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Client timeout per request (default: 30)")
+    parser.add_argument("--api-env", action="append", default=[],
+                        help="KEY=VALUE environment for the API (repeatable), e.g. DRIVE_CACHE_TTL=0 or DRIVE_WORKERS=16")
+    parser.add_argument("--output", default="load-test-results.json",
+                        help="Results file (default: load-test-results.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed drop in req/s or rise in p95 versus --baseline before failing (default: 0.25)")
+    parser.add_argument("--max-error-rate", type=float, default=None,
+                        help="Fail if any stage's error rate is above this share")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+
+    mix_weights = parse_mix(args.mix)
+    api_env = dict(item.split('=', 1) for item in args.api_env)
+    drive = drive_from_args(args)
+    drive_server = start_server(drive)
+    drive_url = f"http://127.0.0.1:{drive_server.server_address[1]}"
+    logging.info(f"Fake Drive: {len(drive.files)} items at {drive_url}, {args.latency_ms:.0f} ms per call")
+    mix = RequestMix(drive, mix_weights, args.page_size, args.seed)
+
+    stages = []
+    with tempfile.TemporaryDirectory(prefix="api-load-") as tmp:
+        process, api_url = start_api(drive_url, Path(tmp), api_env)
+        logging.info(f"API running at {api_url}")
+        try:
+            for concurrency in (int(value) for value in args.concurrency.split(',')):
+                samples = run_stage(api_url, mix, concurrency, args.duration, args.warmup, args.timeout)
+                by_endpoint: Dict[str, List[Tuple[str, float, int]]] = {}
+                statuses: Dict[str, int] = {}
+                for sample in samples:
+                    by_endpoint.setdefault(sample[0], []).append(sample)
+                    statuses[str(sample[2])] = statuses.get(str(sample[2]), 0) + 1
+                stage = {
+                    'concurrency': concurrency,
+                    'overall': summarize(samples, args.duration),
+                    'endpoints': {
+                        name: summarize(by_endpoint[name], args.duration)
+                        for name in ENDPOINTS if name in by_endpoint
+                    },
+                    'status_codes': dict(sorted(statuses.items())),
+                    'api_peak_rss_mb': peak_rss_mb(process.pid),
+                }
+                overall = stage['overall']
+                logging.info(
+                    f"x{concurrency}: {overall['requests_per_second']} req/s, p50 {overall['p50_ms']} ms, "
+                    f"p95 {overall['p95_ms']} ms, p99 {overall['p99_ms']} ms, errors {overall['error_rate'] or 0:.2%}"
+                )
+                stages.append(stage)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print_table(stages)
+    output = {
+        'tree': {
+            'classes': args.classes,
+            'files_per_class': args.files_per_class,
+            'subfolders': args.subfolders,
+            'seed': args.seed,
+            'latency_ms': args.latency_ms,
+            'error_rate': args.error_rate,
+        },
+        'mix': mix_weights,
+        'page_size': args.page_size,
+        'duration_seconds': args.duration,
+        'api_env': api_env,
+        'stages': stages,
+    }
+    Path(args.output).write_text(json.dumps(output, indent=2))
+    logging.info(f"Wrote {args.output}")
+
+    failed = []
+    if args.max_error_rate is not None:
+        failed = [stage for stage in stages if (stage['overall']['error_rate'] or 0) > args.max_error_rate]
+    for stage in failed:
+        logging.error(f"Error rate {stage['overall']['error_rate']:.2%} at x{stage['concurrency']}")
+
+    regressions = compare(stages, args.baseline, args.max_regression) if args.baseline else []
+    for regression in regressions:
+        logging.error(f"Regression: {regression}")
+
+    return 1 if failed or regressions else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,154 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Per-file states, in the order a file moves through them
+LISTED = "listed"
+DOWNLOADING = "downloading"
+UPLOADED = "uploaded"
+
+@dataclass
+class JournalEntry:
+    """Checkpointed progress of one file"""
+    drive_id: str
+    s3_key: str
+    state: str
+    md5: Optional[str] = None
+    size: Optional[int] = None
+    upload_id: Optional[str] = None
+    part_size: Optional[int] = None
+    # part number -> (etag, size) of parts S3 has acknowledged
+    parts: Dict[int, tuple] = field(default_factory=dict)
+
+    def completed_prefix(self) -> List[int]:
+        """Part numbers 1..k that are all complete; later parts must be resent"""
+        numbers = []
+        while len(numbers) + 1 in self.parts:
+            numbers.append(len(numbers) + 1)
+        return numbers
+
+class CheckpointJournal:
+    """
+    Write-ahead journal of per-file transfer progress.
+
+    Every state change is committed to SQLite (WAL mode) before the work it
+    describes continues, so a process killed at any point can be restarted
+    and pick up only the unfinished files, including multipart uploads that
+    already have some parts in S3. Safe to share between worker threads.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite journal (created if missing)
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                drive_id TEXT PRIMARY KEY,
+                s3_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                md5 TEXT,
+                size INTEGER,
+                upload_id TEXT,
+                part_size INTEGER,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS parts (
+                drive_id TEXT NOT NULL,
+                part_number INTEGER NOT NULL,
+                etag TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (drive_id, part_number)
+            );
+        """)
+        self._conn.commit()
+
+    def mark(self, drive_id: str, state: str, s3_key: Optional[str] = None,
+             md5: Optional[str] = None, size: Optional[int] = None) -> None:
+        """Move a file to ``state``, creating its entry if needed"""
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE files SET state = ?, s3_key = COALESCE(?, s3_key), md5 = COALESCE(?, md5), "
+                "size = COALESCE(?, size), updated_at = ? WHERE drive_id = ?",
+                (state, s3_key, md5, size, time.time(), drive_id)
+            ).rowcount
+            if not updated:
+                self._conn.execute(
+                    "INSERT INTO files (drive_id, s3_key, state, md5, size, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (drive_id, s3_key or "", state, md5, size, time.time())
+                )
+            self._conn.commit()
+
+    def start_multipart(self, drive_id: str, upload_id: str, part_size: int) -> None:
+        """Record a newly created multipart upload for a file"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET upload_id = ?, part_size = ?, updated_at = ? WHERE drive_id = ?",
+                (upload_id, part_size, time.time(), drive_id)
+            )
+            self._conn.execute("DELETE FROM parts WHERE drive_id = ?", (drive_id,))
+            self._conn.commit()
+
+    def record_part(self, drive_id: str, part_number: int, etag: str, size: int) -> None:
+        """Record a multipart part that S3 has acknowledged"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parts (drive_id, part_number, etag, size) VALUES (?, ?, ?, ?)",
+                (drive_id, part_number, etag, size)
+            )
+            self._conn.commit()
+
+    def reset(self, drive_id: str) -> None:
+        """Forget any multipart progress for a file (e.g. after it changed in Drive)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET upload_id = NULL, part_size = NULL, updated_at = ? WHERE drive_id = ?",
+                (time.time(), drive_id)
+            )
+            self._conn.execute("DELETE FROM parts WHERE drive_id = ?", (drive_id,))
+            self._conn.commit()
+
+    def get(self, drive_id: str) -> Optional[JournalEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT drive_id, s3_key, state, md5, size, upload_id, part_size "
+                "FROM files WHERE drive_id = ?",
+                (drive_id,)
+            ).fetchone()
+            if not row:
+                return None
+            parts = {
+                number: (etag, size)
+                for number, etag, size in self._conn.execute(
+                    "SELECT part_number, etag, size FROM parts WHERE drive_id = ?", (drive_id,)
+                )
+            }
+        return JournalEntry(*row, parts=parts)
+
+    def unfinished_ids(self) -> List[str]:
+        """Drive ids of files that were listed but not yet uploaded"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT drive_id FROM files WHERE state != ?", (UPLOADED,)
+            )]
+
+    def prune_uploaded(self) -> None:
+        """Drop entries for finished files once a run completes"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM parts WHERE drive_id IN (SELECT drive_id FROM files WHERE state = ?)",
+                (UPLOADED,)
+            )
+            self._conn.execute("DELETE FROM files WHERE state = ?", (UPLOADED,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,202 @@
+import logging
+import random
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from throttle import is_retryable_error
+
+# Google's batch endpoint accepts at most 100 sub-requests per call
+MAX_BATCH_SIZE = 100
+
+def _execute(request):
+    return request.execute()
+
+class FolderListingError(Exception):
+    """Some folders could not be listed, so their files are missing from a listing"""
+
+    def __init__(self, errors: Dict[str, Exception]):
+        self.errors = errors
+        super().__init__(
+            f"Could not list {len(errors)} folder(s): "
+            + "; ".join(f"{folder_id}: {error}" for folder_id, error in list(errors.items())[:5])
+        )
+
+def execute_batch(service, requests: Dict[str, object], execute: Callable = _execute,
+                  batch_size: int = MAX_BATCH_SIZE, max_rounds: int = 5) -> Dict[str, Tuple[Optional[dict], Optional[Exception]]]:
+    """
+    Run many Drive requests as Google API batch requests.
+
+    Sub-requests that fail with a throttle or transient error are sent again
+    in a later batch (with jittered backoff) rather than failing immediately.
+
+    Args:
+        service: Drive v3 service
+        requests (Dict[str, HttpRequest]): Requests keyed by a caller-chosen id
+        execute (Callable): Runs the batch, e.g. ``ApiThrottle.execute``
+        batch_size (int): Sub-requests per HTTP call (at most 100)
+        max_rounds (int): How many times failed sub-requests are retried
+
+    Returns:
+        Dict[str, Tuple[Optional[dict], Optional[Exception]]]: ``(response, error)`` per key
+    """
+    results = {}
+    pending = dict(requests)
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+
+    for round_number in range(max_rounds + 1):
+        retry = {}
+        keys = list(pending)
+        for start in range(0, len(keys), batch_size):
+            chunk = keys[start:start + batch_size]
+
+            def callback(request_id, response, exception, chunk=chunk):
+                key = chunk[int(request_id)]
+                if exception is not None and is_retryable_error(exception) and round_number < max_rounds:
+                    retry[key] = pending[key]
+                else:
+                    results[key] = (response, exception)
+
+            batch = service.new_batch_http_request(callback=callback)
+            for index, key in enumerate(chunk):
+                batch.add(pending[key], request_id=str(index))
+            execute(batch)
+
+        if not retry:
+            break
+        delay = random.uniform(0, min(30.0, 0.5 * 2 ** round_number))
+        logging.warning(f"Retrying {len(retry)} throttled batch sub-requests in {delay:.2f}s")
+        time.sleep(delay)
+        pending = retry
+
+    return results
+
+def resolve_ancestors(service, file_ids: Iterable[str], known: Optional[Dict[str, dict]] = None,
+                      execute: Callable = _execute, stop_at: Optional[str] = None,
+                      cached: Optional[Callable[[str], Optional[dict]]] = None) -> Dict[str, dict]:
+    """
+    Fetch the ancestor chains of many files, one batch per tree level.
+
+    All unknown ids at the same depth are fetched together, so N chains of
+    depth D cost about D batch calls instead of N * D ``files.get`` calls.
+
+    Args:
+        service: Drive v3 service
+        file_ids (Iterable[str]): Files/folders whose ancestors are needed
+        known (Optional[Dict[str, dict]]): Already-fetched ``{id: {id, name, parents}}``;
+            updated in place and returned
+        execute (Callable): Runs each batch
+        stop_at (Optional[str]): Do not walk above this folder id
+        cached (Optional[Callable]): Returns a node's metadata from a cache, or None;
+            cached nodes are followed up their chains without fetching
+
+    Returns:
+        Dict[str, dict]: ``known`` extended with every fetched node (missing ids map to ``{}``)
+    """
+    known = {} if known is None else known
+
+    def unknown(ids: Iterable[str]) -> Set[str]:
+        """Ids that still have to be fetched, after following cached nodes"""
+        missing = set()
+        stack = list(ids)
+        while stack:
+            file_id = stack.pop()
+            if not file_id or file_id in known or file_id == stop_at:
+                continue
+            node = cached(file_id) if cached is not None else None
+            if node is None:
+                missing.add(file_id)
+                continue
+            known[file_id] = node
+            stack.extend(node.get('parents') or [])
+        return missing
+
+    frontier = unknown(file_ids)
+
+    while frontier:
+        responses = execute_batch(service, {
+            file_id: service.files().get(fileId=file_id, fields="id, name, parents")
+            for file_id in frontier
+        }, execute=execute)
+
+        parent_ids = []
+        for file_id, (response, error) in responses.items():
+            if error is not None:
+                if getattr(getattr(error, 'resp', None), 'status', None) != 404:
+                    logging.error(f"Error fetching metadata for {file_id}: {str(error)}")
+                known[file_id] = {}
+                continue
+            known[file_id] = response
+            parent_ids.extend(response.get('parents') or [])
+        frontier = unknown(parent_ids)
+
+    return known
+
+def build_path(file_id: str, known: Dict[str, dict], stop_at: Optional[str] = None) -> List[Dict[str, str]]:
+    """Turn fetched ancestor metadata into a root-first ``[{id, name}, ...]`` path"""
+    path = []
+    current_id = file_id
+    while current_id and current_id != stop_at and known.get(current_id):
+        node = known[current_id]
+        path.insert(0, {"id": node["id"], "name": node["name"]})
+        parents = node.get("parents")
+        current_id = parents[0] if parents else None
+    return path
+
+def list_children_batch(service, folder_ids: Iterable[str], fields: str, extra_query: str = "",
+                        page_size: int = 1000, batch_size: int = 20,
+                        execute: Callable = _execute) -> Iterator[Tuple[str, dict]]:
+    """
+    List the children of many folders, grouping their page requests into batches.
+
+    Every round sends the next page of up to ``batch_size`` folders in one
+    HTTP call and yields ``(folder_id, child)`` pairs as soon as that round
+    returns. Folders with more pages are carried into later rounds.
+    A folder that still fails after ``execute_batch``'s retries does not
+    stop the others. ``FolderListingError`` is raised once every other
+    folder has been listed, so the caller never mistakes a partial listing
+    for a complete one.
+
+    Args:
+        service: Drive v3 service
+        folder_ids (Iterable[str]): Folders to list
+        fields (str): ``files(...)`` field mask
+        extra_query (str): Additional ``q`` clause
+        page_size (int): Children per page
+        batch_size (int): Folders per batch; bounds how many pages are held in memory
+        execute (Callable): Runs each batch
+
+    Raises:
+        FolderListingError: After the listing, if any folder failed
+    """
+    pending: Dict[str, Optional[str]] = {folder_id: None for folder_id in folder_ids}
+    failed: Dict[str, Exception] = {}
+
+    while pending:
+        chunk = dict(list(pending.items())[:batch_size])
+        requests = {}
+        for folder_id, page_token in chunk.items():
+            query = f"'{folder_id}' in parents and trashed = false"
+            if extra_query:
+                query += f" and {extra_query}"
+            requests[folder_id] = service.files().list(
+                q=query,
+                pageSize=page_size,
+                fields=f"nextPageToken, {fields}",
+                pageToken=page_token
+            )
+
+        responses = execute_batch(service, requests, execute=execute, batch_size=batch_size)
+        for folder_id in chunk:
+            del pending[folder_id]
+            response, error = responses.get(folder_id, (None, None))
+            if error is not None:
+                logging.error(f"Error listing folder {folder_id}: {str(error)}")
+                failed[folder_id] = error
+                continue
+            for child in (response or {}).get('files', []):
+                yield folder_id, child
+            if (response or {}).get('nextPageToken'):
+                pending[folder_id] = response['nextPageToken']
+
+    if failed:
+        raise FolderListingError(failed)
@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Deadline of the Drive call running in the current pool thread
+_deadline: contextvars.ContextVar = contextvars.ContextVar("drive_call_deadline", default=None)
+
+class DriveCallTimeout(Exception):
+    """A Drive call ran past its timeout"""
+
+class DriveBusy(Exception):
+    """Too many Drive calls are queued to take another one"""
+
+def check_deadline() -> None:
+    """
+    Stop a Drive call that has run past its timeout.
+
+    Called between pages of long listings, so a call whose caller already
+    gave up releases its thread instead of paginating to the end.
+
+    Raises:
+        DriveCallTimeout: If the call running in this thread is past its deadline
+    """
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() > deadline:
+        raise DriveCallTimeout("Drive call exceeded its timeout")
+
+class DriveExecutor:
+    """
+    Run blocking ``DriveService`` calls from async endpoints without blocking the event loop.
+
+    Calls run on a dedicated, bounded thread pool. A call first waits on the
+    event loop for a free thread, so the pool's own queue never grows; if
+    ``max_waiting`` calls are already waiting, or no thread frees up within
+    ``queue_timeout``, it fails with ``DriveBusy``. A call that runs longer
+    than ``timeout`` fails with ``DriveCallTimeout``. Its thread stays taken
+    until the call notices the deadline (see ``check_deadline``) or
+    finishes, so timed-out calls cannot pile up behind the limit.
+    """
+
+    def __init__(self, max_workers: int = 8, max_waiting: int = 64,
+                 timeout: float = 30.0, queue_timeout: float = 5.0):
+        """
+        Args:
+            max_workers (int): Drive calls running at once
+            max_waiting (int): Calls allowed to wait for a thread before new ones are rejected
+            timeout (float): Seconds a call may run
+            queue_timeout (float): Seconds a call may wait for a thread
+        """
+        self.max_workers = max_workers
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="drive")
+        # Created on first use, inside the running event loop
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.running = 0
+
+    async def run(self, func: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """
+        Call ``func(*args)`` on the pool and await its result.
+
+        Args:
+            func (Callable): Blocking function, e.g. a ``DriveService`` method
+            timeout (Optional[float]): Overrides the executor's timeout for this call
+
+        Raises:
+            DriveBusy: If no thread became free in time
+            DriveCallTimeout: If the call ran past its timeout
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if not self._slots.locked():
+            await self._slots.acquire()
+        else:
+            if self.waiting >= self.max_waiting:
+                raise DriveBusy(f"{self.waiting} Drive calls already waiting")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise DriveBusy(f"No Drive worker free within {self.queue_timeout:.0f}s")
+            finally:
+                self.waiting -= 1
+
+        timeout = self.timeout if timeout is None else timeout
+        context = contextvars.copy_context()
+        context.run(_deadline.set, time.monotonic() + timeout)
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, context.run, func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        self.running += 1
+        # The thread is only given back when the call really ends
+        future.add_done_callback(self._release)
+        try:
+            # shield: a timed-out or cancelled request must not cancel the bookkeeping above
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            raise DriveCallTimeout(f"Drive call exceeded {timeout:.0f}s")
+
+    def _release(self, future: asyncio.Future) -> None:
+        self.running -= 1
+        self._slots.release()
+        if not future.cancelled():
+            # Mark the error of a call nobody awaits any more as retrieved
+            future.exception()
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.max_workers,
+            'running': self.running,
+            'waiting': self.waiting,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
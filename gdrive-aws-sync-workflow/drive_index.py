@@ -0,0 +1,338 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from change_cursor import ChangeFeed, CursorExpiredError, get_start_page_token
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+INDEX_FIELDS = "id, name, mimeType, parents, size, modifiedTime"
+
+def _execute(request):
+    return request.execute()
+
+def _match_expression(query: str) -> Optional[str]:
+    """FTS5 query matching names with words starting with each word of ``query``"""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+class DriveIndex:
+    """
+    Local SQLite mirror of Drive file and folder metadata.
+
+    Names are indexed with FTS5, so name searches, folder listings and
+    path lookups are answered locally instead of by Drive. The index is
+    only ``ready`` once a full crawl has finished; until then callers
+    should ask Drive. Safe to share between threads.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database (created if missing)
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                size INTEGER,
+                modified_time TEXT
+            );
+            CREATE TABLE IF NOT EXISTS parents (
+                file_id TEXT NOT NULL,
+                parent_id TEXT NOT NULL,
+                PRIMARY KEY (file_id, parent_id)
+            );
+            CREATE INDEX IF NOT EXISTS parents_parent ON parents (parent_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(name, id UNINDEXED, tokenize='unicode61');
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._conn.commit()
+
+    def _state(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: Optional[str]) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._state('complete') == '1'
+
+    @property
+    def page_token(self) -> Optional[str]:
+        with self._lock:
+            return self._state('page_token')
+
+    def _delete(self, file_id: str) -> None:
+        self._conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        self._conn.execute("DELETE FROM parents WHERE file_id = ?", (file_id,))
+        self._conn.execute("DELETE FROM names WHERE id = ?", (file_id,))
+
+    def _upsert(self, file: dict) -> None:
+        self._delete(file['id'])
+        size = file.get('size')
+        self._conn.execute(
+            "INSERT INTO files (id, name, mime_type, size, modified_time) VALUES (?, ?, ?, ?, ?)",
+            (file['id'], file['name'], file['mimeType'], int(size) if size is not None else None,
+             file.get('modifiedTime'))
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO parents (file_id, parent_id) VALUES (?, ?)",
+            [(file['id'], parent_id) for parent_id in file.get('parents') or []]
+        )
+        self._conn.execute("INSERT INTO names (name, id) VALUES (?, ?)", (file['name'], file['id']))
+
+    def add_files(self, files: List[dict]) -> None:
+        """Insert or replace many files in one transaction"""
+        with self._lock:
+            for file in files:
+                self._upsert(file)
+            self._conn.commit()
+
+    def apply_changes(self, changes: List[dict], page_token: Optional[str]) -> None:
+        """Apply entries of the Drive changes feed and store the cursor, in one transaction"""
+        with self._lock:
+            for change in changes:
+                file = change.get('file')
+                if change.get('removed') or not file or file.get('trashed'):
+                    self._delete(change['fileId'])
+                else:
+                    self._upsert(file)
+            if page_token:
+                self._set_state('page_token', page_token)
+            self._conn.commit()
+
+    def reset(self, page_token: str) -> None:
+        """Empty the index before a full crawl; changes are read from ``page_token`` afterwards"""
+        with self._lock:
+            self._conn.executescript("DELETE FROM files; DELETE FROM parents; DELETE FROM names;")
+            self._set_state('complete', '0')
+            self._set_state('page_token', page_token)
+            self._conn.commit()
+
+    def mark_complete(self) -> None:
+        with self._lock:
+            self._set_state('complete', '1')
+            self._set_state('crawled_at', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+            self._conn.commit()
+
+    def _rows(self, query: str, params: tuple) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {
+                'id': row[0],
+                'name': row[1],
+                'mimeType': row[2],
+                'size': str(row[3]) if row[3] is not None else None,
+                'modifiedTime': row[4],
+            }
+            for row in rows
+        ]
+
+    def search(self, query: Optional[str] = None, parent_id: Optional[str] = None, folders_only: bool = True,
+               offset: int = 0, limit: int = -1) -> List[dict]:
+        """
+        Find files by name, like Drive's ``name contains`` (word-prefix matching).
+
+        Args:
+            query (Optional[str]): Words the name must contain; None matches every name
+            parent_id (Optional[str]): Only children of this folder
+            folders_only (bool): Only folders
+            offset (int): Results to skip
+            limit (int): Most results to return (-1 for all)
+        """
+        clauses, params = [], []
+        if query:
+            expression = _match_expression(query)
+            if expression:
+                clauses.append("f.id IN (SELECT id FROM names WHERE names MATCH ?)")
+                params.append(expression)
+            else:
+                clauses.append("instr(lower(f.name), lower(?)) > 0")
+                params.append(query)
+        if parent_id:
+            clauses.append("f.id IN (SELECT file_id FROM parents WHERE parent_id = ?)")
+            params.append(parent_id)
+        if folders_only:
+            clauses.append("f.mime_type = ?")
+            params.append(FOLDER_MIME_TYPE)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._rows(
+            f"SELECT f.id, f.name, f.mime_type, f.size, f.modified_time FROM files f {where} "
+            f"ORDER BY f.name, f.id LIMIT ? OFFSET ?",
+            tuple(params) + (limit, offset)
+        )
+
+    def children(self, folder_id: str, mime_types: Optional[List[str]] = None,
+                 offset: int = 0, limit: int = -1) -> List[dict]:
+        """Children of a folder, optionally only those of the given MIME types"""
+        query = (
+            "SELECT f.id, f.name, f.mime_type, f.size, f.modified_time FROM parents p "
+            "JOIN files f ON f.id = p.file_id WHERE p.parent_id = ?"
+        )
+        params: tuple = (folder_id,)
+        if mime_types:
+            query += f" AND f.mime_type IN ({', '.join('?' for _ in mime_types)})"
+            params += tuple(mime_types)
+        return self._rows(query + " ORDER BY f.name, f.id LIMIT ? OFFSET ?", params + (limit, offset))
+
+    def path(self, file_id: str) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Root-first ``[{id, name}, ...]`` path of a file, like ``build_path``.
+
+        Returns:
+            Tuple[List[Dict[str, str]], Optional[str]]: The indexed part of the path, and the
+                id where the chain leaves the index (e.g. "My Drive", which is never
+                listed), or None if the chain ends in the index
+        """
+        path = []
+        current_id = file_id
+        with self._lock:
+            while current_id and all(node['id'] != current_id for node in path):
+                row = self._conn.execute("SELECT name FROM files WHERE id = ?", (current_id,)).fetchone()
+                if row is None:
+                    return path, current_id
+                path.insert(0, {'id': current_id, 'name': row[0]})
+                parent = self._conn.execute(
+                    "SELECT parent_id FROM parents WHERE file_id = ? ORDER BY rowid LIMIT 1", (current_id,)
+                ).fetchone()
+                current_id = parent[0] if parent else None
+        return path, None
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, folders = self._conn.execute(
+                "SELECT COUNT(*), SUM(mime_type = ?) FROM files", (FOLDER_MIME_TYPE,)
+            ).fetchone()
+            return {
+                'ready': self._state('complete') == '1',
+                'files': files,
+                'folders': folders or 0,
+                'crawled_at': self._state('crawled_at'),
+                'synced_at': self._state('synced_at'),
+            }
+
+    def mark_synced(self) -> None:
+        with self._lock:
+            self._set_state('synced_at', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class DriveIndexer:
+    """
+    Keep a ``DriveIndex`` in sync with Drive from a background thread.
+
+    The first run (or a run after the changes cursor expired) crawls every
+    non-trashed file with a flat ``files.list``. The cursor is taken
+    before the crawl, so nothing changed during it is missed. After
+    that, the Changes feed is applied every ``interval`` seconds.
+    """
+
+    def __init__(self, service, index: DriveIndex, interval: float = 30.0,
+                 execute: Callable = _execute, page_size: int = 1000):
+        """
+        Args:
+            service: Drive v3 service
+            index (DriveIndex): Index to fill
+            interval (float): Seconds between change polls
+            execute (Callable): Runs a request, e.g. ``ApiThrottle.execute``
+            page_size (int): Files per listing page during a crawl
+        """
+        self.service = service
+        self.index = index
+        self.interval = interval
+        self.execute = execute
+        self.page_size = page_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def crawl(self) -> int:
+        """Rebuild the index from a full listing; returns the number of files indexed"""
+        self.index.reset(get_start_page_token(self.service, execute=self.execute))
+        count = 0
+        page_token = None
+        while not self._stop.is_set():
+            response = self.execute(self.service.files().list(
+                q="trashed = false",
+                spaces='drive',
+                fields=f"nextPageToken, files({INDEX_FIELDS})",
+                pageToken=page_token,
+                pageSize=self.page_size
+            ))
+            files = response.get('files', [])
+            self.index.add_files(files)
+            count += len(files)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                self.index.mark_complete()
+                logging.info(f"Indexed {count} Drive files and folders")
+                break
+        return count
+
+    def sync(self) -> Tuple[int, bool]:
+        """
+        Apply the changes since the last sync.
+
+        Returns:
+            Tuple[int, bool]: Changes applied, and whether a full crawl ran instead
+        """
+        token = self.index.page_token
+        if token is None or not self.index.ready:
+            self.crawl()
+            return 0, True
+        feed = ChangeFeed(self.service, token, execute=self.execute)
+        changes: List[dict] = []
+        try:
+            for change in feed:
+                changes.append(change)
+                if len(changes) >= 1000:
+                    # Without a new cursor yet; it is stored with the last batch
+                    self.index.apply_changes(changes, None)
+                    changes = []
+        except CursorExpiredError:
+            logging.warning("Drive changes cursor expired, rebuilding the index")
+            self.crawl()
+            return 0, True
+        self.index.apply_changes(changes, feed.new_start_page_token)
+        self.index.mark_synced()
+        return len(changes), False
+
+    def _run(self) -> None:
+        while True:
+            try:
+                applied, crawled = self.sync()
+                if applied:
+                    logging.info(f"Applied {applied} Drive changes to the index")
+            except Exception as e:
+                logging.error(f"Error syncing the Drive index: {str(e)}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="drive-indexer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
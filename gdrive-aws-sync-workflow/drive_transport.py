@@ -0,0 +1,127 @@
+import threading
+from typing import Optional
+
+import google.auth.credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+
+class SharedCredentials(google.auth.credentials.Credentials):
+    """
+    Credentials wrapper whose token refresh is serialized across threads.
+
+    When many threads find the token expired at the same moment, one of
+    them refreshes it and the others reuse the new token instead of each
+    requesting their own.
+    """
+
+    def __init__(self, credentials):
+        # The base initializer is not called: token state lives in the wrapped credentials
+        self._credentials = credentials
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    @property
+    def token(self):
+        return self._credentials.token
+
+    @property
+    def expiry(self):
+        return self._credentials.expiry
+
+    @property
+    def valid(self) -> bool:
+        return self._credentials.valid
+
+    @property
+    def expired(self) -> bool:
+        return self._credentials.expired
+
+    def refresh(self, request) -> None:
+        stale_token = self._credentials.token
+        with self._lock:
+            # Another thread may have refreshed while this one waited for the lock
+            if self._credentials.valid and self._credentials.token != stale_token:
+                return
+            self._credentials.refresh(request)
+            self.refreshes += 1
+
+    def apply(self, headers, token=None) -> None:
+        self._credentials.apply(headers, token=token)
+
+    def before_request(self, request, method, url, headers) -> None:
+        if not self.valid:
+            self.refresh(request)
+        self.apply(headers)
+
+    def __getattr__(self, name):
+        if name == '_credentials':
+            raise AttributeError(name)
+        return getattr(self._credentials, name)
+
+class PooledHttp:
+    """
+    ``httplib2.Http`` stand-in that gives every thread its own keep-alive connection.
+
+    ``httplib2.Http`` is not thread-safe, so a googleapiclient service built on
+    one cannot be shared between threads. This object routes each call to an
+    ``AuthorizedHttp`` owned by the calling thread; the connections persist
+    across calls, and all of them share one ``SharedCredentials``. A service
+    built with ``http=PooledHttp(...)`` can therefore be used from any number
+    of threads, including its batch and media requests.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = SharedCredentials(credentials)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _http(self) -> AuthorizedHttp:
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            # build_http() applies googleapiclient's timeout and redirect settings
+            http = AuthorizedHttp(self.credentials, http=build_http())
+            self._local.http = http
+            with self._lock:
+                self._connections.append(http)
+        return http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    @property
+    def connections(self) -> int:
+        """Number of per-thread connections opened so far"""
+        with self._lock:
+            return len(self._connections)
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for http in connections:
+            http.close()
+
+    def __getattr__(self, name):
+        if name == '_local':
+            raise AttributeError(name)
+        return getattr(self._http(), name)
+
+def build_drive_service(credentials, discovery_service_url: Optional[str] = None):
+    """
+    Build a thread-safe Drive v3 service on a ``PooledHttp`` transport.
+
+    Args:
+        credentials: google-auth credentials
+        discovery_service_url (Optional[str]): Fetch the discovery document from
+            this URL (``{api}``/``{apiVersion}`` template) instead of using the
+            bundled one, e.g. to talk to a fake Drive server
+
+    Returns:
+        Resource: Drive service safe to share between threads
+    """
+    http = PooledHttp(credentials)
+    if discovery_service_url:
+        return build("drive", "v3", http=http, cache_discovery=False, static_discovery=False,
+                     discoveryServiceUrl=discovery_service_url)
+    return build("drive", "v3", http=http, cache_discovery=False)
@@ -1,24 +1,50 @@
 import os
 import io
+import json
 import time
+import queue
 import logging
+import argparse
+import threading
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
-from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+from dataclasses import asdict, dataclass, fields, replace
 
 # Google Drive imports
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
 
 # AWS imports
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Environment variables
 from dotenv import load_dotenv
 
+from drive_batch import FolderListingError, list_children_batch, resolve_ancestors
+from drive_transport import build_drive_service
+from heic_transform import HeicTransform
+from image_dedup import FLAG, SKIP, DuplicateMatch, ImageDeduplicator
+from checkpoint_journal import DOWNLOADING, LISTED, UPLOADED, CheckpointJournal
+from change_cursor import (
+    ChangeFeed, CursorExpiredError, LocalCursorStore, S3CursorStore, get_start_page_token
+)
+from s3_inventory import S3Inventory
+from sharding import merge_shard_stats, shard_for, write_shard_stats
+from tar_packer import DEFAULT_PACK_SIZE, TarShardPacker
+from s3_stream import DEFAULT_PART_SIZE, PartUpload, S3MultipartWriter
+from throttle import ApiThrottle, ThrottledClient
+from transfer_manifest import ManifestEntry, TransferManifest
+from transfer_plan import CHANGED, NEW, UNCHANGED, TransferPlan
+from transfer_metrics import MeteredWriter, ProgressReporter, TransferMetrics, start_metrics_server
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +52,21 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# Sentinel pushed through the pipeline queues to stop a worker
+_STOP = object()
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# Largest page Drive's files.list accepts
+MAX_PAGE_SIZE = 1000
+# Only the metadata the transfer needs; smaller responses page faster
+LIST_FIELDS = "files(id, name, mimeType, size, md5Checksum, modifiedTime)"
+# Past runs averaged for the duration estimate of a plan
+RECENT_RUNS = 5
+# Files at or above this size are fetched as parallel Range segments
+DEFAULT_LARGE_FILE_THRESHOLD = 64 * 1024 * 1024
+# Files at or below this size are transferred in memory by the small-file pool
+DEFAULT_SMALL_FILE_THRESHOLD = 1024 * 1024
+
 @dataclass
 class TransferStats:
     """Class to track file transfer statistics"""
@@ -34,6 +75,47 @@ class TransferStats:
     uploaded_files: int = 0
     skipped_files: int = 0
     failed_files: int = 0
+    duplicate_files: int = 0
+
+    def __post_init__(self):
+        # Not a dataclass field, so asdict()/repr() ignore it
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Atomically add ``amount`` to the counter called ``name``"""
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self) -> dict:
+        """Return a consistent copy of all counters"""
+        with self._lock:
+            return {f.name: getattr(self, f.name) for f in fields(self)}
+
+@dataclass
+class FileTask:
+    """A single Drive file scheduled for transfer"""
+    file_id: str
+    name: str
+    folder_name: str
+    s3_key: str
+    size: Optional[int] = None
+    md5: Optional[str] = None
+    modified_time: Optional[str] = None
+    # Key of the unconverted file when ``s3_key`` points at a transformed output
+    original_key: Optional[str] = None
+
+    @classmethod
+    def from_drive(cls, file: dict, folder_name: str, folder_path: str) -> "FileTask":
+        """Build a task from a Drive ``files`` resource"""
+        return cls(
+            file_id=file['id'],
+            name=file['name'],
+            folder_name=folder_name,
+            s3_key=f"{folder_path}/{file['name']}",
+            size=int(file['size']) if 'size' in file else None,
+            md5=file.get('md5Checksum'),
+            modified_time=file.get('modifiedTime')
+        )
 
 class DriveToS3Transfer:
     """Handles file transfer from Google Drive to AWS S3"""
@@ -45,59 +127,237 @@ class DriveToS3Transfer:
         "https://www.googleapis.com/auth/drive.metadata.readonly"
     ]
 
-    def __init__(self, service_account_file: str, bucket_name: str):
+    def __init__(self, service_account_file: Optional[str], bucket_name: str,
+                 download_workers: int = 4, upload_workers: int = 4, queue_size: int = 16,
+                 streaming: bool = False, part_size: int = DEFAULT_PART_SIZE,
+                 incremental: bool = False, state_file: str = ".drive_sync_state.json",
+                 state_s3_key: Optional[str] = None,
+                 manifest_path: str = ".transfer_manifest.db",
+                 journal_path: str = ".transfer_journal.db",
+                 drive_rate: float = 100.0, s3_rate: float = 500.0,
+                 shard_index: int = 0, shard_count: int = 1, stats_prefix: Optional[str] = None,
+                 metrics_port: Optional[int] = None, report_path: Optional[str] = None,
+                 drive_endpoint: Optional[str] = None, s3_endpoint: Optional[str] = None,
+                 large_file_threshold: int = DEFAULT_LARGE_FILE_THRESHOLD, range_workers: int = 4,
+                 small_file_threshold: int = DEFAULT_SMALL_FILE_THRESHOLD, small_file_workers: int = 16,
+                 pack: bool = False, pack_size: int = DEFAULT_PACK_SIZE, pack_prefix: str = "shards",
+                 heic_transform: Optional[HeicTransform] = None,
+                 image_dedup: Optional[ImageDeduplicator] = None,
+                 root_folder_id: Optional[str] = None, progress_path: Optional[str] = None):
         """
         Initialize the transfer service.
         
         Args:
-            service_account_file (str): Path to Google service account credentials file
+            service_account_file (Optional[str]): Path to Google service account credentials
+                file; may be omitted together with ``drive_endpoint`` to use
+                anonymous credentials against a local fake Drive
             bucket_name (str): AWS S3 bucket name
+            download_workers (int): Number of concurrent Drive download threads
+            upload_workers (int): Number of concurrent S3 upload threads
+            queue_size (int): Maximum number of files waiting between pipeline stages
+            streaming (bool): Stream Drive chunks straight into S3 multipart parts
+                instead of staging each file in ``temp_downloads/``
+            part_size (int): Multipart part size (and Drive chunk size) for streaming
+            incremental (bool): Only transfer files changed since the last run,
+                using a persisted Drive changes cursor
+            state_file (str): Local file holding the changes cursor
+            state_s3_key (Optional[str]): Store the cursor in this S3 key instead
+                of ``state_file`` (for pods without persistent disk)
+            manifest_path (str): SQLite manifest of transferred files
+            journal_path (str): SQLite checkpoint journal used to resume
+                interrupted runs
+            drive_rate (float): Maximum Drive API calls per second
+            s3_rate (float): Maximum S3 API calls per second
+            shard_index (int): Which shard of the files this process transfers
+            shard_count (int): Total number of shards (parallel pods)
+            stats_prefix (Optional[str]): S3 prefix where per-shard run stats are
+                written and merged into ``summary.json``
+            metrics_port (Optional[int]): Serve Prometheus metrics on this port
+            report_path (Optional[str]): Write a JSON run report with per-stage
+                throughput, latency, retries and queue depths to this file
+            drive_endpoint (Optional[str]): Base URL of a Drive-compatible server
+                (e.g. ``benchmarks/fake_drive_server.py``); its discovery document
+                is used so list, media and batch calls all go there
+            s3_endpoint (Optional[str]): S3 endpoint URL (LocalStack, moto)
+            large_file_threshold (int): Files of at least this many bytes are
+                downloaded as parallel HTTP Range segments
+            range_workers (int): Concurrent Range segments per large file, and
+                concurrent multipart parts per temp-file upload
+            small_file_threshold (int): Files of at most this many bytes skip
+                the temp file and multipart machinery (0 disables)
+            small_file_workers (int): Threads transferring small files, each
+                reusing its own keep-alive Drive and S3 connections
+            pack (bool): Pack files below ``large_file_threshold`` into tar shards
+                per class folder instead of uploading one object per file
+            pack_size (int): Target size of each tar shard
+            pack_prefix (str): S3 prefix for tar shards and their index sidecars
+            heic_transform (Optional[HeicTransform]): Convert HEIC files to JPEG in
+                memory and upload the JPEG (and optionally the original) instead
+            image_dedup (Optional[ImageDeduplicator]): Skip or flag images that are
+                near-duplicates of one already in their class folder
+            root_folder_id (Optional[str]): Transfer this folder instead of searching
+                Drive for the one named 'Dataset'
+            progress_path (Optional[str]): Rewrite a JSON progress snapshot (files
+                done, bytes/s, ETA, busiest stage) in this file every second
         """
         load_dotenv()
         
         self.bucket_name = bucket_name
         self.stats = TransferStats()
         self.temp_dir = Path("temp_downloads")
+        self.download_workers = max(1, download_workers)
+        self.upload_workers = max(1, upload_workers)
+        self.queue_size = max(1, queue_size)
+        self.streaming = streaming
+        self.part_size = part_size
+        self.large_file_threshold = large_file_threshold
+        self.range_workers = max(1, range_workers)
+        self.small_file_threshold = small_file_threshold
+        self.transform = heic_transform
+        self.dedup = image_dedup
+        self.root_folder_id = root_folder_id
+        self.progress = ProgressReporter(progress_path, self._progress_snapshot) if progress_path else None
+        self._phase = "starting"
+        self._listing_complete = False
+        # Bytes of the files queued for transfer (those not skipped)
+        self._queued_bytes = 0
+        # Packed, transformed and deduplicated files are fetched by the small-file pool as well
+        in_memory = small_file_threshold > 0 or pack or heic_transform or image_dedup
+        self.small_file_workers = max(1, small_file_workers) if in_memory else 0
+        # Segments of large files are fetched on this pool while a run is in progress
+        self._range_pool: Optional[ThreadPoolExecutor] = None
+        # Temp-file uploads send their multipart parts in parallel
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.range_workers,
+            use_threads=True
+        )
+        self.inventory: Optional[S3Inventory] = None
+        self.manifest = TransferManifest(manifest_path)
+        self.journal = CheckpointJournal(journal_path)
+        self.incremental = incremental
+        self.shard_count = max(1, shard_count)
+        self.shard_index = shard_index
+        if not 0 <= self.shard_index < self.shard_count:
+            raise ValueError(f"shard index {shard_index} is outside 0..{self.shard_count - 1}")
+        self.stats_prefix = stats_prefix
+        # Drive folder id -> path relative to the Dataset folder
+        self._folder_paths = {}
+        # Drive id -> {id, name, parents} fetched while resolving ancestors
+        self._drive_nodes = {}
+        
+        # Every Drive and S3 call goes through a shared limiter that retries
+        # throttled and transient failures and adapts concurrency (AIMD)
+        self.drive_api = ApiThrottle(
+            "Drive", drive_rate,
+            max_concurrency=self.download_workers * self.range_workers + self.small_file_workers + 1
+        )
+        self.s3_api = ApiThrottle(
+            "S3", s3_rate,
+            max_concurrency=self.download_workers + self.upload_workers + self.small_file_workers
+        )
         
-        # Initialize Google Drive service
+        # Per-stage latency, bytes, retries and queue depths
+        self.metrics = TransferMetrics()
+        self.metrics.track_api("drive", self.drive_api)
+        self.metrics.track_api("s3", self.s3_api)
+        self.metrics.track_stats(self.stats)
+        self.report_path = report_path
+        self.drive_endpoint = drive_endpoint.rstrip('/') if drive_endpoint else None
+        self.s3_endpoint = s3_endpoint
+        if metrics_port:
+            start_metrics_server(self.metrics.registry, metrics_port)
+        
+        # Initialize Google Drive service; its pooled transport gives every
+        # worker thread its own keep-alive connection, so it is shared freely
         self.drive_service = self._init_drive_service(service_account_file)
         
         # Initialize S3 client
         self.s3_client = self._init_s3_client()
         
-        # Create temp directory if it doesn't exist
-        self.temp_dir.mkdir(exist_ok=True)
+        self.packer: Optional[TarShardPacker] = None
+        if pack:
+            self.packer = TarShardPacker(
+                self.s3_client, self.bucket_name, prefix=pack_prefix, pack_size=pack_size,
+                part_size=self.part_size,
+                on_shard=lambda key, members: self.stats.increment('uploaded_files', len(members)),
+                shard_index=self.shard_index
+            )
+        
+        # Each shard reads the same changes feed, so each keeps its own cursor
+        if self.shard_count > 1:
+            suffix = f".shard-{self.shard_index}"
+            state_file += suffix
+            state_s3_key = state_s3_key + suffix if state_s3_key else None
+        
+        if state_s3_key:
+            self.cursor_store = S3CursorStore(self.s3_client, self.bucket_name, state_s3_key)
+        else:
+            self.cursor_store = LocalCursorStore(state_file)
+        
+        # Create temp directory if it doesn't exist (unused when streaming)
+        if not self.streaming:
+            self.temp_dir.mkdir(exist_ok=True)
 
     def _init_drive_service(self, service_account_file: str):
         """Initialize Google Drive service"""
         try:
-            credentials = service_account.Credentials.from_service_account_file(
-                service_account_file, scopes=self.SCOPES
-            )
-            return build("drive", "v3", credentials=credentials)
+            if service_account_file:
+                self.credentials = service_account.Credentials.from_service_account_file(
+                    service_account_file, scopes=self.SCOPES
+                )
+            elif self.drive_endpoint:
+                self.credentials = AnonymousCredentials()
+            else:
+                raise ValueError("a service account file is required without a Drive endpoint")
+            return self._build_drive()
         except Exception as e:
             raise Exception(f"Failed to initialize Google Drive service: {str(e)}")
 
+    def _build_drive(self):
+        """Build a Drive v3 service, pointed at ``drive_endpoint`` when one is set"""
+        if not self.drive_endpoint:
+            return build_drive_service(self.credentials)
+        return build_drive_service(
+            self.credentials,
+            discovery_service_url=f"{self.drive_endpoint}/discovery/v1/apis/{{api}}/{{apiVersion}}/rest"
+        )
+
     def _init_s3_client(self):
         """Initialize AWS S3 client"""
         try:
-            return boto3.client(
+            client = boto3.client(
                 's3',
                 aws_access_key_id=os.getenv('Accesskey'),
                 aws_secret_access_key=os.getenv('Secretaccesskey'),
-                region_name="us-east-1"
+                region_name="us-east-1",
+                endpoint_url=self.s3_endpoint,
+                config=Config(
+                    # Enough pooled keep-alive connections for every upload thread
+                    # (botocore defaults to 10)
+                    max_pool_connections=max(
+                        10,
+                        self.upload_workers * self.range_workers + self.small_file_workers + self.download_workers
+                    ),
+                    # Retries are handled by self.s3_api so backoff is shared
+                    retries={'mode': 'standard', 'max_attempts': 1}
+                )
             )
+            return ThrottledClient(client, self.s3_api)
         except Exception as e:
             raise Exception(f"Failed to initialize S3 client: {str(e)}")
 
     def get_dataset_folder_id(self) -> Optional[str]:
         """Find the 'Dataset' folder ID in Google Drive"""
+        if self.root_folder_id:
+            return self.root_folder_id
         try:
-            response = self.drive_service.files().list(
+            response = self._list_execute(self.drive_service.files().list(
                 pageSize=10,
                 fields="files(id, name)",
                 q="mimeType='application/vnd.google-apps.folder' and name='Dataset'"
-            ).execute()
+            ))
             
             files = response.get('files', [])
             return files[0]['id'] if files else None
@@ -106,108 +366,890 @@ class DriveToS3Transfer:
             logging.error(f"Error finding Dataset folder: {str(e)}")
             return None
 
+    def _list_execute(self, request):
+        """Execute a Drive metadata request, timed as the ``list`` stage"""
+        return self.metrics.timed_call("list", self.drive_api.execute, request)
+
+    def iter_children(self, folder_id: str, fields: str = LIST_FIELDS,
+                      extra_query: str = "") -> Iterator[dict]:
+        """
+        Lazily yield every direct child of a folder, following ``nextPageToken``.
+        
+        Args:
+            folder_id (str): Drive folder id
+            fields (str): ``files(...)`` field mask to request
+            extra_query (str): Additional ``q`` clause, e.g. a mimeType filter
+        """
+        query = f"'{folder_id}' in parents and trashed = false"
+        if extra_query:
+            query += f" and {extra_query}"
+        
+        page_token = None
+        while True:
+            response = self._list_execute(self.drive_service.files().list(
+                q=query,
+                pageSize=MAX_PAGE_SIZE,
+                fields=f"nextPageToken, {fields}",
+                pageToken=page_token
+            ))
+            
+            yield from response.get('files', [])
+            
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
     def get_class_folders(self, dataset_id: str) -> List[dict]:
         """Get list of class folders within the dataset folder"""
         try:
-            response = self.drive_service.files().list(
-                q=f"'{dataset_id}' in parents",
-                pageSize=50,
-                fields="files(id, name)"
-            ).execute()
-            
-            return response.get('files', [])
+            return list(self.iter_children(
+                dataset_id, fields="files(id, name)", extra_query=f"mimeType = '{FOLDER_MIME_TYPE}'"
+            ))
             
         except HttpError as e:
             logging.error(f"Error getting class folders: {str(e)}")
             return []
 
-    def download_file(self, file_id: str, file_name: str) -> Optional[Path]:
-        """Download a single file from Google Drive"""
-        temp_path = self.temp_dir / file_name
+    @staticmethod
+    def _fetch_range(request, start: int, end: int) -> Tuple[dict, bytes]:
+        """Fetch bytes ``start..end`` of a media request, raising HttpError on failure"""
+        headers = {'range': f"bytes={start}-{end}"}
+        resp, content = request.http.request(request.uri, method='GET', headers=headers)
+        if resp.status not in (200, 206, 416):
+            raise HttpError(resp, content, uri=request.uri)
+        return resp, content
+
+    def _iter_media_chunks(self, request, offset: int, chunk_size: int) -> Iterator[bytes]:
+        """
+        Yield a Drive file's content from ``offset`` onwards using HTTP Range requests.
+        
+        ``MediaIoBaseDownload`` always starts at byte 0, so this is used to
+        continue a download that a previous run left unfinished.
+        """
+        while True:
+            resp, content = self.drive_api.call(
+                self._fetch_range, request, offset, offset + chunk_size - 1
+            )
+            if resp.status == 416:
+                # Offset is already at the end of the file
+                return
+            if resp.status == 200:
+                # Server ignored the range and sent the whole file
+                content = content[offset:]
+            
+            if content:
+                yield content
+                offset += len(content)
+            
+            content_range = resp.get('content-range', '')
+            total = content_range.rsplit('/', 1)[-1] if '/' in content_range else None
+            if resp.status == 200 or not content or (total and total != '*' and offset >= int(total)):
+                return
+
+    def is_large(self, task: FileTask) -> bool:
+        return task.size is not None and task.size >= self.large_file_threshold
+
+    def is_small(self, task: FileTask) -> bool:
+        return task.size is not None and self.small_file_threshold > 0 and task.size <= self.small_file_threshold
+
+    def is_packed(self, task: FileTask) -> bool:
+        """Whether the file goes into a tar shard rather than its own object"""
+        return (self.packer is not None and task.size is not None
+                and task.size < self.large_file_threshold and not self.is_transformed(task))
+
+    def is_transformed(self, task: FileTask) -> bool:
+        return self.transform is not None and task.original_key is not None
+
+    def is_deduped(self, task: FileTask) -> bool:
+        """Whether the file is an image checked for near-duplicates; it must fit in memory"""
+        return (self.dedup is not None and self.dedup.applies(task.name)
+                and task.size is not None and task.size < self.large_file_threshold)
+
+    def with_target_key(self, task: FileTask) -> FileTask:
+        """Point a HEIC task at its JPEG key when the HEIC transform is enabled"""
+        if self.transform is None or task.original_key is not None or not self.transform.applies(task.name):
+            return task
+        return replace(task, s3_key=self.transform.output_key(task.s3_key), original_key=task.s3_key)
+
+    def _fetch_segment(self, file_id: str, start: int, end: int) -> bytes:
+        """Fetch bytes ``start..end`` of a file"""
+        request = self.drive_service.files().get_media(fileId=file_id)
+        resp, content = self.drive_api.call(self._fetch_range, request, start, end)
+        if resp.status == 200:
+            content = content[start:end + 1]
+        if len(content) != end - start + 1:
+            raise IOError(f"Expected {end - start + 1} bytes at offset {start}, got {len(content)}")
+        return content
+
+    def _iter_ranged_chunks(self, task: FileTask, offset: int, segment_size: int) -> Iterator[bytes]:
+        """
+        Yield a large file from ``offset`` onwards, in order, fetching up to
+        ``range_workers`` Range segments concurrently.
+        
+        Only the segments in flight are held in memory, so a file costs at most
+        ``range_workers * segment_size`` bytes however large it is.
+        """
+        pending = deque()
+        next_start = offset
+        try:
+            while next_start < task.size or pending:
+                while next_start < task.size and len(pending) < self.range_workers:
+                    end = min(next_start + segment_size, task.size) - 1
+                    pending.append(self._range_pool.submit(self._fetch_segment, task.file_id, next_start, end))
+                    next_start = end + 1
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def download_file(self, task: FileTask) -> Optional[Path]:
+        """
+        Download a single file from Google Drive.
+        
+        A partial download left behind by an interrupted run is continued
+        from where it stopped, as long as the file is unchanged in Drive.
+        """
+        # One directory per Drive id so same-named files from different
+        # class folders never collide while downloaded concurrently
+        temp_path = self.temp_dir / task.file_id / task.name
         
         try:
-            request = self.drive_service.files().get_media(fileId=file_id)
+            entry = self.journal.get(task.file_id)
+            offset = 0
+            if entry and entry.state == DOWNLOADING and entry.md5 == task.md5 and temp_path.exists():
+                offset = temp_path.stat().st_size
+                logging.info(f"Resuming download of {task.name} at byte {offset}")
+            self.journal.mark(task.file_id, DOWNLOADING)
+            temp_path.parent.mkdir(parents=True, exist_ok=True)
             
-            with open(temp_path, 'wb') as f:
-                downloader = MediaIoBaseDownload(f, request)
-                done = False
-                while not done:
-                    _, done = downloader.next_chunk()
+            request = self.drive_service.files().get_media(fileId=task.file_id)
+            with self.metrics.time("download"):
+                if self.is_large(task):
+                    with open(temp_path, 'ab' if offset else 'wb') as f:
+                        out = MeteredWriter(f, self.metrics)
+                        for chunk in self._iter_ranged_chunks(task, offset, self.part_size):
+                            out.write(chunk)
+                elif offset:
+                    with open(temp_path, 'ab') as f:
+                        out = MeteredWriter(f, self.metrics)
+                        for chunk in self._iter_media_chunks(request, offset, self.part_size):
+                            out.write(chunk)
+                else:
+                    with open(temp_path, 'wb') as f:
+                        downloader = MediaIoBaseDownload(MeteredWriter(f, self.metrics), request)
+                        done = False
+                        while not done:
+                            _, done = self.drive_api.call(downloader.next_chunk)
             
-            self.stats.downloaded_files += 1
+            self.metrics.add_bytes("download", temp_path.stat().st_size - offset)
+            self.stats.increment('downloaded_files')
             return temp_path
             
         except Exception as e:
-            logging.error(f"Error downloading {file_name}: {str(e)}")
-            if temp_path.exists():
-                temp_path.unlink()
+            logging.error(f"Error downloading {task.name}: {str(e)}")
+            self._remove_temp(temp_path)
             return None
 
-    def upload_to_s3(self, file_path: Path, s3_key: str) -> bool:
-        """Upload a file to S3"""
+    def _remove_temp(self, temp_path: Path) -> None:
+        """Delete a downloaded file and its per-file directory"""
+        if temp_path.exists():
+            temp_path.unlink()
+        if temp_path.parent.exists() and not any(temp_path.parent.iterdir()):
+            temp_path.parent.rmdir()
+
+    def load_inventory(self) -> None:
+        """Index the bucket once so existing files are skipped before download"""
+        try:
+            self.inventory = self.s3_api.call(S3Inventory(self.s3_client, self.bucket_name).load)
+        except Exception as e:
+            # Fall back to per-file head_object checks
+            logging.error(f"Error listing S3 bucket {self.bucket_name}: {str(e)}")
+            self.inventory = None
+
+    def exists_in_s3(self, s3_key: str, size: Optional[int] = None) -> bool:
+        """Check whether an object (of the given size, if known) already exists in S3"""
+        if self.inventory is not None:
+            return self.inventory.contains(s3_key, size)
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            return False
+
+    def should_skip(self, task: FileTask) -> bool:
+        """
+        Decide from listing metadata whether a file is already in S3 and unchanged.
+        
+        The manifest is consulted first; files it knows about are skipped or
+        re-sent by comparing Drive md5/size/modifiedTime, without calling Drive's
+        media endpoint or S3. Files it does not know about fall back to the S3
+        inventory and are recorded so later runs can decide locally.
+        """
+        if self.is_deduped(task) and self.dedup.is_skipped(task.folder_name, task.file_id, task.md5):
+            return True
+        
+        if self.is_packed(task):
+            return self.packer.contains(task.folder_name, task.file_id, task.md5)
+        
+        entry = self.manifest.get(task.file_id)
+        if entry is not None:
+            # The in-memory inventory also catches objects deleted from the bucket
+            missing = self.inventory is not None and self.inventory.get(task.s3_key) is None
+            return not missing and entry.matches(task.s3_key, task.md5, task.size, task.modified_time)
+        
+        if not self.exists_in_s3(task.s3_key, task.size):
+            return False
+        
+        existing = self.inventory.get(task.s3_key) if self.inventory is not None else None
+        self.record_transfer(task, existing.etag if existing else None)
+        return True
+
+    def record_transfer(self, task: FileTask, etag: Optional[str]) -> None:
+        """Store a transferred (or verified) file in the manifest"""
         try:
-            # Check if file already exists in S3
+            self.manifest.record(ManifestEntry(
+                drive_id=task.file_id,
+                s3_key=task.s3_key,
+                md5=task.md5,
+                size=task.size,
+                modified_time=task.modified_time,
+                etag=etag.strip('"') if etag else None
+            ))
+        except Exception as e:
+            logging.error(f"Error recording {task.s3_key} in manifest: {str(e)}")
+
+    def _checkpoint_listed(self, task: FileTask) -> None:
+        """Journal a queued file, discarding progress made on an older version of it"""
+        entry = self.journal.get(task.file_id)
+        if entry is not None and entry.md5 == task.md5 and entry.s3_key == task.s3_key:
+            return
+        if entry is not None and entry.upload_id:
+            self._abort_upload(entry.s3_key, entry.upload_id)
+        self.journal.mark(task.file_id, LISTED, s3_key=task.s3_key, md5=task.md5, size=task.size)
+        self.journal.reset(task.file_id)
+
+    def _abort_upload(self, s3_key: str, upload_id: str) -> None:
+        """Abort a multipart upload that can no longer be resumed"""
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+        except ClientError as e:
+            logging.warning(f"Error aborting multipart upload {s3_key}: {str(e)}")
+
+    def _open_writer(self, task: FileTask, part_queue: queue.Queue) -> Tuple[S3MultipartWriter, int]:
+        """
+        Create the multipart writer for a streamed file.
+        
+        If the journal holds an in-flight multipart upload for the same version
+        of the file, that upload is reused and the returned offset is the number
+        of bytes its already-completed parts cover.
+        
+        Returns:
+            Tuple[S3MultipartWriter, int]: Writer and the Drive offset to resume from
+        """
+        entry = self.journal.get(task.file_id)
+        resumable = entry is not None and entry.upload_id is not None and entry.part_size
+        if resumable:
             try:
-                self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
-                logging.info(f"File already exists in S3: {s3_key}")
-                self.stats.skipped_files += 1
+                # Confirm S3 still has the upload (it may have been aborted or expired)
+                self.s3_client.list_parts(
+                    Bucket=self.bucket_name, Key=task.s3_key, UploadId=entry.upload_id, MaxParts=1
+                )
+            except ClientError:
+                self.journal.reset(task.file_id)
+                resumable = False
+        
+        writer = S3MultipartWriter(
+            self.s3_client, self.bucket_name, task.s3_key,
+            part_size=entry.part_size if resumable else self.part_size,
+            part_queue=part_queue,
+            on_create=lambda upload_id: self.journal.start_multipart(task.file_id, upload_id, writer.part_size),
+            on_part=lambda number, etag, size: self.journal.record_part(task.file_id, number, etag, size)
+        )
+        if not resumable:
+            return writer, 0
+        
+        parts = {number: entry.parts[number] for number in entry.completed_prefix()}
+        writer.resume(entry.upload_id, parts)
+        logging.info(f"Resuming multipart upload of {task.s3_key} after {len(parts)} parts")
+        return writer, writer.bytes_written
+
+    def stream_file(self, task: FileTask, part_queue: queue.Queue) -> bool:
+        """
+        Stream a Drive file into S3 without touching local disk.
+        
+        Drive media chunks are written into an ``S3MultipartWriter`` whose parts
+        are handed to the upload workers through ``part_queue``. Peak memory is
+        bounded by the part size and the queue length, not the object size.
+        
+        Args:
+            task (FileTask): File to transfer
+            part_queue (queue.Queue): Queue drained by the upload workers
+            
+        Returns:
+            bool: Whether the file was transferred or skipped successfully
+        """
+        writer = None
+        try:
+            writer, offset = self._open_writer(task, part_queue)
+            self.journal.mark(task.file_id, DOWNLOADING)
+            
+            request = self.drive_service.files().get_media(fileId=task.file_id)
+            with self.metrics.time("download"):
+                if self.is_large(task):
+                    # One Range segment per multipart part, fetched in parallel
+                    for chunk in self._iter_ranged_chunks(task, offset, writer.part_size):
+                        writer.write(chunk)
+                elif offset:
+                    for chunk in self._iter_media_chunks(request, offset, writer.part_size):
+                        writer.write(chunk)
+                else:
+                    downloader = MediaIoBaseDownload(writer, request, chunksize=writer.part_size)
+                    done = False
+                    while not done:
+                        _, done = self.drive_api.call(downloader.next_chunk)
+            self.metrics.add_bytes("download", writer.bytes_written - offset)
+            self.stats.increment('downloaded_files')
+            
+            # Small files never start a multipart upload and are sent by finish()
+            single_put = writer.upload_id is None
+            with self.metrics.time("upload"):
+                response = writer.finish()
+            if single_put:
+                self.metrics.add_bytes("upload", writer.bytes_written)
+            self.journal.mark(task.file_id, UPLOADED)
+            if self.inventory is not None:
+                self.inventory.add(task.s3_key, writer.bytes_written, response.get('ETag', ''))
+            self.record_transfer(task, response.get('ETag'))
+            self.stats.increment('uploaded_files')
+            return True
+            
+        except Exception as e:
+            # The multipart upload is left open and journaled, so the next
+            # run continues it from the last completed part
+            logging.error(f"Error streaming {task.name} to S3: {task.s3_key}: {str(e)}")
+            self.stats.increment('failed_files')
+            return False
+
+    def _check_duplicate(self, task: FileTask, data: bytes) -> Optional[DuplicateMatch]:
+        """Look up an image held in memory among the images of its class folder"""
+        if not self.is_deduped(task):
+            return None
+        with self.metrics.time("dedup"):
+            match = self.dedup.check(task.folder_name, task.file_id, task.md5, task.s3_key, data)
+        if match is not None:
+            self.stats.increment('duplicate_files')
+            verb = "Skipping" if self.dedup.action == SKIP else "Flagging"
+            logging.info(f"{verb} {task.s3_key}: near-duplicate of {match.s3_key} (distance {match.distance})")
+        return match
+
+    def _duplicate_args(self, match: Optional[DuplicateMatch]) -> dict:
+        """``put_object`` arguments marking a flagged duplicate"""
+        if match is None:
+            return {}
+        # User metadata must be ASCII
+        return {'Metadata': {'duplicate-of': urllib.parse.quote(match.s3_key)}}
+
+    def transfer_small_file(self, task: FileTask) -> bool:
+        """
+        Transfer a small file with one Drive request and one ``put_object``.
+        
+        The body is held in memory, so small files skip the temp directory
+        and the multipart calls; their cost is dominated by request latency,
+        which the small-file pool hides with many concurrent keep-alive connections.
+        """
+        try:
+            self.journal.mark(task.file_id, DOWNLOADING)
+            request = self.drive_service.files().get_media(fileId=task.file_id)
+            with self.metrics.time("download"):
+                data = self.drive_api.execute(request)
+            self.metrics.add_bytes("download", len(data))
+            self.stats.increment('downloaded_files')
+            
+            match = self._check_duplicate(task, data)
+            if match is not None and self.dedup.action == SKIP:
+                # Nothing to upload; the hash index remembers the file is left out
+                self.journal.mark(task.file_id, UPLOADED)
                 return True
-            except ClientError as e:
-                if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
-                    raise
+            
+            with self.metrics.time("upload"):
+                response = self.s3_client.put_object(
+                    Bucket=self.bucket_name, Key=task.s3_key, Body=data, **self._duplicate_args(match)
+                )
+            self.metrics.add_bytes("upload", len(data))
+            self.journal.mark(task.file_id, UPLOADED)
+            if self.inventory is not None:
+                self.inventory.add(task.s3_key, len(data), response.get('ETag', ''))
+            self.record_transfer(task, response.get('ETag'))
+            self.stats.increment('uploaded_files')
+            return True
+            
+        except Exception as e:
+            logging.error(f"Error transferring {task.name} to S3: {task.s3_key}: {str(e)}")
+            self.stats.increment('failed_files')
+            return False
 
-            # Upload file to S3
-            self.s3_client.upload_file(str(file_path), self.bucket_name, s3_key)
-            self.stats.uploaded_files += 1
+    def transform_file(self, task: FileTask) -> bool:
+        """
+        Download a HEIC file into memory, convert it to JPEG and upload the result.
+        
+        The conversion runs on the transform's process pool. With
+        ``keep_original`` the HEIC bytes already in memory are uploaded too,
+        so the file crosses the network once.
+        """
+        try:
+            self.journal.mark(task.file_id, DOWNLOADING)
+            request = self.drive_service.files().get_media(fileId=task.file_id)
+            with self.metrics.time("download"):
+                data = self.drive_api.execute(request)
+            self.metrics.add_bytes("download", len(data))
+            self.stats.increment('downloaded_files')
+            
+            with self.metrics.time("transform"):
+                jpeg = self.transform.convert(data)
+            self.metrics.add_bytes("transform", len(data))
+            
+            match = self._check_duplicate(task, jpeg)
+            if match is not None and self.dedup.action == SKIP:
+                self.journal.mark(task.file_id, UPLOADED)
+                return True
+            
+            with self.metrics.time("upload"):
+                response = self.s3_client.put_object(
+                    Bucket=self.bucket_name, Key=task.s3_key, Body=jpeg, ContentType='image/jpeg',
+                    **self._duplicate_args(match)
+                )
+                if self.transform.keep_original:
+                    self.s3_client.put_object(Bucket=self.bucket_name, Key=task.original_key, Body=data)
+            self.metrics.add_bytes("upload", len(jpeg) + (len(data) if self.transform.keep_original else 0))
+            
+            self.journal.mark(task.file_id, UPLOADED)
+            if self.inventory is not None:
+                self.inventory.add(task.s3_key, len(jpeg), response.get('ETag', ''))
+            self.record_transfer(task, response.get('ETag'))
+            self.stats.increment('uploaded_files')
             return True
             
         except Exception as e:
-            logging.error(f"Error uploading to S3: {s3_key}: {str(e)}")
-            self.stats.failed_files += 1
+            logging.error(f"Error converting {task.name} to JPEG: {task.s3_key}: {str(e)}")
+            self.stats.increment('failed_files')
             return False
 
-    def process_class_folder(self, folder: dict) -> None:
-        """Process all images in a class folder"""
+    def pack_file(self, task: FileTask) -> bool:
+        """Fetch a file into memory and append it to its class folder's tar shard"""
         try:
-            # Get all files in the class folder
-            response = self.drive_service.files().list(
-                q=f"'{folder['id']}' in parents",
-                pageSize=100,
-                fields="files(id, name)"
-            ).execute()
+            request = self.drive_service.files().get_media(fileId=task.file_id)
+            with self.metrics.time("download"):
+                data = self.drive_api.execute(request)
+            self.metrics.add_bytes("download", len(data))
+            self.stats.increment('downloaded_files')
             
-            files = response.get('files', [])
-            self.stats.total_files += len(files)
+            # Flagged duplicates are packed too; the hash index records what they duplicate
+            match = self._check_duplicate(task, data)
+            if match is not None and self.dedup.action == SKIP:
+                return True
             
-            for file in files:
-                logging.info(f"Processing {file['name']} in {folder['name']}")
-                
-                # Download file
-                temp_path = self.download_file(file['id'], file['name'])
-                if not temp_path:
-                    self.stats.failed_files += 1
+            # Member names are relative to the class folder, e.g. "sub/img_001.jpg"
+            self.packer.add(
+                task.folder_name, task.s3_key[len(task.folder_name) + 1:], data,
+                drive_id=task.file_id, md5=task.md5, modified_time=task.modified_time
+            )
+            return True
+            
+        except Exception as e:
+            logging.error(f"Error packing {task.name} into a shard: {str(e)}")
+            self.stats.increment('failed_files')
+            return False
+
+    def upload_to_s3(self, file_path: Path, s3_key: str) -> bool:
+        """Upload a file to S3"""
+        try:
+            # Existing objects were already filtered out before download
+            with self.metrics.time("upload"):
+                self.s3_client.upload_file(str(file_path), self.bucket_name, s3_key, Config=self.transfer_config)
+            size = file_path.stat().st_size
+            self.metrics.add_bytes("upload", size)
+            if self.inventory is not None:
+                self.inventory.add(s3_key, size, '')
+            self.stats.increment('uploaded_files')
+            return True
+            
+        except Exception as e:
+            logging.error(f"Error uploading to S3: {s3_key}: {str(e)}")
+            self.stats.increment('failed_files')
+            return False
+
+    def iter_tasks(self, class_folders: List[dict]) -> Iterable[FileTask]:
+        """
+        Yield a transfer task for every file under the given class folders, at any depth.
+        
+        The tree is walked one level at a time; the page requests of all
+        folders on a level are grouped into Drive batch requests, so hundreds
+        of folders are listed in a handful of HTTP calls. Files are yielded as
+        each batch returns, and only the folder ids of the next level are held
+        in memory.
+        
+        Raises:
+            FolderListingError: After every listable folder was walked, if some
+                folders could not be listed; the run must not count as complete
+        """
+        # folder id -> (class folder name, path relative to the Dataset folder)
+        frontier = {folder['id']: (folder['name'], folder['name']) for folder in class_folders}
+        failed = {}
+        while frontier:
+            logging.info(f"Listing {len(frontier)} folders")
+            for folder_id, (_, folder_path) in frontier.items():
+                self._folder_paths[folder_id] = folder_path
+            
+            next_frontier = {}
+            try:
+                for folder_id, child in list_children_batch(
+                    self.drive_service, list(frontier), LIST_FIELDS,
+                    page_size=MAX_PAGE_SIZE, execute=self._list_execute
+                ):
+                    class_name, folder_path = frontier[folder_id]
+                    if child['mimeType'] == FOLDER_MIME_TYPE:
+                        next_frontier[child['id']] = (class_name, f"{folder_path}/{child['name']}")
+                    else:
+                        yield FileTask.from_drive(child, class_name, folder_path)
+            except FolderListingError as e:
+                # Keep walking the rest of the tree first
+                failed.update(e.errors)
+            frontier = next_frontier
+        if failed:
+            raise FolderListingError(failed)
+
+    def _resolve_folder_path(self, folder_id: str, dataset_id: str) -> Optional[str]:
+        """
+        Resolve a folder to its path relative to the Dataset folder.
+        
+        Ancestors are fetched once and memoized, so files sharing parents cost
+        no extra Drive calls.
+        
+        Returns:
+            Optional[str]: Relative path, or None if the folder is outside the dataset
+        """
+        chain = []
+        current_id = folder_id
+        path = None
+        while current_id and current_id != dataset_id:
+            if current_id in self._folder_paths:
+                path = self._folder_paths[current_id]
+                break
+            if current_id not in self._drive_nodes:
+                resolve_ancestors(self.drive_service, [current_id], known=self._drive_nodes,
+                                  execute=self.drive_api.execute, stop_at=dataset_id)
+            folder = self._drive_nodes.get(current_id)
+            if not folder:
+                # Deleted or not visible to the service account
+                break
+            chain.append((current_id, folder['name']))
+            parents = folder.get('parents')
+            current_id = parents[0] if parents else None
+        else:
+            if current_id == dataset_id:
+                path = ""
+        
+        # Memoize every folder seen on the way up, including misses
+        for seen_id, name in reversed(chain):
+            if path is not None:
+                path = f"{path}/{name}" if path else name
+            self._folder_paths[seen_id] = path
+        return self._folder_paths.get(folder_id, path)
+
+    def _changed_file_tasks(self, files: List[dict], dataset_id: str) -> Iterator[FileTask]:
+        """Turn changed files into tasks, resolving all their parent chains in batches"""
+        parent_ids = {file['parents'][0] for file in files if file.get('parents')}
+        resolve_ancestors(
+            self.drive_service,
+            [parent_id for parent_id in parent_ids if parent_id not in self._folder_paths],
+            known=self._drive_nodes, execute=self.drive_api.execute, stop_at=dataset_id
+        )
+        
+        for file in files:
+            parents = file.get('parents') or []
+            folder_path = self._resolve_folder_path(parents[0], dataset_id) if parents else None
+            if not folder_path:
+                # Outside the dataset tree, or directly in the Dataset root
+                continue
+            yield FileTask.from_drive(file, folder_path.split('/')[0], folder_path)
+
+    def iter_changed_tasks(self, dataset_id: str, feed: ChangeFeed) -> Iterable[FileTask]:
+        """Yield transfer tasks for files added or modified under the dataset since the cursor"""
+        seen = set()
+        pending = []
+        for change in feed:
+            file = change.get('file')
+            if change.get('removed') or not file or file.get('trashed'):
+                continue
+            if file['mimeType'] == FOLDER_MIME_TYPE or file['id'] in seen:
+                continue
+            
+            seen.add(file['id'])
+            pending.append(file)
+            if len(pending) >= MAX_PAGE_SIZE:
+                yield from self._changed_file_tasks(pending, dataset_id)
+                pending = []
+        
+        yield from self._changed_file_tasks(pending, dataset_id)
+
+    def _download_worker(self, download_queue: queue.Queue, upload_queue: queue.Queue) -> None:
+        """Download stage: fetch files from Drive and hand them to the upload stage"""
+        while True:
+            task = download_queue.get()
+            if task is _STOP:
+                return
+            
+            logging.info(f"Processing {task.name} in {task.folder_name}")
+            if self.streaming:
+                self.stream_file(task, upload_queue)
+                continue
+            
+            temp_path = self.download_file(task)
+            if not temp_path:
+                self.stats.increment('failed_files')
+                continue
+            
+            # Blocks while the upload stage is saturated, which bounds the
+            # number of downloaded files sitting on local disk
+            upload_queue.put((task, temp_path))
+
+    def _small_file_worker(self, small_queue: queue.Queue) -> None:
+        """Small-file stage: download and upload each file in memory"""
+        while True:
+            task = small_queue.get()
+            if task is _STOP:
+                return
+            if self.is_transformed(task):
+                self.transform_file(task)
+            elif self.is_packed(task):
+                self.pack_file(task)
+            else:
+                self.transfer_small_file(task)
+
+    def _upload_worker(self, upload_queue: queue.Queue) -> None:
+        """Upload stage: push downloaded files (or streamed parts) to S3"""
+        while True:
+            item = upload_queue.get()
+            if item is _STOP:
+                return
+            if isinstance(item, PartUpload):
+                with self.metrics.time("upload"):
+                    uploaded = item.run()
+                # The writer keeps a part's error for finish(), so count it here
+                if uploaded:
+                    self.metrics.add_bytes("upload", len(item.data))
+                else:
+                    self.metrics.errors.inc(stage="upload")
+                continue
+            
+            task, temp_path = item
+            try:
+                if self.upload_to_s3(temp_path, task.s3_key):
+                    self.journal.mark(task.file_id, UPLOADED)
+                    self.record_transfer(task, None)
+            finally:
+                self._remove_temp(temp_path)
+
+    def _skip_before_download(self, task: FileTask) -> bool:
+        """Run the skip-check for a listed file, counting it as skipped or failed"""
+        try:
+            with self.metrics.time("skip_check"):
+                skip = self.should_skip(task)
+        except ClientError as e:
+            logging.error(f"Error checking S3 for {task.s3_key}: {str(e)}")
+            self.stats.increment('failed_files')
+            return True
+        if skip:
+            logging.info(f"File unchanged, skipping: {task.s3_key}")
+            self.stats.increment('skipped_files')
+        return skip
+
+    def run_pipeline(self, tasks: Iterable[FileTask], check_skip: bool = True) -> None:
+        """
+        Transfer files through concurrent download and upload worker pools.
+        
+        Download workers and upload workers are joined by a bounded queue, so
+        both network links stay busy while the amount of buffered data is capped.
+        Small files bypass both stages and go to a separate, wider pool, which
+        also feeds the tar shards when packing is enabled.
+        
+        Args:
+            tasks (Iterable[FileTask]): Files to transfer, consumed lazily
+            check_skip (bool): Skip files already in S3; disabled when executing
+                a plan, which has made that decision already
+        """
+        download_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        upload_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self.metrics.track_queue("download", download_queue)
+        small_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self.metrics.track_queue("upload", upload_queue)
+        self.metrics.track_queue("small", small_queue)
+        if self.packer is not None:
+            self.packer.part_queue = upload_queue
+        self._range_pool = ThreadPoolExecutor(
+            max_workers=self.download_workers * self.range_workers, thread_name_prefix="range"
+        )
+        
+        downloaders = [
+            threading.Thread(target=self._download_worker, args=(download_queue, upload_queue),
+                             name=f"download-{i}", daemon=True)
+            for i in range(self.download_workers)
+        ]
+        uploaders = [
+            threading.Thread(target=self._upload_worker, args=(upload_queue,),
+                             name=f"upload-{i}", daemon=True)
+            for i in range(self.upload_workers)
+        ]
+        small_workers = [
+            threading.Thread(target=self._small_file_worker, args=(small_queue,),
+                             name=f"small-{i}", daemon=True)
+            for i in range(self.small_file_workers)
+        ]
+        for worker in downloaders + uploaders + small_workers:
+            worker.start()
+        
+        self._phase = "listing"
+        if self.progress is not None:
+            self.progress.start()
+        try:
+            for task in tasks:
+                if shard_for(task.file_id, self.shard_count) != self.shard_index:
                     continue
+                self.stats.increment('total_files')
+                task = self.with_target_key(task)
                 
-                # Upload to S3
-                s3_key = f"{folder['name']}/{file['name']}"
-                self.upload_to_s3(temp_path, s3_key)
+                # Skip-check before any Drive bytes are fetched
+                if check_skip and self._skip_before_download(task):
+                    continue
+                self._queued_bytes += task.size or 0
                 
-                # Clean up temp file
-                temp_path.unlink()
+                if self.is_packed(task):
+                    # Shards are not resumable per file; an unfinished shard
+                    # simply has no index, so its files are packed again
+                    small_queue.put(task)
+                    continue
                 
-        except Exception as e:
-            logging.error(f"Error processing folder {folder['name']}: {str(e)}")
+                self._checkpoint_listed(task)
+                if self.is_small(task) or self.is_transformed(task) or self.is_deduped(task):
+                    small_queue.put(task)
+                else:
+                    download_queue.put(task)
+            
+            self._listing_complete = True
+            self._phase = "transferring"
+        finally:
+            # Drain the stages in order so every queued file is finished
+            for _ in small_workers:
+                small_queue.put(_STOP)
+            for _ in downloaders:
+                download_queue.put(_STOP)
+            for worker in downloaders + small_workers:
+                worker.join()
+            # The transform pool and packer shards reopen on demand, so the
+            # full-scan fallback after an expired cursor can run a second pipeline
+            if self.transform is not None:
+                self.transform.close()
+            if self.packer is not None:
+                # Open shards still need the upload workers for their last parts
+                self.packer.close()
+                self.stats.increment('failed_files', self.packer.failed_members)
+                self.packer.failed_members = 0
+            for _ in uploaders:
+                upload_queue.put(_STOP)
+            for worker in uploaders:
+                worker.join()
+            self._range_pool.shutdown()
+
+    def _progress_snapshot(self) -> dict:
+        stats = self.stats.snapshot()
+        done = stats['uploaded_files'] + stats['skipped_files'] + stats['failed_files']
+        if self.dedup is not None and self.dedup.action == SKIP:
+            done += stats['duplicate_files']
+        return {
+            'phase': self._phase,
+            'files_done': done,
+            'files_total': stats['total_files'],
+            'listing_complete': self._listing_complete,
+            'bytes_done': int(self.metrics.bytes.get(stage="upload")),
+            'bytes_total': self._queued_bytes,
+            'busy': self.metrics.busy_seconds(),
+            'stats': stats,
+        }
 
     def cleanup(self):
         """Clean up temporary files"""
+        if self.streaming:
+            return
         try:
             if self.temp_dir.exists():
-                for file in self.temp_dir.iterdir():
-                    file.unlink()
-                self.temp_dir.rmdir()
+                # Partial downloads of unfinished files are kept for the next run
+                unfinished = set(self.journal.unfinished_ids())
+                for file_dir in self.temp_dir.iterdir():
+                    if file_dir.name in unfinished:
+                        continue
+                    if file_dir.is_file():
+                        file_dir.unlink()
+                        continue
+                    for file in file_dir.iterdir():
+                        file.unlink()
+                    file_dir.rmdir()
+                if not any(self.temp_dir.iterdir()):
+                    self.temp_dir.rmdir()
         except Exception as e:
             logging.error(f"Error during cleanup: {str(e)}")
 
+    def _save_cursor(self, token: Optional[str]) -> None:
+        """Persist the changes cursor unless some files still need a retry"""
+        if not token:
+            return
+        if self.stats.failed_files:
+            logging.warning("Not advancing the changes cursor because some files failed")
+            return
+        self.cursor_store.save(token)
+
+    def transfer_changes(self, dataset_id: str, token: str) -> bool:
+        """
+        Transfer only the files changed since ``token``.
+        
+        Raises:
+            CursorExpiredError: If Drive no longer accepts the stored cursor
+        """
+        logging.info("Running incremental sync from the Drive changes feed")
+        feed = ChangeFeed(self.drive_service, token, execute=self._list_execute)
+        self.run_pipeline(self.iter_changed_tasks(dataset_id, feed))
+        self._save_cursor(feed.new_start_page_token)
+        self.journal.prune_uploaded()
+        return True
+
+    def write_report(self) -> None:
+        """Write the JSON run report to ``report_path``"""
+        # The small-file pool records its time under download and upload too
+        workers = {
+            'download': self.download_workers + self.small_file_workers,
+            'disk': self.download_workers,
+            'upload': self.upload_workers + self.small_file_workers,
+            'transform': self.transform.processes if self.transform else 1,
+        }
+        try:
+            report = self.metrics.write_report(self.report_path, self.stats.snapshot(), workers)
+            logging.info(f"Busiest stage: {report['bottleneck']}")
+        except Exception as e:
+            logging.error(f"Error writing run report: {str(e)}")
+
+    def publish_stats(self, elapsed_time: float, success: bool) -> None:
+        """Write this shard's stats to S3 and refresh the merged summary"""
+        try:
+            write_shard_stats(
+                self.s3_client, self.bucket_name, self.stats_prefix,
+                self.shard_index, self.shard_count, self.stats.snapshot(), elapsed_time, success
+            )
+            # Whichever shard finishes last leaves a complete summary behind
+            merge_shard_stats(self.s3_client, self.bucket_name, self.stats_prefix)
+        except Exception as e:
+            logging.error(f"Error publishing shard stats: {str(e)}")
+
     def transfer_files(self) -> bool:
         """Main method to transfer files from Google Drive to S3"""
         start_time = time.time()
@@ -220,16 +1262,36 @@ class DriveToS3Transfer:
                 logging.error("Could not find Dataset folder")
                 return False
             
+            # Index what is already in the bucket
+            self.load_inventory()
+            
+            if self.incremental:
+                token = self.cursor_store.load()
+                if token:
+                    try:
+                        success = self.transfer_changes(dataset_id, token)
+                        return success
+                    except CursorExpiredError as e:
+                        logging.warning(f"Changes cursor expired, falling back to a full scan: {str(e)}")
+                else:
+                    logging.info("No changes cursor stored yet, running a full scan")
+                
+                # Take the cursor before scanning so changes made during the
+                # scan are picked up by the next run
+                start_page_token = get_start_page_token(self.drive_service, execute=self.drive_api.execute)
+            
             # Get class folders
             class_folders = self.get_class_folders(dataset_id)
             if not class_folders:
                 logging.error("No class folders found")
                 return False
             
-            # Process each class folder
-            for folder in class_folders:
-                logging.info(f"Processing folder: {folder['name']}")
-                self.process_class_folder(folder)
+            # Stream every file through the download/upload pipeline
+            self.run_pipeline(self.iter_tasks(class_folders))
+            
+            if self.incremental:
+                self._save_cursor(start_page_token)
+            self.journal.prune_uploaded()
             
             success = True
             
@@ -237,6 +1299,13 @@ class DriveToS3Transfer:
             logging.error(f"Transfer failed: {str(e)}")
             
         finally:
+            self._finish_run(start_time, success)
+            
+        return success
+
+    def _finish_run(self, start_time: float, success: bool) -> None:
+        """Log and publish the run's statistics, then clean up"""
+        try:
             # Print statistics
             elapsed_time = time.time() - start_time
             logging.info("\nTransfer Summary:")
@@ -244,15 +1313,234 @@ class DriveToS3Transfer:
             logging.info(f"Files downloaded: {self.stats.downloaded_files}")
             logging.info(f"Files uploaded: {self.stats.uploaded_files}")
             logging.info(f"Files skipped: {self.stats.skipped_files}")
+            if self.dedup is not None:
+                logging.info(f"Near-duplicate images: {self.stats.duplicate_files}")
             logging.info(f"Files failed: {self.stats.failed_files}")
             logging.info(f"Total time: {elapsed_time:.2f} seconds")
+            if self.progress is not None:
+                self.progress.stop("completed" if success else "failed")
+            self.metrics.stop()
+            if success and self.stats.uploaded_files:
+                # Feeds the duration estimate of later plans
+                self.manifest.record_run(
+                    start_time, elapsed_time, self.stats.uploaded_files,
+                    int(self.metrics.bytes.get(stage="upload"))
+                )
+            if self.report_path:
+                self.write_report()
+            
+            if self.stats_prefix:
+                self.publish_stats(elapsed_time, success)
             
+        finally:
             # Cleanup
+            if self.dedup is not None:
+                # Once per run: every pipeline of the run checks the same hash index
+                self.dedup.close()
+            self.cleanup()
+
+    def classify(self, task: FileTask) -> str:
+        """
+        Decide what a transfer would do with a file, without side effects.
+        
+        Uses the same rules as ``should_skip``: images already skipped as
+        duplicates, the manifest, then the S3 inventory (which must be loaded).
+        New near-duplicates need the image itself, so they are not detected here.
+        
+        Returns:
+            str: ``new``, ``changed`` or ``unchanged``
+        """
+        if self.is_deduped(task) and self.dedup.is_skipped(task.folder_name, task.file_id, task.md5):
+            return UNCHANGED
+        
+        if self.is_packed(task):
+            return UNCHANGED if self.packer.contains(task.folder_name, task.file_id, task.md5) else NEW
+        
+        existing = self.inventory.get(task.s3_key)
+        if existing is None:
+            return NEW
+        entry = self.manifest.get(task.file_id)
+        if entry is not None:
+            return UNCHANGED if entry.matches(task.s3_key, task.md5, task.size, task.modified_time) else CHANGED
+        return UNCHANGED if task.size is None or existing.size == task.size else CHANGED
+
+    def plan_transfer(self, plan_path: str) -> bool:
+        """
+        List Drive and the bucket, and write what a transfer would do to ``plan_path``.
+        
+        Nothing is downloaded or uploaded. Files are classified as new,
+        changed or unchanged; objects under a class folder that no longer
+        exist in Drive are reported as orphaned.
+        """
+        try:
+            dataset_id = self.get_dataset_folder_id()
+            if not dataset_id:
+                logging.error("Could not find Dataset folder")
+                return False
+            
+            self.load_inventory()
+            if self.inventory is None:
+                logging.error("Cannot plan without listing the bucket")
+                return False
+            
+            class_folders = self.get_class_folders(dataset_id)
+            if not class_folders:
+                logging.error("No class folders found")
+                return False
+            
+            plan = TransferPlan(self.bucket_name, self.shard_index, self.shard_count, dedup=self.dedup is not None)
+            drive_keys = set()
+            for task in self.iter_tasks(class_folders):
+                task = self.with_target_key(task)
+                drive_keys.add(task.s3_key)
+                if task.original_key and self.transform.keep_original:
+                    drive_keys.add(task.original_key)
+                if shard_for(task.file_id, self.shard_count) == self.shard_index:
+                    plan.add(self.classify(task), asdict(task))
+            
+            class_names = {folder['name'] for folder in class_folders}
+            for key in self.inventory.keys():
+                if key.split('/', 1)[0] not in class_names or key in drive_keys:
+                    continue
+                if shard_for(key, self.shard_count) == self.shard_index:
+                    plan.add_orphan(key, self.inventory.get(key).size)
+            
+            plan.estimate_duration(self.manifest.recent_throughput(RECENT_RUNS))
+            plan.save(plan_path)
+            print(plan.summary())
+            logging.info(f"Wrote plan to {plan_path}")
+            return True
+            
+        except Exception as e:
+            logging.error(f"Planning failed: {str(e)}")
+            return False
+            
+        finally:
+            if self.dedup is not None:
+                self.dedup.close()
             self.cleanup()
+
+    def execute_plan(self, plan_path: str) -> bool:
+        """Transfer exactly the new and changed files of a plan, without listing again"""
+        start_time = time.time()
+        success = False
+        
+        try:
+            plan = TransferPlan.load(plan_path)
+            if plan.bucket != self.bucket_name:
+                logging.error(f"Plan is for bucket {plan.bucket}, not {self.bucket_name}")
+                return False
+            # The plan holds only its own shard's files
+            self.shard_index, self.shard_count = plan.shard_index, plan.shard_count
+            if self.packer is not None:
+                self.packer.shard_index = plan.shard_index
+            if self.transform is None and any(task.get('original_key') for task in plan.tasks):
+                logging.error("Plan converts HEIC files to JPEG, run it with --heic-to-jpeg")
+                return False
+
+            logging.info(f"Executing plan from {plan.created_at}: {plan.transfer_files} files")
+            tasks = (
+                FileTask(**{name: value for name, value in task.items() if name != 'action'})
+                for task in plan.tasks
+            )
+            self.run_pipeline(tasks, check_skip=False)
+            self.journal.prune_uploaded()
+            success = True
+            
+        except Exception as e:
+            logging.error(f"Transfer failed: {str(e)}")
+            
+        finally:
+            self._finish_run(start_time, success)
             
         return success
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Transfer the Google Drive 'Dataset' folder to S3."
+    )
+    parser.add_argument("--shard-index", type=int, default=int(os.getenv('JOB_COMPLETION_INDEX', '0')),
+                        help="Shard handled by this process (default: $JOB_COMPLETION_INDEX or 0)")
+    parser.add_argument("--shard-count", type=int, default=int(os.getenv('SHARD_COUNT', '1')),
+                        help="Total number of shards (default: $SHARD_COUNT or 1)")
+    parser.add_argument("--stats-prefix", default=None,
+                        help="S3 prefix for per-shard stats and the merged summary.json")
+    parser.add_argument("--merge-stats", metavar="PREFIX", default=None,
+                        help="Only merge the per-shard stats under PREFIX and exit")
+    plan_group = parser.add_mutually_exclusive_group()
+    plan_group.add_argument("--plan", metavar="PATH", default=None,
+                            help="Only list Drive and S3, print the diff and an estimated duration, "
+                                 "and write the plan as JSON to PATH")
+    plan_group.add_argument("--execute-plan", metavar="PATH", default=None,
+                            help="Transfer exactly the new and changed files of a plan written by --plan")
+    parser.add_argument("--folder-id", default=os.getenv('DATASET_FOLDER_ID'),
+                        help="Drive folder to transfer instead of the one named 'Dataset' (default: $DATASET_FOLDER_ID)")
+    parser.add_argument("--download-workers", type=int, default=4,
+                        help="Number of concurrent Drive downloads (default: 4)")
+    parser.add_argument("--upload-workers", type=int, default=4,
+                        help="Number of concurrent S3 uploads (default: 4)")
+    parser.add_argument("--queue-size", type=int, default=16,
+                        help="Files buffered between download and upload stages (default: 16)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Stream Drive downloads straight into S3 multipart uploads (no temp files)")
+    parser.add_argument("--part-size-mb", type=int, default=DEFAULT_PART_SIZE // (1024 * 1024),
+                        help="Multipart part size in MiB when streaming (default: 8, minimum: 5)")
+    parser.add_argument("--large-file-mb", type=int, default=DEFAULT_LARGE_FILE_THRESHOLD // (1024 * 1024),
+                        help="Download files of at least this size as parallel Range segments (default: 64)")
+    parser.add_argument("--range-workers", type=int, default=4,
+                        help="Concurrent Range segments / multipart parts per large file (default: 4)")
+    parser.add_argument("--small-file-kb", type=int, default=DEFAULT_SMALL_FILE_THRESHOLD // 1024,
+                        help="Transfer files up to this size in memory with one PUT; 0 disables (default: 1024)")
+    parser.add_argument("--small-file-workers", type=int, default=16,
+                        help="Concurrent small-file transfers (default: 16)")
+    parser.add_argument("--pack", action="store_true",
+                        help="Pack files smaller than --large-file-mb into tar shards per class folder")
+    parser.add_argument("--pack-size-mb", type=int, default=DEFAULT_PACK_SIZE // (1024 * 1024),
+                        help="Target tar shard size in MiB (default: 256)")
+    parser.add_argument("--pack-prefix", default="shards",
+                        help="S3 prefix for tar shards and index files (default: shards)")
+    parser.add_argument("--heic-to-jpeg", action="store_true",
+                        help="Convert HEIC/HEIF files to JPEG during the transfer and upload the .jpg")
+    parser.add_argument("--jpeg-quality", type=int, default=50,
+                        help="JPEG quality for --heic-to-jpeg (1-100, default: 50)")
+    parser.add_argument("--keep-heic", action="store_true",
+                        help="With --heic-to-jpeg, also upload the original HEIC file")
+    parser.add_argument("--transform-processes", type=int, default=None,
+                        help="Processes converting HEIC files (default: CPU count)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Check images for near-duplicates within their class folder by perceptual hash")
+    parser.add_argument("--dedup-distance", type=int, default=4,
+                        help="Largest Hamming distance between 64-bit hashes counted as a duplicate (default: 4)")
+    parser.add_argument("--dedup-action", choices=(SKIP, FLAG), default=SKIP,
+                        help="Leave duplicates out of the bucket, or upload them with duplicate-of metadata (default: skip)")
+    parser.add_argument("--dedup-index", default="image_hashes.db",
+                        help="SQLite index of image hashes (default: image_hashes.db)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only transfer files changed since the last run (Drive Changes API)")
+    parser.add_argument("--state-file", default=".drive_sync_state.json",
+                        help="Local file storing the changes cursor (default: .drive_sync_state.json)")
+    parser.add_argument("--state-s3-key", default=None,
+                        help="Store the changes cursor in this S3 key instead of a local file")
+    parser.add_argument("--manifest", default=".transfer_manifest.db",
+                        help="SQLite manifest of transferred files (default: .transfer_manifest.db)")
+    parser.add_argument("--journal", default=".transfer_journal.db",
+                        help="SQLite checkpoint journal for resuming interrupted runs (default: .transfer_journal.db)")
+    parser.add_argument("--drive-rate", type=float, default=100.0,
+                        help="Maximum Drive API calls per second (default: 100)")
+    parser.add_argument("--s3-rate", type=float, default=500.0,
+                        help="Maximum S3 API calls per second (default: 500)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on http://0.0.0.0:PORT/metrics while running")
+    parser.add_argument("--drive-endpoint", default=os.getenv('DRIVE_ENDPOINT_URL'),
+                        help="Drive-compatible server to use instead of Google (default: $DRIVE_ENDPOINT_URL)")
+    parser.add_argument("--s3-endpoint", default=os.getenv('S3_ENDPOINT_URL'),
+                        help="S3 endpoint URL, e.g. LocalStack (default: $S3_ENDPOINT_URL)")
+    parser.add_argument("--progress", default=None,
+                        help="Rewrite a JSON progress snapshot (files done, bytes/s, ETA, stage) in this file every second")
+    parser.add_argument("--report", default=None,
+                        help="Write a JSON run report (per-stage throughput, latency, retries, queue depths) to this file")
+    args = parser.parse_args()
+    
     # Load environment variables
     load_dotenv()
     
@@ -260,14 +1548,78 @@ def main():
     service_account_file = os.getenv('SERVICE_ACCOUNT_FILE')
     bucket_name = os.getenv('BUCKET_NAME', 'project-chocolate')
     
-    if not service_account_file:
+    if args.merge_stats:
+        s3_client = boto3.client(
+            's3',
+            aws_access_key_id=os.getenv('Accesskey'),
+            aws_secret_access_key=os.getenv('Secretaccesskey'),
+            region_name="us-east-1",
+            endpoint_url=args.s3_endpoint
+        )
+        summary = merge_shard_stats(s3_client, bucket_name, args.merge_stats)
+        print(json.dumps(summary, indent=2))
+        return 0 if summary['success'] else 1
+    
+    if not service_account_file and not args.drive_endpoint:
         logging.error("SERVICE_ACCOUNT_FILE environment variable not set")
         return 1
     
     try:
+        heic_transform = None
+        if args.heic_to_jpeg:
+            heic_transform = HeicTransform(
+                quality=args.jpeg_quality,
+                processes=args.transform_processes,
+                keep_original=args.keep_heic
+            )
+        
+        image_dedup = None
+        if args.dedup:
+            image_dedup = ImageDeduplicator(
+                args.dedup_index, max_distance=args.dedup_distance, action=args.dedup_action
+            )
+        
         # Initialize and run transfer
-        transfer = DriveToS3Transfer(service_account_file, bucket_name)
-        success = transfer.transfer_files()
+        transfer = DriveToS3Transfer(
+            service_account_file,
+            bucket_name,
+            download_workers=args.download_workers,
+            upload_workers=args.upload_workers,
+            queue_size=args.queue_size,
+            streaming=args.streaming,
+            part_size=args.part_size_mb * 1024 * 1024,
+            incremental=args.incremental,
+            state_file=args.state_file,
+            state_s3_key=args.state_s3_key,
+            manifest_path=args.manifest,
+            journal_path=args.journal,
+            drive_rate=args.drive_rate,
+            s3_rate=args.s3_rate,
+            shard_index=args.shard_index,
+            shard_count=args.shard_count,
+            stats_prefix=args.stats_prefix,
+            metrics_port=args.metrics_port,
+            report_path=args.report,
+            drive_endpoint=args.drive_endpoint,
+            s3_endpoint=args.s3_endpoint,
+            large_file_threshold=args.large_file_mb * 1024 * 1024,
+            range_workers=args.range_workers,
+            small_file_threshold=args.small_file_kb * 1024,
+            small_file_workers=args.small_file_workers,
+            pack=args.pack,
+            pack_size=args.pack_size_mb * 1024 * 1024,
+            pack_prefix=args.pack_prefix,
+            heic_transform=heic_transform,
+            image_dedup=image_dedup,
+            root_folder_id=args.folder_id,
+            progress_path=args.progress
+        )
+        if args.plan:
+            success = transfer.plan_transfer(args.plan)
+        elif args.execute_plan:
+            success = transfer.execute_plan(args.execute_plan)
+        else:
+            success = transfer.transfer_files()
         
         return 0 if success else 1
         
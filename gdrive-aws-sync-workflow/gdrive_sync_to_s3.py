@@ -15,13 +15,14 @@ from google.oauth2 import service_account
 #import aws libs
 import boto3
 import json
-from botocore.exceptions import ClientError
 #import localstack_client.session as boto3
 
 from typing import List, Set, Dict, Tuple
 
 from dotenv import load_dotenv
 
+from s3_inventory import S3Inventory
+
 load_dotenv()
 
 
@@ -72,16 +73,22 @@ def get_image_classes(service, drive_id: str) -> List:
                                            pageSize=10, fields="nextPageToken, files(id, name)").execute()
     return query_for_files.get('files', [])                                        
 
-def process_image_class(service, list_of_class_folders: List) -> None:
+def process_image_class(service, list_of_class_folders: List, inventory: S3Inventory) -> None:
 
     for folder in list_of_class_folders:
         response = service.files().list(q = "'" + folder['id'] + "' in parents",
-                                       pageSize=10,fields="nextPageToken, files(id, name)").execute()
+                                       pageSize=10,fields="nextPageToken, files(id, name, size)").execute()
         chocolate_images  = response.get('files',[])
 
         for img in chocolate_images:
-            score_folders = service.files().get_media(fileId=img['id'])
             score_name = f'{img["name"]}'
+            file_path = os.path.join(folder['name'], score_name)
+            # check the bucket index before downloading anything
+            size = int(img['size']) if 'size' in img else None
+            if inventory.contains(file_path, size):
+                continue
+
+            score_folders = service.files().get_media(fileId=img['id'])
             with open(score_name,'wb') as chocolate_image: 
                 downloader = MediaIoBaseDownload(chocolate_image, score_folders)
                 done = False
@@ -89,13 +96,7 @@ def process_image_class(service, list_of_class_folders: List) -> None:
                     status, done = downloader.next_chunk()
                     if status:
                         print("Download %d%%." % int(status.progress() * 100))
-                    file_path = os.path.join(folder['name'], score_name)
-                    # lets add a check here before we upload
-                    try:
-                         s3_client.head_object(Bucket=BUCKET_NAME, Key=file_path)
-                    except ClientError as e:
-                        if e.response['Error']['Code'] == '404' or e.response['Error']['Code'] == 'NoSuchKey':
-                            s3_client.upload_file(score_name, BUCKET_NAME, file_path)
+            s3_client.upload_file(score_name, BUCKET_NAME, file_path)
 
     print("Upload Complete!")
 
@@ -106,5 +107,6 @@ if __name__ == "__main__":
     service = build("drive", "v3", credentials=creds)
     drive_id = get_drive_id(service)
     list_of_class_folders = get_image_classes(service, drive_id)
-    process_image_class = process_image_class(service, list_of_class_folders)
+    inventory = S3Inventory(s3_client, BUCKET_NAME).load()
+    process_image_class = process_image_class(service, list_of_class_folders, inventory)
     print('This Job took', time.time()-start, 'seconds.')
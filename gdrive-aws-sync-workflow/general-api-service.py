@@ -1,14 +1,28 @@
 import os
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Query
-from fastapi.responses import JSONResponse
-from typing import Dict, List, Optional
+import json
+import shlex
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Callable, Dict, List, Optional, Union
 import uvicorn
 from datetime import datetime
 from pydantic import BaseModel
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from drive_batch import build_path, resolve_ancestors
+from drive_index import DriveIndex, DriveIndexer
+from drive_executor import DriveBusy, DriveCallTimeout, DriveExecutor, check_deadline
+from job_queue import DRIVE_ID_PATTERN, Job, JobStore, JobWorkerPool
+from progress_stream import ProgressHub, format_sse
+from metadata_cache import ANY_FOLDER, FOLDER_MIME_TYPE, MISSING, ChangePoller, MetadataCache
+from drive_transport import build_drive_service
+from throttle import ApiThrottle
+from transfer_metrics import MetricsRegistry
+
 class FolderItem(BaseModel):
     id: str
     name: str
@@ -17,221 +31,559 @@ class FolderItem(BaseModel):
     modifiedTime: Optional[str] = None
     size: Optional[str] = None
 
+class FolderPage(BaseModel):
+    items: List[FolderItem]
+    next_page_token: Optional[str] = None
+
 class TransferStatus(BaseModel):
+    job_id: str
+    folder_id: Optional[str] = None
+    priority: int = 0
     status: str
-    start_time: str
+    created_at: str
+    start_time: Optional[str] = None
     end_time: Optional[str] = None
+    cancel_requested: bool = False
     stats: Optional[Dict] = None
+    progress: Optional[Dict] = None
     error: Optional[str] = None
 
+    @classmethod
+    def from_job(cls, job: Job) -> "TransferStatus":
+        def iso(timestamp: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+        
+        return cls(
+            job_id=job.id,
+            folder_id=job.folder_id,
+            priority=job.priority,
+            status=job.status,
+            created_at=iso(job.created_at),
+            start_time=iso(job.started_at),
+            end_time=iso(job.finished_at),
+            cancel_requested=job.cancel_requested,
+            stats=job.stats,
+            progress=job.progress,
+            error=job.error
+        )
+
+FOLDER_FIELDS = "nextPageToken, files(id, name, mimeType, modifiedTime)"
+CONTENTS_FIELDS = "nextPageToken, files(id, name, mimeType, modifiedTime, size)"
+DEFAULT_PAGE_SIZE = 100
+# Drive's largest files.list page
+MAX_PAGE_SIZE = 1000
+# Page tokens of listings served from the local index carry this prefix and an offset
+LOCAL_TOKEN_PREFIX = "local:"
+
+def folder_item(file: dict) -> FolderItem:
+    """Build a ``FolderItem`` from Drive (or index) file metadata"""
+    return FolderItem(
+        id=file['id'],
+        name=file['name'],
+        type='folder' if file['mimeType'] == FOLDER_MIME_TYPE else 'file',
+        mimeType=file['mimeType'],
+        modifiedTime=file.get('modifiedTime'),
+        size=file.get('size')
+    )
+
 class DriveService:
     SCOPES = [
         "https://www.googleapis.com/auth/drive.metadata.readonly",
         "https://www.googleapis.com/auth/drive.readonly",
     ]
 
-    def __init__(self, service_account_file: str):
-        self.credentials = service_account.Credentials.from_service_account_file(
-            service_account_file, scopes=self.SCOPES
+    def __init__(self, service_account_file: Optional[str], endpoint: Optional[str] = None):
+        """
+        Args:
+            service_account_file (Optional[str]): Service account key; may be None with ``endpoint``
+            endpoint (Optional[str]): Base URL of a Drive-compatible server, e.g.
+                ``benchmarks/fake_drive_server.py``, used instead of Google's
+        """
+        if service_account_file:
+            self.credentials = service_account.Credentials.from_service_account_file(
+                service_account_file, scopes=self.SCOPES
+            )
+        elif endpoint:
+            self.credentials = AnonymousCredentials()
+        else:
+            raise ValueError("a service account file is required without a Drive endpoint")
+        # Thread-safe: requests handled concurrently each use their own connection
+        if endpoint:
+            self.service = build_drive_service(
+                self.credentials,
+                discovery_service_url=f"{endpoint.rstrip('/')}/discovery/v1/apis/{{api}}/{{apiVersion}}/rest"
+            )
+        else:
+            self.service = build_drive_service(self.credentials)
+        # Retries rate-limited/transient Drive errors with backoff and AIMD
+        self.api = ApiThrottle(
+            "Drive",
+            rate=float(os.getenv('DRIVE_RATE_LIMIT', '100')),
+            max_concurrency=int(os.getenv('DRIVE_MAX_CONCURRENCY', '8'))
+        )
+        self.registry = MetricsRegistry()
+        ttl = float(os.getenv('DRIVE_CACHE_TTL', '300'))
+        # Listings keyed on their parameters, and {id, name, parents} per node for paths
+        self.listings = MetadataCache(
+            "listings", max_entries=int(os.getenv('DRIVE_CACHE_LISTINGS', '1000')), ttl=ttl, registry=self.registry
         )
-        self.service = build("drive", "v3", credentials=self.credentials)
+        self.nodes = MetadataCache(
+            "nodes", max_entries=int(os.getenv('DRIVE_CACHE_NODES', '50000')), ttl=ttl, registry=self.registry
+        )
+        self.change_poller: Optional[ChangePoller] = None
+        self.index: Optional[DriveIndex] = None
+        self.indexer: Optional[DriveIndexer] = None
 
-    def list_folders(self, parent_id: Optional[str] = None, query: Optional[str] = None) -> List[FolderItem]:
+    def start_change_poller(self, interval: float) -> None:
+        """Invalidate cached entries from the Drive changes feed every ``interval`` seconds"""
+        self.change_poller = ChangePoller(
+            self.service, [self.listings, self.nodes], interval=interval, execute=self.api.execute
+        )
+        self.change_poller.start()
+
+    def start_indexer(self, db_path: str, interval: float) -> None:
+        """
+        Mirror Drive metadata into a local index, synced every ``interval`` seconds.
+        
+        Once the first crawl has finished, searches, listings and paths are
+        served from the index; until then they go to Drive as before.
+        """
+        self.index = DriveIndex(db_path)
+        self.indexer = DriveIndexer(self.service, self.index, interval=interval, execute=self.api.execute)
+        self.indexer.start()
+
+    def _local(self) -> Optional[DriveIndex]:
+        """The index, if it is complete enough to answer instead of Drive"""
+        if self.index is not None and self.index.ready:
+            return self.index
+        return None
+
+    def _local_page(self, fetch: Callable[[int, int], List[dict]], page_token: Optional[str],
+                    page_size: int) -> FolderPage:
+        """One page of an index query; ``fetch(offset, limit)`` returns the rows"""
         try:
-            # Base query for folders
-            if query:
-                base_query = f"mimeType = 'application/vnd.google-apps.folder' and name contains '{query}'"
-            else:
-                base_query = "mimeType = 'application/vnd.google-apps.folder'"
-            
-            # Add parent folder condition if specified
-            if parent_id:
-                base_query += f" and '{parent_id}' in parents"
-            
-            items = []
-            page_token = None
-            
-            while True:
-                results = self.service.files().list(
-                    q=base_query,
-                    spaces='drive',
-                    fields="nextPageToken, files(id, name, mimeType, modifiedTime)",
-                    pageToken=page_token,
-                    pageSize=100
-                ).execute()
-                
-                for item in results.get('files', []):
-                    items.append(FolderItem(
-                        id=item['id'],
-                        name=item['name'],
-                        type='folder',
-                        mimeType=item['mimeType'],
-                        modifiedTime=item.get('modifiedTime')
-                    ))
-                
-                page_token = results.get('nextPageToken')
-                if not page_token:
-                    break
-                    
-            return items
-            
-        except HttpError as error:
-            raise HTTPException(status_code=500, detail=f"Google Drive API error: {str(error)}")
+            offset = int(page_token[len(LOCAL_TOKEN_PREFIX):]) if page_token else 0
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid or expired page_token")
+        # One extra row tells whether there is a next page
+        rows = fetch(offset, page_size + 1)
+        next_page_token = f"{LOCAL_TOKEN_PREFIX}{offset + page_size}" if len(rows) > page_size else None
+        return FolderPage(items=[folder_item(row) for row in rows[:page_size]], next_page_token=next_page_token)
 
-    def list_folder_contents(self, folder_id: str, file_types: Optional[List[str]] = None) -> List[FolderItem]:
+    def _use_index(self, page_token: Optional[str]) -> Optional[DriveIndex]:
+        # A listing stays on the backend it started on
+        if page_token and page_token.startswith(LOCAL_TOKEN_PREFIX):
+            if self.index is None:
+                raise HTTPException(status_code=400, detail="Invalid or expired page_token")
+            return self.index
+        return None if page_token else self._local()
+
+    def index_stats(self) -> dict:
+        if self.index is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.index.stats()}
+
+    def cache_stats(self) -> Dict[str, dict]:
+        return {'listings': self.listings.stats(), 'nodes': self.nodes.stats()}
+
+    def _folders_query(self, parent_id: Optional[str], query: Optional[str]) -> str:
+        # Base query for folders
+        if query:
+            base_query = f"mimeType = '{FOLDER_MIME_TYPE}' and name contains '{query}'"
+        else:
+            base_query = f"mimeType = '{FOLDER_MIME_TYPE}'"
+        
+        # Add parent folder condition if specified
+        if parent_id:
+            base_query += f" and '{parent_id}' in parents"
+        return base_query
+
+    def _contents_query(self, folder_id: str, file_types: Optional[List[str]]) -> str:
+        query = f"'{folder_id}' in parents"
+        
+        # Add file type filter if specified
+        if file_types:
+            mime_types = [f"mimeType = '{mime}'" for mime in file_types]
+            query += f" and ({' or '.join(mime_types)})"
+        return query
+
+    def _fetch_page(self, q: str, fields: str, page_token: Optional[str], page_size: int) -> FolderPage:
+        """Fetch one Drive page; ``page_token`` is Drive's own ``nextPageToken``"""
         try:
-            query = f"'{folder_id}' in parents"
-            
-            # Add file type filter if specified
-            if file_types:
-                mime_types = [f"mimeType = '{mime}'" for mime in file_types]
-                query += f" and ({' or '.join(mime_types)})"
-            
-            items = []
-            page_token = None
-            
-            while True:
-                results = self.service.files().list(
-                    q=query,
-                    spaces='drive',
-                    fields="nextPageToken, files(id, name, mimeType, modifiedTime, size)",
-                    pageToken=page_token,
-                    pageSize=100
-                ).execute()
-                
-                for item in results.get('files', []):
-                    item_type = 'folder' if item['mimeType'] == 'application/vnd.google-apps.folder' else 'file'
-                    items.append(FolderItem(
-                        id=item['id'],
-                        name=item['name'],
-                        type=item_type,
-                        mimeType=item['mimeType'],
-                        modifiedTime=item.get('modifiedTime'),
-                        size=item.get('size')
-                    ))
-                
-                page_token = results.get('nextPageToken')
-                if not page_token:
-                    break
-                    
-            return items
-            
+            results = self.api.execute(self.service.files().list(
+                q=q,
+                spaces='drive',
+                fields=fields,
+                pageToken=page_token,
+                pageSize=page_size
+            ))
         except HttpError as error:
+            if page_token and error.resp.status == 400:
+                raise HTTPException(status_code=400, detail="Invalid or expired page_token")
             raise HTTPException(status_code=500, detail=f"Google Drive API error: {str(error)}")
+        
+        items = [folder_item(item) for item in results.get('files', [])]
+        return FolderPage(items=items, next_page_token=results.get('nextPageToken'))
+
+    def _cached_page(self, key: tuple, tag: str, q: str, fields: str,
+                     page_token: Optional[str], page_size: int) -> FolderPage:
+        key = key + (page_token, page_size)
+        cached = self.listings.get(key)
+        if cached is not MISSING:
+            return cached
+        generation = self.listings.generation
+        page = self._fetch_page(q, fields, page_token, page_size)
+        # Children are tags too, so moving one out of the folder invalidates the page
+        self.listings.put(key, page, [tag] + [item.id for item in page.items], generation)
+        return page
+
+    def _list_all(self, key: tuple, tag: str, q: str, fields: str) -> List[FolderItem]:
+        cached = self.listings.get(key)
+        if cached is not MISSING:
+            return list(cached)
+        generation = self.listings.generation
+        
+        items = []
+        page_token = None
+        while True:
+            page = self._fetch_page(q, fields, page_token, 100)
+            items.extend(page.items)
+            page_token = page.next_page_token
+            if not page_token:
+                break
+            check_deadline()
+        
+        self.listings.put(key, items, [tag] + [item.id for item in items], generation)
+        return list(items)
+
+    def list_folders(self, parent_id: Optional[str] = None, query: Optional[str] = None) -> List[FolderItem]:
+        index = self._local()
+        if index is not None:
+            return [folder_item(row) for row in index.search(query, parent_id)]
+        # Without a parent, any folder created or renamed anywhere can change the result
+        return self._list_all(
+            ('folders', parent_id, query), parent_id or ANY_FOLDER,
+            self._folders_query(parent_id, query), FOLDER_FIELDS
+        )
+
+    def list_folder_contents(self, folder_id: str, file_types: Optional[List[str]] = None) -> List[FolderItem]:
+        index = self._local()
+        if index is not None:
+            return [folder_item(row) for row in index.children(folder_id, file_types)]
+        return self._list_all(
+            ('contents', folder_id, tuple(sorted(file_types or ()))), folder_id,
+            self._contents_query(folder_id, file_types), CONTENTS_FIELDS
+        )
+
+    def folders_page(self, parent_id: Optional[str] = None, query: Optional[str] = None,
+                     page_token: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE) -> FolderPage:
+        """One page of ``list_folders``; pass ``next_page_token`` back for the next one"""
+        index = self._use_index(page_token)
+        if index is not None:
+            return self._local_page(
+                lambda offset, limit: index.search(query, parent_id, offset=offset, limit=limit),
+                page_token, page_size
+            )
+        return self._cached_page(
+            ('folders-page', parent_id, query), parent_id or ANY_FOLDER,
+            self._folders_query(parent_id, query), FOLDER_FIELDS, page_token, page_size
+        )
+
+    def contents_page(self, folder_id: str, file_types: Optional[List[str]] = None,
+                      page_token: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE) -> FolderPage:
+        """One page of ``list_folder_contents``; pass ``next_page_token`` back for the next one"""
+        index = self._use_index(page_token)
+        if index is not None:
+            return self._local_page(
+                lambda offset, limit: index.children(folder_id, file_types, offset=offset, limit=limit),
+                page_token, page_size
+            )
+        return self._cached_page(
+            ('contents-page', folder_id, tuple(sorted(file_types or ()))), folder_id,
+            self._contents_query(folder_id, file_types), CONTENTS_FIELDS, page_token, page_size
+        )
 
     def get_folder_path(self, folder_id: str) -> List[Dict[str, str]]:
+        return self.get_folder_paths([folder_id])[folder_id]
+
+    def get_folder_paths(self, folder_ids: List[str]) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Resolve many ancestor chains, from the local index where it has them.
+        
+        Where a chain leaves the index (at the never-listed "My Drive" root,
+        or for files not indexed yet) the rest is resolved from Drive.
+        """
+        index = self._local()
+        if index is None:
+            return self._drive_paths(folder_ids)
+        
+        local = {folder_id: index.path(folder_id) for folder_id in folder_ids}
+        missing = list({top_id for _, top_id in local.values() if top_id})
+        remote = self._drive_paths(missing) if missing else {}
+        return {
+            folder_id: (remote[top_id] if top_id else []) + path
+            for folder_id, (path, top_id) in local.items()
+        }
+
+    def _drive_paths(self, folder_ids: List[str]) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Resolve many ancestor chains, fetching each tree level with one batch request.
+        
+        Nodes are memoized individually, so chains sharing parents fetch
+        those parents once, and a later request only fetches what is new.
+        """
+        def cached(node_id: str) -> Optional[dict]:
+            node = self.nodes.get(node_id)
+            if node is MISSING:
+                return None
+            from_cache.add(node_id)
+            return node
+        
+        from_cache = set()
+        generation = self.nodes.generation
         try:
-            path = []
-            current_id = folder_id
-            
-            while current_id:
-                try:
-                    folder = self.service.files().get(
-                        fileId=current_id,
-                        fields="id, name, parents"
-                    ).execute()
-                    
-                    path.insert(0, {
-                        "id": folder["id"],
-                        "name": folder["name"]
-                    })
-                    
-                    # Get parent folder ID
-                    current_id = folder.get("parents", [None])[0]
-                    
-                except HttpError as e:
-                    if e.resp.status == 404:
-                        break
-                    raise
-                    
-            return path
+            nodes = resolve_ancestors(self.service, folder_ids, execute=self.api.execute, cached=cached)
+            for node_id, node in nodes.items():
+                # Ids Drive did not return ({}) are not cached
+                if node and node_id not in from_cache:
+                    self.nodes.put(node_id, node, [node_id], generation)
+            return {folder_id: build_path(folder_id, nodes) for folder_id in folder_ids}
             
         except HttpError as error:
             raise HTTPException(status_code=500, detail=f"Google Drive API error: {str(error)}")
 
 app = FastAPI(title="Drive Explorer and Transfer API")
 
-# Store running jobs and their status
-jobs: Dict[str, TransferStatus] = {}
+# Transfer jobs persist in SQLite and are run by a worker pool, in this
+# process or in separate `python job_queue.py` processes sharing the database.
+# Store calls can wait on the database lock, so handlers run them in a thread
+job_store = JobStore(os.getenv('JOB_DB', 'jobs.db'))
+job_pool: Optional[JobWorkerPool] = None
+# One store read per watched job per interval, however many clients subscribe
+progress_hub = ProgressHub(job_store, interval=float(os.getenv('PROGRESS_INTERVAL', '1')))
 
 # Initialize Drive service
 drive_service = None
 
+# Blocking Drive calls run here, off the event loop
+drive_calls = DriveExecutor(
+    max_workers=int(os.getenv('DRIVE_WORKERS', '8')),
+    max_waiting=int(os.getenv('DRIVE_MAX_WAITING', '64')),
+    timeout=float(os.getenv('DRIVE_TIMEOUT', '30')),
+    queue_timeout=float(os.getenv('DRIVE_QUEUE_TIMEOUT', '5'))
+)
+
 @app.on_event("startup")
 async def startup_event():
     global drive_service
-    service_account_file = os.getenv('SERVICE_ACCOUNT_FILE', '/app/secrets/google-service-account.json')
-    drive_service = DriveService(service_account_file)
+    # DRIVE_ENDPOINT_URL points the API at another Drive server, e.g. the fake one used for load tests
+    drive_endpoint = os.getenv('DRIVE_ENDPOINT_URL')
+    service_account_file = os.getenv(
+        'SERVICE_ACCOUNT_FILE', None if drive_endpoint else '/app/secrets/google-service-account.json'
+    )
+    drive_service = DriveService(service_account_file, endpoint=drive_endpoint)
+    
+    global job_pool
+    job_workers = int(os.getenv('JOB_WORKERS', '2'))
+    if job_workers > 0:
+        job_pool = JobWorkerPool(
+            job_store,
+            max_running=job_workers,
+            # Only 1 is supported; anything else fails startup instead of sharing folder state
+            per_folder=int(os.getenv('JOB_FOLDER_CONCURRENCY', '1')),
+            workdir=os.getenv('JOB_WORKDIR', 'jobs'),
+            transfer_args=shlex.split(os.getenv('JOB_TRANSFER_ARGS', ''))
+        )
+        job_pool.start()
+    
+    poll_interval = float(os.getenv('DRIVE_CACHE_POLL_SECONDS', '30'))
+    if poll_interval > 0:
+        drive_service.start_change_poller(poll_interval)
+    
+    index_db = os.getenv('DRIVE_INDEX_DB')
+    if index_db:
+        drive_service.start_indexer(index_db, float(os.getenv('DRIVE_INDEX_POLL_SECONDS', '30')))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if job_pool is not None:
+        # Running transfers are stopped and requeued, to resume on the next start
+        job_pool.stop()
+    if drive_service is not None and drive_service.change_poller is not None:
+        drive_service.change_poller.stop()
+    if drive_service is not None and drive_service.indexer is not None:
+        drive_service.indexer.stop()
+    drive_calls.shutdown()
+
+@app.exception_handler(DriveBusy)
+async def drive_busy_handler(request: Request, exc: DriveBusy):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(DriveCallTimeout)
+async def drive_timeout_handler(request: Request, exc: DriveCallTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 @app.get("/")
 async def root():
-    return {"status": "alive", "service": "Drive Explorer and Transfer API"}
+    return {"status": "alive", "service": "Drive Explorer and Transfer API", "drive": drive_calls.stats()}
 
-@app.get("/folders", response_model=List[FolderItem])
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metadata cache hit/miss counters in the Prometheus text format."""
+    return drive_service.registry.render()
+
+@app.get("/cache")
+async def cache_stats():
+    """Entries, hits, misses and hit rate of the metadata caches."""
+    return drive_service.cache_stats()
+
+@app.get("/index")
+async def index_stats():
+    """State of the local metadata index: whether it serves requests, its size and last sync."""
+    return drive_service.index_stats()
+
+async def stream_pages(fetch_page: Callable[[Optional[str]], FolderPage], page_token: Optional[str]) -> StreamingResponse:
+    """
+    Stream every page as NDJSON, one item per line, as Drive returns them.
+    
+    The first page is fetched before the response starts, so its errors
+    still get a proper status code. A later failure ends the stream with an
+    ``{"error": ..., "page_token": ...}`` line; the token resumes the listing.
+    """
+    first = await drive_calls.run(fetch_page, page_token)
+    
+    async def lines():
+        page = first
+        while True:
+            yield "".join(json.dumps(jsonable_encoder(item)) + "\n" for item in page.items)
+            token = page.next_page_token
+            if not token:
+                return
+            try:
+                page = await drive_calls.run(fetch_page, token)
+            except (HTTPException, DriveBusy, DriveCallTimeout) as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                yield json.dumps({"error": detail, "page_token": token}) + "\n"
+                return
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/folders", response_model=Union[List[FolderItem], FolderPage])
 async def list_folders(
     parent_id: Optional[str] = None,
-    query: Optional[str] = None
+    query: Optional[str] = None,
+    page_token: Optional[str] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False
 ):
-    """List folders in Google Drive. Optionally filter by parent folder or search query."""
-    return drive_service.list_folders(parent_id, query)
+    """
+    List folders in Google Drive. Optionally filter by parent folder or search query.
+    
+    With ``page_size`` or ``page_token`` one page is returned as ``{items, next_page_token}``;
+    with ``stream=true`` all items are streamed as NDJSON.
+    """
+    if stream:
+        return await stream_pages(
+            lambda token: drive_service.folders_page(parent_id, query, token, page_size or MAX_PAGE_SIZE),
+            page_token
+        )
+    if page_token or page_size:
+        return await drive_calls.run(
+            drive_service.folders_page, parent_id, query, page_token, page_size or DEFAULT_PAGE_SIZE
+        )
+    return await drive_calls.run(drive_service.list_folders, parent_id, query)
 
-@app.get("/folders/{folder_id}/contents", response_model=List[FolderItem])
+@app.get("/folders/{folder_id}/contents", response_model=Union[List[FolderItem], FolderPage])
 async def get_folder_contents(
     folder_id: str,
-    file_types: Optional[List[str]] = Query(None)
+    file_types: Optional[List[str]] = Query(None),
+    page_token: Optional[str] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False
 ):
-    """List contents of a specific folder."""
-    return drive_service.list_folder_contents(folder_id, file_types)
+    """
+    List contents of a specific folder.
+    
+    Supports the same ``page_size``/``page_token`` pagination and ``stream=true``
+    NDJSON mode as ``/folders``.
+    """
+    if stream:
+        return await stream_pages(
+            lambda token: drive_service.contents_page(folder_id, file_types, token, page_size or MAX_PAGE_SIZE),
+            page_token
+        )
+    if page_token or page_size:
+        return await drive_calls.run(
+            drive_service.contents_page, folder_id, file_types, page_token, page_size or DEFAULT_PAGE_SIZE
+        )
+    return await drive_calls.run(drive_service.list_folder_contents, folder_id, file_types)
+
+@app.get("/folders/paths")
+async def get_folder_paths(ids: List[str] = Query(...)):
+    """Get the full paths of several folders at once."""
+    return await drive_calls.run(drive_service.get_folder_paths, ids)
 
 @app.get("/folders/{folder_id}/path")
 async def get_folder_path(folder_id: str):
     """Get the full path to a folder."""
-    return drive_service.get_folder_path(folder_id)
+    return await drive_calls.run(drive_service.get_folder_path, folder_id)
 
 @app.post("/transfer")
-async def start_transfer(background_tasks: BackgroundTasks, folder_id: Optional[str] = None) -> Dict:
-    """Start a transfer job for a specific folder or the default Dataset folder."""
-    job_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    jobs[job_id] = TransferStatus(
-        status="starting",
-        start_time=datetime.now().isoformat()
-    )
-
-    background_tasks.add_task(run_transfer, job_id, folder_id)
+async def start_transfer(folder_id: Optional[str] = None, priority: int = 0) -> Dict:
+    """Queue a transfer job for a specific folder or the default Dataset folder. Higher priorities run first."""
+    if folder_id is not None and not DRIVE_ID_PATTERN.match(folder_id):
+        raise HTTPException(status_code=422, detail="folder_id must be a Drive id")
+    job = await run_in_threadpool(job_store.create, folder_id, priority)
     
     return {
-        "job_id": job_id,
-        "status": "started",
-        "message": "Transfer job started"
+        "job_id": job.id,
+        "status": job.status,
+        "message": "Transfer job queued"
     }
 
 @app.get("/status/{job_id}", response_model=TransferStatus)
 async def get_status(job_id: str):
     """Get the status of a specific transfer job."""
-    if job_id not in jobs:
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return jobs[job_id]
+    return TransferStatus.from_job(job)
 
-@app.get("/jobs")
-async def list_jobs():
-    """List all transfer jobs."""
-    return {"jobs": jobs}
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream a job's progress as server-sent events until it finishes.
+    
+    Each ``progress`` event carries the status, files done and total, bytes/s,
+    ETA and the busiest stage. Events are sent at most every ``PROGRESS_INTERVAL``
+    seconds, and only when something changed.
+    """
+    if await run_in_threadpool(job_store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        async for event in progress_hub.subscribe(job_id):
+            yield format_sse(event)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-async def run_transfer(job_id: str, folder_id: Optional[str] = None):
-    try:
-        jobs[job_id].status = "running"
-        
-        # Your existing transfer logic here
-        # Use folder_id if provided, otherwise find Dataset folder
-        
-        jobs[job_id].status = "completed"
-        jobs[job_id].end_time = datetime.now().isoformat()
-        
-    except Exception as e:
-        jobs[job_id].status = "failed"
-        jobs[job_id].end_time = datetime.now().isoformat()
-        jobs[job_id].error = str(e)
+@app.post("/jobs/{job_id}/cancel", response_model=TransferStatus)
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or stop a running one."""
+    job = await run_in_threadpool(job_store.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return TransferStatus.from_job(job)
+
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    """List transfer jobs, most recent first, optionally only those in one status."""
+    jobs = await run_in_threadpool(job_store.list, status, limit)
+    return {"jobs": {job.id: TransferStatus.from_job(job) for job in jobs}}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', '8000')))
@@ -0,0 +1,87 @@
+import importlib.util
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Optional
+
+HEIC_EXTENSIONS = ('.heic', '.heif')
+# heic-converter/heic-converter.py next to this directory in the repository
+DEFAULT_CONVERTER_PATH = Path(__file__).resolve().parent.parent / "heic-converter" / "heic-converter.py"
+
+def load_converter(path: str):
+    """
+    Import ``heic-converter.py`` from its path (the hyphenated name is not importable).
+
+    Raises:
+        ImportError: If the file is missing or Pillow/pillow-heif are not installed
+    """
+    if not Path(path).is_file():
+        raise ImportError(f"HEIC converter not found at {path} (set HEIC_CONVERTER_PATH)")
+    spec = importlib.util.spec_from_file_location("heic_converter", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Converter module of a pool process, loaded once by the initializer
+_converter = None
+
+def _init_worker(path: str) -> None:
+    global _converter
+    _converter = load_converter(path)
+    _converter.register_heif_opener()
+
+def _convert(data: bytes, quality: int) -> bytes:
+    return _converter.convert_heic_bytes(data, quality)
+
+class HeicTransform:
+    """
+    Convert HEIC files to JPEG in memory while they are being transferred.
+
+    Decoding is CPU-bound, so conversions run in a process pool; the
+    conversion itself is ``convert_heic_bytes`` from ``heic-converter.py``.
+    """
+
+    def __init__(self, quality: int = 50, processes: Optional[int] = None,
+                 keep_original: bool = False, converter_path: Optional[str] = None):
+        """
+        Args:
+            quality (int): Output JPG quality (1-100)
+            processes (Optional[int]): Conversion processes (default: CPU count)
+            keep_original (bool): Also upload the HEIC file under its own key
+            converter_path (Optional[str]): Path of ``heic-converter.py``
+                (default: $HEIC_CONVERTER_PATH or the copy in this repository)
+        """
+        self.quality = quality
+        self.processes = processes or os.cpu_count() or 1
+        self.keep_original = keep_original
+        self.converter_path = str(converter_path or os.getenv('HEIC_CONVERTER_PATH') or DEFAULT_CONVERTER_PATH)
+        # Fail at startup rather than on the first HEIC file
+        load_converter(self.converter_path)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def applies(name: str) -> bool:
+        return name.lower().endswith(HEIC_EXTENSIONS)
+
+    @staticmethod
+    def output_key(s3_key: str) -> str:
+        """S3 key of the JPEG written for a HEIC file's key"""
+        return str(PurePosixPath(s3_key).with_suffix('.jpg'))
+
+    def convert(self, data: bytes) -> bytes:
+        """Convert HEIC bytes to JPEG bytes on the process pool, blocking until done"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, initializer=_init_worker, initargs=(self.converter_path,)
+                )
+            pool = self._pool
+        return pool.submit(_convert, data, self.quality).result()
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,239 @@
+import io
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp', '.heic', '.heif')
+SKIP = "skip"
+FLAG = "flag"
+
+def _register_heif() -> None:
+    """Let Pillow open HEIC files when pillow-heif is installed"""
+    try:
+        from pillow_heif import register_heif_opener
+    except ImportError:
+        return
+    register_heif_opener()
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def dhash(data: bytes, hash_size: int = 8) -> int:
+    """
+    Difference hash of an image: one bit per horizontally adjacent pixel pair.
+
+    The image is reduced to a ``(hash_size + 1) x hash_size`` grayscale
+    thumbnail and each bit records whether a pixel is brighter than its right
+    neighbour, so re-encoding, resizing and small edits flip only a few bits.
+
+    Args:
+        data (bytes): Encoded image
+        hash_size (int): Rows of the thumbnail; the hash has ``hash_size ** 2`` bits
+
+    Returns:
+        int: The hash
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs are decoded at a reduced scale, which is most of the speedup
+        image.draft('L', (hash_size * 8, hash_size * 8))
+        pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = value << 1 | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+class BKTree:
+    """
+    Burkhard-Keller tree of hashes under the Hamming distance.
+
+    A query for distance ``r`` only descends into children whose edge
+    distance is within ``r`` of the query's distance to the node, so most of
+    the tree is never visited. Nodes are ``[hash, item, children]`` lists to
+    keep millions of them affordable.
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def add(self, value: int, item: int) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = [value, item, None]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if node[2] is None:
+                node[2] = {}
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, item, None]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """Return ``(distance, item)`` for every hash within ``max_distance``, closest first"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[1]))
+            if node[2]:
+                for edge, child in node[2].items():
+                    if distance - max_distance <= edge <= distance + max_distance:
+                        stack.append(child)
+        found.sort()
+        return found
+
+    def __len__(self) -> int:
+        return self._size
+
+@dataclass
+class DuplicateMatch:
+    """An already indexed image close to the one being checked"""
+    s3_key: str
+    drive_id: str
+    distance: int
+
+class ImageDeduplicator:
+    """
+    Find near-duplicate images within a class folder by perceptual hash.
+
+    Hashes are kept in a SQLite index, so later runs compare against every
+    image already transferred. Each class folder gets an in-memory BK-tree,
+    built from the index on first use, over the images stored in the bucket;
+    skipped duplicates are indexed but not added to the tree. Safe to share
+    between worker threads.
+    """
+
+    def __init__(self, db_path: str, max_distance: int = 4, action: str = SKIP, hash_size: int = 8):
+        """
+        Args:
+            db_path (str): Path of the SQLite hash index (created if missing)
+            max_distance (int): Largest Hamming distance still counted as a duplicate
+            action (str): ``skip`` to leave duplicates out of the bucket, ``flag``
+                to upload them marked with the key of the image they duplicate
+            hash_size (int): dHash size; the hash has ``hash_size ** 2`` bits
+
+        Raises:
+            ImportError: If Pillow is not installed
+        """
+        if Image is None:
+            raise ImportError("Image deduplication needs Pillow: pip install Pillow")
+        if action not in (SKIP, FLAG):
+            raise ValueError(f"Unknown duplicate action {action!r}")
+        _register_heif()
+        self.max_distance = max_distance
+        self.action = action
+        self.hash_size = hash_size
+        self._trees: Dict[str, BKTree] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_hashes (
+                class_name TEXT NOT NULL,
+                drive_id TEXT NOT NULL,
+                md5 TEXT,
+                s3_key TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                hash_size INTEGER NOT NULL,
+                duplicate_of TEXT,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (class_name, drive_id)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def applies(name: str) -> bool:
+        return name.lower().endswith(IMAGE_EXTENSIONS)
+
+    def _tree(self, class_name: str) -> BKTree:
+        """Return the class folder's tree, loading it from the index on first use (lock held)"""
+        tree = self._trees.get(class_name)
+        if tree is None:
+            tree = BKTree()
+            rows = self._conn.execute(
+                "SELECT rowid, hash FROM image_hashes WHERE class_name = ? AND skipped = 0 AND hash_size = ?",
+                (class_name, self.hash_size)
+            )
+            for rowid, value in rows:
+                tree.add(int(value, 16), rowid)
+            self._trees[class_name] = tree
+            logging.info(f"Class {class_name}: {len(tree)} image hashes loaded")
+        return tree
+
+    def is_skipped(self, class_name: str, drive_id: str, md5: Optional[str]) -> bool:
+        """Whether this version of the file was already left out as a duplicate"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT md5 FROM image_hashes WHERE class_name = ? AND drive_id = ? AND skipped = 1",
+                (class_name, drive_id)
+            ).fetchone()
+        return row is not None and md5 is not None and row[0] == md5
+
+    def check(self, class_name: str, drive_id: str, md5: Optional[str], s3_key: str,
+              data: bytes) -> Optional[DuplicateMatch]:
+        """
+        Hash an image, look for near-duplicates in its class folder and index it.
+
+        Args:
+            class_name (str): Class folder; images are only compared within one
+            drive_id (str): Drive file id
+            md5 (Optional[str]): Drive md5Checksum, so a skipped file is not fetched again
+            s3_key (str): Key the image is stored under
+            data (bytes): Encoded image
+
+        Returns:
+            Optional[DuplicateMatch]: The closest earlier image within ``max_distance``,
+            or None. Images Pillow cannot decode are never duplicates
+        """
+        try:
+            value = dhash(data, self.hash_size)
+        except Exception as e:
+            logging.warning(f"Could not hash {s3_key}: {str(e)}")
+            return None
+
+        with self._lock:
+            tree = self._tree(class_name)
+            match = None
+            for distance, rowid in tree.search(value, self.max_distance):
+                # Rows replaced by a newer version of their file are gone from the index
+                row = self._conn.execute(
+                    "SELECT drive_id, s3_key FROM image_hashes WHERE rowid = ?", (rowid,)
+                ).fetchone()
+                if row is not None and row[0] != drive_id:
+                    match = DuplicateMatch(s3_key=row[1], drive_id=row[0], distance=distance)
+                    break
+            skipped = match is not None and self.action == SKIP
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO image_hashes "
+                "(class_name, drive_id, md5, s3_key, hash, hash_size, duplicate_of, skipped) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (class_name, drive_id, md5, s3_key, format(value, 'x'), self.hash_size,
+                 match.s3_key if match else None, int(skipped))
+            )
+            self._conn.commit()
+            if not skipped:
+                tree.add(value, cursor.lastrowid)
+        return match
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,430 @@
+import argparse
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+TRANSFER_SCRIPT = Path(__file__).resolve().parent / "gdrive-s3-transfer.py"
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+# Folder key of jobs without a folder id, which transfer the 'Dataset' folder
+DEFAULT_FOLDER = "dataset"
+# Drive ids; a folder id becomes a directory name and a subprocess argument
+DRIVE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+JOB_COLUMNS = (
+    "id, folder_id, priority, status, created_at, started_at, finished_at, "
+    "heartbeat_at, worker, cancel_requested, stats, error, progress"
+)
+
+@dataclass
+class Job:
+    """A transfer of one Drive folder, queued, running or finished"""
+    id: str
+    folder_id: Optional[str]
+    priority: int
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    heartbeat_at: Optional[float] = None
+    worker: Optional[str] = None
+    cancel_requested: bool = False
+    stats: Optional[dict] = None
+    error: Optional[str] = None
+    # Latest snapshot written by the transfer's --progress option
+    progress: Optional[dict] = None
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "Job":
+        job = cls(*row)
+        job.cancel_requested = bool(job.cancel_requested)
+        job.stats = json.loads(job.stats) if job.stats else None
+        job.progress = json.loads(job.progress) if job.progress else None
+        return job
+
+    @property
+    def folder_key(self) -> str:
+        return self.folder_id or DEFAULT_FOLDER
+
+class JobStore:
+    """
+    SQLite store of transfer jobs.
+
+    Claims run in ``BEGIN IMMEDIATE`` transactions, so several worker
+    processes can share one database without running a job twice or
+    exceeding the concurrency caps.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database (created if missing)
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Autocommit; multi-statement updates open their own transactions
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                folder_id TEXT,
+                folder_key TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL,
+                worker TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                stats TEXT,
+                error TEXT,
+                progress TEXT
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'progress' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created_at)")
+
+    def create(self, folder_id: Optional[str] = None, priority: int = 0) -> Job:
+        """
+        Queue a transfer of ``folder_id`` (the 'Dataset' folder when None).
+
+        Raises:
+            ValueError: If ``folder_id`` is not a valid Drive id
+        """
+        if folder_id is not None and not DRIVE_ID_PATTERN.match(folder_id):
+            raise ValueError(f"invalid Drive folder id: {folder_id!r}")
+        job = Job(id=uuid.uuid4().hex, folder_id=folder_id, priority=priority, status=QUEUED, created_at=time.time())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, folder_id, folder_key, priority, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, job.folder_id, job.folder_key, job.priority, job.status, job.created_at)
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Job]:
+        """Most recent jobs first, optionally only those in ``status``"""
+        query = f"SELECT {JOB_COLUMNS} FROM jobs"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def claim(self, worker: str, max_running: int, per_folder: int, stale_after: float) -> Optional[Job]:
+        """
+        Mark the next runnable job as running for ``worker`` and return it.
+
+        The next job has the highest priority, then the oldest creation
+        time, among queued jobs whose folder has fewer than ``per_folder``
+        running jobs. Nothing is claimed while ``max_running`` jobs run in
+        total. Running jobs whose heartbeat is older than ``stale_after``
+        seconds are first put back in the queue; their worker died.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requeued = self._conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, started_at = NULL "
+                    "WHERE status = ? AND heartbeat_at < ?",
+                    (QUEUED, RUNNING, now - stale_after)
+                ).rowcount
+                if requeued:
+                    logging.warning(f"Requeued {requeued} jobs of unresponsive workers")
+                running = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()[0]
+                row = None
+                if running < max_running:
+                    row = self._conn.execute(
+                        "SELECT id FROM jobs WHERE status = ? AND folder_key NOT IN "
+                        "(SELECT folder_key FROM jobs WHERE status = ? GROUP BY folder_key HAVING COUNT(*) >= ?) "
+                        "ORDER BY priority DESC, created_at ASC LIMIT 1",
+                        (QUEUED, RUNNING, per_folder)
+                    ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                        (RUNNING, worker, now, now, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if row is None:
+                return None
+            result = self._conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (row[0],)).fetchone()
+        return Job.from_row(result)
+
+    def heartbeat(self, job_id: str, progress: Optional[dict] = None) -> bool:
+        """Record that the job is still running, with its progress; returns whether cancellation was requested"""
+        with self._lock:
+            if progress is not None:
+                self._conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ?, progress = ? WHERE id = ?",
+                    (time.time(), json.dumps(progress), job_id)
+                )
+            else:
+                self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id: str, status: str, stats: Optional[dict] = None, error: Optional[str] = None,
+               progress: Optional[dict] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, stats = ?, error = ?, "
+                "progress = COALESCE(?, progress) WHERE id = ?",
+                (status, time.time(), json.dumps(stats) if stats is not None else None, error,
+                 json.dumps(progress) if progress is not None else None, job_id)
+            )
+
+    def requeue(self, job_id: str) -> None:
+        """Put a running job back in the queue, e.g. when its worker shuts down"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, started_at = NULL WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING)
+            )
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job.
+
+        A queued job is cancelled at once; a running one is flagged and
+        stopped by its worker at the next heartbeat. Finished jobs are
+        left alone.
+
+        Returns:
+            Optional[Job]: The job after the change, or None if it does not exist
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                    (CANCELLED, time.time(), job_id, QUEUED)
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                    (job_id, RUNNING)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(job_id)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class JobWorkerPool:
+    """
+    Threads that claim jobs from a ``JobStore`` and run each as a transfer subprocess.
+
+    Every job runs in its own process, so transfers never compete with
+    the API for the GIL. Each folder gets its own working directory under
+    ``workdir``, which holds its manifest, checkpoint journal and changes
+    cursor, so at most one job runs per folder (``per_folder`` must be 1). A job
+    interrupted by a shutdown is requeued and resumes from its journal.
+    The pool runs inside the API, or on its own with
+    ``python job_queue.py --db jobs.db --workers 4 -- <transfer args>``.
+    """
+
+    def __init__(self, store: JobStore, max_running: int = 2, per_folder: int = 1,
+                 workdir: str = "jobs", transfer_args: Optional[List[str]] = None,
+                 poll_interval: float = 2.0, stale_after: float = 60.0, cancel_grace: float = 30.0):
+        """
+        Args:
+            store (JobStore): Job store to claim from
+            max_running (int): Jobs running at once, across every pool sharing the store
+            per_folder (int): Jobs running at once for one folder; only 1 is supported,
+                since the jobs of a folder share its state directory
+            workdir (str): Directory for per-folder state, job logs and reports
+            transfer_args (Optional[List[str]]): Extra arguments for every transfer
+            poll_interval (float): Seconds between queue polls and heartbeats
+            stale_after (float): Seconds without a heartbeat before a running job is requeued
+            cancel_grace (float): Seconds a cancelled transfer gets to exit before it is killed
+
+        Raises:
+            ValueError: If ``per_folder`` is not 1
+        """
+        if per_folder != 1:
+            raise ValueError(
+                f"per_folder must be 1, not {per_folder}: jobs for one folder share its manifest, "
+                f"journal, cursor and temp files"
+            )
+        self.store = store
+        self.max_running = max(1, max_running)
+        self.per_folder = per_folder
+        self.workdir = Path(workdir)
+        self.transfer_args = list(transfer_args or [])
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.cancel_grace = cancel_grace
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def log_path(self, job_id: str) -> Path:
+        return self.workdir / "logs" / f"{job_id}.log"
+
+    def report_path(self, job_id: str) -> Path:
+        return self.workdir / "reports" / f"{job_id}.json"
+
+    def progress_path(self, job_id: str) -> Path:
+        return self.workdir / "progress" / f"{job_id}.json"
+
+    def command(self, job: Job) -> List[str]:
+        command = [
+            sys.executable, str(TRANSFER_SCRIPT),
+            "--report", str(self.report_path(job.id).resolve()),
+            "--progress", str(self.progress_path(job.id).resolve()),
+        ]
+        if job.folder_id:
+            command += ["--folder-id", job.folder_id]
+        return command + self.transfer_args
+
+    def start(self) -> None:
+        for directory in ("logs", "reports", "progress"):
+            (self.workdir / directory).mkdir(parents=True, exist_ok=True)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.max_running)
+        ]
+        logging.info(f"Job worker pool {self.worker_id}: {self.max_running} workers, {self.per_folder} per folder")
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """Stop claiming jobs; running transfers are stopped and requeued"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.worker_id, self.max_running, self.per_folder, self.stale_after)
+            except sqlite3.Error as e:
+                logging.error(f"Error claiming a job: {str(e)}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            try:
+                self._execute(job)
+            except Exception as e:
+                logging.error(f"Job {job.id} failed to run: {str(e)}")
+                self.store.finish(job.id, FAILED, error=str(e))
+
+    def _execute(self, job: Job) -> None:
+        folder_dir = self.workdir / "folders" / job.folder_key
+        folder_dir.mkdir(parents=True, exist_ok=True)
+        logging.info(f"Starting job {job.id} for folder {job.folder_key} (priority {job.priority})")
+
+        with open(self.log_path(job.id), "ab") as log:
+            process = subprocess.Popen(self.command(job), cwd=folder_dir, stdout=log, stderr=subprocess.STDOUT)
+            cancelled = False
+            while True:
+                try:
+                    process.wait(timeout=self.poll_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                if self._stop.is_set():
+                    self._terminate(process)
+                    self.store.requeue(job.id)
+                    logging.info(f"Requeued job {job.id} on shutdown")
+                    return
+                cancel = self.store.heartbeat(job.id, self._read_json(self.progress_path(job.id)))
+                if cancel and not cancelled:
+                    cancelled = True
+                    self._terminate(process)
+
+        report = self._read_json(self.report_path(job.id))
+        stats = report.get('files') if report else None
+        progress = self._read_json(self.progress_path(job.id))
+        if cancelled:
+            self.store.finish(job.id, CANCELLED, stats, error="Cancelled", progress=progress)
+        elif process.returncode == 0:
+            self.store.finish(job.id, COMPLETED, stats, progress=progress)
+        else:
+            self.store.finish(job.id, FAILED, stats, error=f"Transfer exited with code {process.returncode}, "
+                                                           f"see {self.log_path(job.id)}", progress=progress)
+        logging.info(f"Job {job.id} finished with exit code {process.returncode}")
+
+    def _terminate(self, process: subprocess.Popen) -> None:
+        """Ask the transfer to exit, then kill it after the grace period"""
+        process.terminate()
+        try:
+            process.wait(timeout=self.cancel_grace)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def _read_json(self, path: Path) -> Optional[dict]:
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+def main() -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Run queued transfer jobs from the job database.")
+    parser.add_argument("--db", default=os.getenv('JOB_DB', 'jobs.db'), help="Job database (default: $JOB_DB or jobs.db)")
+    parser.add_argument("--workers", type=int, default=2, help="Jobs running at once (default: 2)")
+    parser.add_argument("--workdir", default="jobs", help="Per-folder state, logs and reports (default: jobs)")
+    parser.add_argument("transfer_args", nargs=argparse.REMAINDER,
+                        help="Arguments passed to every gdrive-s3-transfer.py run, after --")
+    args = parser.parse_args()
+
+    transfer_args = args.transfer_args[1:] if args.transfer_args[:1] == ["--"] else args.transfer_args
+    pool = JobWorkerPool(
+        JobStore(args.db), max_running=args.workers,
+        workdir=args.workdir, transfer_args=transfer_args
+    )
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        logging.info("Stopping, running jobs will be requeued")
+        pool.stop()
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+from change_cursor import ChangeFeed, CursorExpiredError, get_start_page_token
+from transfer_metrics import MetricsRegistry
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# Tag of entries that any folder change can affect, e.g. a search over all folders
+ANY_FOLDER = "*folder"
+
+# Returned by ``MetadataCache.get`` on a miss, since None and [] are valid cached values
+MISSING = object()
+
+def _execute(request):
+    return request.execute()
+
+class MetadataCache:
+    """
+    Thread-safe LRU cache of Drive metadata whose entries also expire after a TTL.
+
+    Every entry is stored with the Drive ids it was built from (its tags),
+    so a change to any of those files drops exactly the entries it affects.
+    Fetches race with invalidation: ``put`` ignores a value fetched before
+    the latest invalidation, which would otherwise cache stale data until
+    the TTL runs out.
+    """
+
+    def __init__(self, name: str, max_entries: int = 10000, ttl: float = 300.0,
+                 registry: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            name (str): Label of this cache in the metrics
+            max_entries (int): Entries kept before the least recently used is evicted
+            ttl (float): Seconds an entry stays valid without an invalidation
+            registry (Optional[MetricsRegistry]): Registry for hit/miss metrics
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Bumped by every invalidation; see put()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, value, tags)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tagged: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+
+        registry = registry or MetricsRegistry()
+        self._requests = registry.counter("drive_cache_requests_total", "Metadata cache lookups by result")
+        self._evictions = registry.counter("drive_cache_evictions_total", "Metadata cache entries removed by reason")
+        registry.gauge("drive_cache_entries", "Entries in the metadata cache").set_function(
+            lambda: len(self._entries), cache=name
+        )
+
+    def get(self, key: Hashable):
+        """Return the cached value for ``key``, or ``MISSING``"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                self._evictions.inc(cache=self.name, reason="expired")
+                entry = None
+            if entry is None:
+                self.misses += 1
+                self._requests.inc(cache=self.name, result="miss")
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+        self._requests.inc(cache=self.name, result="hit")
+        return entry[1]
+
+    def put(self, key: Hashable, value, tags: Iterable[str] = (), generation: Optional[int] = None) -> None:
+        """
+        Store ``value`` under ``key``.
+
+        Args:
+            key (Hashable): Cache key, e.g. the call's parameters
+            value: Value to cache
+            tags (Iterable[str]): Drive ids whose changes invalidate the entry
+            generation (Optional[int]): ``generation`` read before the value was
+                fetched; the value is dropped if an invalidation happened since
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            tags = frozenset(tags)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions.inc(cache=self.name, reason="lru")
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        """Drop every entry tagged with any of ``tags``; returns how many were dropped"""
+        with self._lock:
+            self.generation += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._tagged.get(tag, set())
+            for key in keys:
+                self._remove(key)
+        if keys:
+            self._evictions.inc(len(keys), cache=self.name, reason="invalidated")
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tagged.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+def change_tags(change: dict) -> Set[str]:
+    """Cache tags a Drive change affects: the file, its parents and, for folders, all-folder searches"""
+    tags = {change['fileId']}
+    file = change.get('file')
+    if change.get('removed') or not file:
+        # The type of a removed file is unknown
+        tags.add(ANY_FOLDER)
+        return tags
+    tags.update(file.get('parents') or [])
+    if file.get('mimeType') == FOLDER_MIME_TYPE:
+        tags.add(ANY_FOLDER)
+    return tags
+
+class ChangePoller:
+    """
+    Invalidate cached metadata from the Drive changes feed in a background thread.
+
+    The cursor starts at "now" when the poller starts. Entries built from
+    files that changed since then are dropped on the next poll. If the
+    cursor expires, every cache is cleared.
+    """
+
+    def __init__(self, service, caches: List[MetadataCache], interval: float = 30.0,
+                 execute: Callable = _execute):
+        """
+        Args:
+            service: Drive v3 service
+            caches (List[MetadataCache]): Caches to invalidate
+            interval (float): Seconds between polls
+            execute (Callable): Runs a request, e.g. ``ApiThrottle.execute``
+        """
+        self.service = service
+        self.caches = caches
+        self.interval = interval
+        self.execute = execute
+        self.page_token: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll(self) -> int:
+        """Apply the changes since the last poll; returns the number of entries dropped"""
+        if self.page_token is None:
+            self.page_token = get_start_page_token(self.service, execute=self.execute)
+            return 0
+        feed = ChangeFeed(self.service, self.page_token, execute=self.execute)
+        try:
+            tags = set()
+            for change in feed:
+                tags |= change_tags(change)
+        except CursorExpiredError:
+            logging.warning("Drive changes cursor expired, clearing the metadata caches")
+            for cache in self.caches:
+                cache.clear()
+            self.page_token = None
+            return 0
+        self.page_token = feed.new_start_page_token or self.page_token
+        return sum(cache.invalidate(tags) for cache in self.caches) if tags else 0
+
+    def _run(self) -> None:
+        while True:
+            try:
+                dropped = self.poll()
+                if dropped:
+                    logging.info(f"Invalidated {dropped} cached metadata entries from Drive changes")
+            except Exception as e:
+                logging.error(f"Error polling Drive changes: {str(e)}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="drive-change-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, Optional, Set
+
+from job_queue import FINISHED, Job, JobStore
+
+def job_event(job: Job) -> dict:
+    """Progress event of a job: its status plus the transfer's latest snapshot"""
+    event = {'job_id': job.id, 'folder_id': job.folder_id, 'status': job.status}
+    if job.progress:
+        event.update(job.progress)
+    if job.error:
+        event['error'] = job.error
+    return event
+
+def format_sse(event: Optional[dict]) -> str:
+    """Encode an event for ``text/event-stream``; None becomes a keep-alive comment"""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: progress\ndata: {json.dumps(event)}\n\n"
+
+class ProgressHub:
+    """
+    Fan out job progress to any number of subscribers.
+
+    Each watched job has a single poller that reads the job store once per
+    ``interval`` and publishes an event only when the progress changed, so
+    the store and the transfer workers see the same load for one subscriber
+    or a thousand. Every subscriber has a one-slot queue: a slow client
+    skips intermediate events and always receives the latest one.
+    """
+
+    def __init__(self, store: JobStore, interval: float = 1.0, keepalive: float = 15.0):
+        """
+        Args:
+            store (JobStore): Job store holding the progress snapshots
+            interval (float): Seconds between store reads, and so the highest event rate
+            keepalive (float): Seconds without events before a keep-alive is sent
+        """
+        self.store = store
+        self.interval = interval
+        self.keepalive = keepalive
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._latest: Dict[str, dict] = {}
+        self._pollers: Dict[str, asyncio.Task] = {}
+
+    def _publish(self, job_id: str, event: dict) -> None:
+        self._latest[job_id] = event
+        for queue in self._subscribers.get(job_id, ()):
+            if queue.full():
+                # Coalesce: drop the event the subscriber has not read yet
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def _poll(self, job_id: str) -> None:
+        last = None
+        try:
+            while True:
+                # The store can wait on its lock, so read it off the event loop
+                job = await asyncio.get_running_loop().run_in_executor(None, self.store.get, job_id)
+                if job is None:
+                    return
+                event = job_event(job)
+                if event != last:
+                    self._publish(job_id, event)
+                    last = event
+                if job.status in FINISHED:
+                    return
+                await asyncio.sleep(self.interval)
+        except Exception as e:
+            logging.error(f"Error polling progress of job {job_id}: {str(e)}")
+        finally:
+            # A cancelled poller may already have been replaced by one for a new subscriber
+            if self._pollers.get(job_id) is asyncio.current_task():
+                del self._pollers[job_id]
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[Optional[dict]]:
+        """
+        Yield progress events of a job until it finishes.
+
+        None is yielded after ``keepalive`` seconds without an event, so the
+        caller can keep idle connections open.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        if job_id in self._latest:
+            queue.put_nowait(self._latest[job_id])
+        if job_id not in self._pollers:
+            self._pollers[job_id] = asyncio.ensure_future(self._poll(job_id))
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    if job_id not in self._pollers and queue.empty():
+                        # The poller ended without a final event, e.g. the job was deleted
+                        return
+                    yield None
+                    continue
+                yield event
+                if event['status'] in FINISHED:
+                    return
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+                self._latest.pop(job_id, None)
+                poller = self._pollers.pop(job_id, None)
+                if poller is not None:
+                    poller.cancel()
@@ -0,0 +1,76 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+@dataclass(frozen=True)
+class S3Object:
+    """Size and ETag of an object already present in the bucket"""
+    size: int
+    etag: str
+
+class S3Inventory:
+    """
+    In-memory index of the objects under a bucket prefix.
+
+    The index is built with one paginated ListObjectsV2 walk (1000 keys per
+    request), which replaces a ``head_object`` round trip per file when
+    deciding whether a file still has to be transferred.
+    """
+
+    def __init__(self, s3_client, bucket_name: str, prefix: str = ""):
+        """
+        Args:
+            s3_client: boto3 S3 client
+            bucket_name (str): Bucket to index
+            prefix (str): Only index keys starting with this prefix
+        """
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._objects: Dict[str, S3Object] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> "S3Inventory":
+        """List the prefix and (re)build the index"""
+        objects = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = S3Object(size=obj['Size'], etag=obj['ETag'].strip('"'))
+
+        with self._lock:
+            self._objects = objects
+        logging.info(f"Indexed {len(objects)} existing objects in s3://{self.bucket_name}/{self.prefix}")
+        return self
+
+    def get(self, key: str) -> Optional[S3Object]:
+        """Return the indexed object for ``key``, if any"""
+        with self._lock:
+            return self._objects.get(key)
+
+    def contains(self, key: str, size: Optional[int] = None) -> bool:
+        """
+        Check whether ``key`` exists, optionally with a matching size.
+
+        Args:
+            key (str): Object key
+            size (Optional[int]): Expected size; a mismatch counts as missing
+        """
+        obj = self.get(key)
+        if obj is None:
+            return False
+        return size is None or obj.size == size
+
+    def add(self, key: str, size: int, etag: str) -> None:
+        """Record an object uploaded after the index was built"""
+        with self._lock:
+            self._objects[key] = S3Object(size=size, etag=etag.strip('"'))
+
+    def keys(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._objects))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._objects)
@@ -0,0 +1,212 @@
+import io
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+@dataclass
+class PartUpload:
+    """A buffered multipart part waiting for an upload worker"""
+    writer: "S3MultipartWriter"
+    part_number: int
+    data: bytes
+
+    def run(self) -> bool:
+        """Upload the part; returns False if it failed (the writer keeps the error)"""
+        return self.writer.upload_part(self.part_number, self.data)
+
+class S3MultipartWriter(io.RawIOBase):
+    """
+    Writable stream that turns sequential writes into an S3 multipart upload.
+
+    Data is buffered until a full part is available and then sent as one
+    multipart part, so memory use is bounded by the part size rather than the
+    object size. Objects smaller than one part are sent with a single
+    ``put_object`` call instead.
+
+    When ``part_queue`` is given, parts are handed to upload workers through
+    that (bounded) queue as ``PartUpload`` items instead of being sent by the
+    writing thread.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, part_size: int = DEFAULT_PART_SIZE,
+                 part_queue: Optional[queue.Queue] = None, extra_args: Optional[dict] = None,
+                 on_create: Optional[Callable[[str], None]] = None,
+                 on_part: Optional[Callable[[int, str, int], None]] = None):
+        """
+        Args:
+            s3_client: boto3 S3 client
+            bucket (str): Target bucket
+            key (str): Target object key
+            part_size (int): Size of each multipart part in bytes
+            part_queue (Optional[queue.Queue]): Queue drained by upload workers
+            extra_args (Optional[dict]): Extra arguments for the create/put call
+            on_create (Optional[Callable]): Called with the upload id once the
+                multipart upload is created
+            on_part (Optional[Callable]): Called with ``(part_number, etag, size)``
+                after S3 acknowledges each part
+        """
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.part_queue = part_queue
+        self.extra_args = extra_args or {}
+        self.on_create = on_create
+        self.on_part = on_part
+        self.upload_id: Optional[str] = None
+        self.bytes_written = 0
+
+        self._buffer = bytearray()
+        self._next_part = 1
+        self._etags: Dict[int, str] = {}
+        self._pending = 0
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def resume(self, upload_id: str, parts: Dict[int, tuple]) -> None:
+        """
+        Continue an existing multipart upload instead of starting a new one.
+
+        Args:
+            upload_id (str): Id of the in-progress multipart upload
+            parts (Dict[int, tuple]): Completed parts ``{number: (etag, size)}``
+                numbered contiguously from 1; writing continues after the last
+        """
+        self.upload_id = upload_id
+        self._etags = {number: etag for number, (etag, _) in parts.items()}
+        self._next_part = len(parts) + 1
+        self.bytes_written = sum(size for _, size in parts.values())
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self._error is not None:
+            raise self._error
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._send_part(part)
+        return len(data)
+
+    def _send_part(self, data: bytes) -> None:
+        """Upload ``data`` as the next part, directly or through the part queue"""
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.extra_args
+            )
+            self.upload_id = response['UploadId']
+            if self.on_create is not None:
+                self.on_create(self.upload_id)
+
+        part_number = self._next_part
+        self._next_part += 1
+
+        if self.part_queue is None:
+            self.upload_part(part_number, data, queued=False)
+            if self._error is not None:
+                raise self._error
+            return
+
+        with self._cond:
+            self._pending += 1
+        # Blocks while the queue is full, which caps buffered memory
+        self.part_queue.put(PartUpload(self, part_number, data))
+
+    def upload_part(self, part_number: int, data: bytes, queued: bool = True) -> bool:
+        """
+        Send one part to S3; called by upload workers for queued parts.
+
+        Returns:
+            bool: True if the part was uploaded; a failure is kept for ``finish`` to raise
+        """
+        try:
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            with self._cond:
+                self._etags[part_number] = response['ETag']
+            if self.on_part is not None:
+                self.on_part(part_number, response['ETag'], len(data))
+            return True
+        except Exception as e:
+            with self._cond:
+                self._error = e
+            return False
+        finally:
+            if queued:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
+
+    def finish(self) -> dict:
+        """
+        Flush the remaining buffer and complete the upload.
+        
+        If parts fail, the multipart upload is aborted unless ``on_part`` is
+        set, in which case it is left in place so a later run can resume it.
+
+        Returns:
+            dict: The S3 response of the final call (contains ``ETag``)
+        """
+        if self.upload_id is None:
+            # Whole object fits in a single part: one PUT is cheaper
+            response = self.s3_client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), **self.extra_args
+            )
+            self._buffer.clear()
+            super().close()
+            return response
+
+        if self._buffer:
+            self._send_part(bytes(self._buffer))
+            self._buffer.clear()
+
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+            error = self._error
+
+        if error is not None:
+            if self.on_part is None:
+                self.abort()
+            raise error
+
+        response = self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': number, 'ETag': etag}
+                for number, etag in sorted(self._etags.items())
+            ]}
+        )
+        super().close()
+        return response
+
+    def abort(self) -> None:
+        """Abort the multipart upload so S3 discards any uploaded parts"""
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+        if self.upload_id is not None:
+            try:
+                self.s3_client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+                )
+            finally:
+                self.upload_id = None
+        self._buffer.clear()
+        super().close()
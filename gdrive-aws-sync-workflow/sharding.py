@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List
+
+def shard_for(key: str, shard_count: int) -> int:
+    """
+    Assign ``key`` to a shard with rendezvous (highest-random-weight) hashing.
+
+    Every pod computes the same answer without coordination, shards get an
+    even share of keys, and changing ``shard_count`` only moves the keys of
+    the shards that were added or removed.
+    """
+    if shard_count <= 1:
+        return 0
+    return max(
+        range(shard_count),
+        key=lambda shard: hashlib.md5(f"{shard}:{key}".encode()).digest()
+    )
+
+def shard_stats_key(prefix: str, shard_index: int) -> str:
+    return f"{prefix.rstrip('/')}/shard-{shard_index:04d}.json"
+
+def write_shard_stats(s3_client, bucket_name: str, prefix: str, shard_index: int,
+                      shard_count: int, stats: Dict[str, int], elapsed_seconds: float,
+                      success: bool) -> None:
+    """Store one shard's run statistics as JSON under ``prefix``"""
+    body = {
+        'shard_index': shard_index,
+        'shard_count': shard_count,
+        'success': success,
+        'elapsed_seconds': round(elapsed_seconds, 3),
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'stats': stats,
+    }
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=shard_stats_key(prefix, shard_index),
+        Body=json.dumps(body).encode(),
+        ContentType='application/json'
+    )
+
+def merge_shard_stats(s3_client, bucket_name: str, prefix: str) -> dict:
+    """
+    Combine the per-shard statistics under ``prefix`` into one summary.
+
+    The summary is also written to ``<prefix>/summary.json``. It lists the
+    shards that have not reported yet, so it can be rerun as shards finish.
+    """
+    shards: List[dict] = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{prefix.rstrip('/')}/shard-"):
+        for obj in page.get('Contents', []):
+            response = s3_client.get_object(Bucket=bucket_name, Key=obj['Key'])
+            shards.append(json.loads(response['Body'].read()))
+
+    totals: Dict[str, int] = {}
+    for shard in shards:
+        for name, value in shard['stats'].items():
+            totals[name] = totals.get(name, 0) + value
+
+    shard_count = max((shard['shard_count'] for shard in shards), default=0)
+    reported = sorted(shard['shard_index'] for shard in shards)
+    summary = {
+        'shard_count': shard_count,
+        'reported_shards': reported,
+        'missing_shards': sorted(set(range(shard_count)) - set(reported)),
+        'success': bool(shards) and all(shard['success'] for shard in shards) and len(reported) == shard_count,
+        'elapsed_seconds': max((shard['elapsed_seconds'] for shard in shards), default=0),
+        'stats': totals,
+    }
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=f"{prefix.rstrip('/')}/summary.json",
+        Body=json.dumps(summary, indent=2).encode(),
+        ContentType='application/json'
+    )
+    logging.info(f"Merged stats of {len(shards)}/{shard_count} shards: {totals}")
+    return summary
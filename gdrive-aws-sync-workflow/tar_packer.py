@@ -0,0 +1,238 @@
+import io
+import json
+import logging
+import re
+import tarfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from s3_stream import DEFAULT_PART_SIZE, S3MultipartWriter
+
+DEFAULT_PACK_SIZE = 256 * 1024 * 1024
+# shard-<writer>-<number>; keys from before writers were numbered have no writer part
+SHARD_KEY_PATTERN = re.compile(r"shard-(?:(\d+)-)?(\d+)\.(tar|index\.json)$")
+
+def _padded(size: int) -> int:
+    """Size of a member's data in the archive, rounded up to whole 512-byte blocks"""
+    return (size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+
+def _mtime(modified_time: Optional[str]) -> float:
+    if not modified_time:
+        return time.time()
+    try:
+        return datetime.fromisoformat(modified_time.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return time.time()
+
+@dataclass
+class PackedMember:
+    """One file inside a shard; ``offset`` points at its data, for ranged reads"""
+    name: str
+    drive_id: str
+    offset: int
+    size: int
+    md5: Optional[str] = None
+    modified_time: Optional[str] = None
+
+@dataclass
+class _OpenShard:
+    key: str
+    writer: S3MultipartWriter
+    tar: tarfile.TarFile
+    members: List[PackedMember] = field(default_factory=list)
+
+@dataclass
+class _ClassShards:
+    """Shard state of one class folder"""
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    loaded: bool = False
+    next_number: int = 0
+    # drive id -> md5 of every file already packed for this class
+    packed: Dict[str, Optional[str]] = field(default_factory=dict)
+    open: Optional[_OpenShard] = None
+
+class TarShardPacker:
+    """
+    Pack files into fixed-size tar shards per class folder, WebDataset style.
+
+    Shards are streamed to ``<prefix>/<class>/shard-II-NNNNNN.tar`` through
+    ``S3MultipartWriter``, and each gets a ``shard-II-NNNNNN.index.json``
+    sidecar listing every member with its data offset and size, so single
+    samples can be read with a Range GET. ``II`` is the writer's shard
+    index, so parallel pods packing the same class number their shards
+    independently and never write the same key. Later runs continue their
+    own numbering and skip files listed in any writer's index; existing
+    shards are never rewritten. A shard whose upload did not complete has
+    no index, so its files are packed again by the next run.
+    """
+
+    def __init__(self, s3_client, bucket_name: str, prefix: str = "shards",
+                 pack_size: int = DEFAULT_PACK_SIZE, part_size: int = DEFAULT_PART_SIZE,
+                 on_shard: Optional[Callable[[str, List[PackedMember]], None]] = None,
+                 shard_index: int = 0):
+        """
+        Args:
+            s3_client: boto3 S3 client
+            bucket_name (str): Target bucket
+            prefix (str): Key prefix for shards and indexes
+            pack_size (int): Target shard size; a shard is closed before it would exceed it
+            part_size (int): Multipart part size used while streaming a shard
+            on_shard (Optional[Callable]): Called with ``(shard_key, members)`` after a
+                shard and its index are written
+            shard_index (int): Index of this writer among parallel transfer shards
+        """
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip('/')
+        self.pack_size = pack_size
+        self.part_size = part_size
+        self.on_shard = on_shard
+        self.shard_index = shard_index
+        # Set per run; when given, shard parts are uploaded by the pipeline's upload workers
+        self.part_queue = None
+        # Files lost because their shard failed after they were added
+        self.failed_members = 0
+        self._classes: Dict[str, _ClassShards] = {}
+        self._lock = threading.Lock()
+
+    def _class_prefix(self, class_name: str) -> str:
+        return f"{self.prefix}/{class_name}/"
+
+    def _state(self, class_name: str) -> _ClassShards:
+        """Return the class state, reading its existing indexes from S3 on first use"""
+        with self._lock:
+            state = self._classes.setdefault(class_name, _ClassShards())
+        with state.lock:
+            if not state.loaded:
+                self._load(class_name, state)
+                state.loaded = True
+        return state
+
+    def _load(self, class_name: str, state: _ClassShards) -> None:
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self._class_prefix(class_name)):
+            for obj in page.get('Contents', []):
+                match = SHARD_KEY_PATTERN.search(obj['Key'])
+                if not match:
+                    continue
+                writer = match.group(1)
+                if writer is not None and int(writer) == self.shard_index:
+                    # Numbers of shards without an index are skipped too, so nothing is overwritten
+                    state.next_number = max(state.next_number, int(match.group(2)) + 1)
+                if match.group(3) != 'tar':
+                    response = self.s3_client.get_object(Bucket=self.bucket_name, Key=obj['Key'])
+                    for member in json.loads(response['Body'].read())['members']:
+                        state.packed[member['drive_id']] = member.get('md5')
+        logging.info(
+            f"Class {class_name}: {len(state.packed)} files already packed, next shard {state.next_number}"
+        )
+
+    def contains(self, class_name: str, drive_id: str, md5: Optional[str] = None) -> bool:
+        """Whether this version of the file is already in one of the class's shards"""
+        state = self._state(class_name)
+        with state.lock:
+            return drive_id in state.packed and state.packed[drive_id] == md5
+
+    def add(self, class_name: str, name: str, data: bytes, drive_id: str,
+            md5: Optional[str] = None, modified_time: Optional[str] = None) -> None:
+        """
+        Append one file to the class's open shard, starting a new shard when full.
+
+        Args:
+            class_name (str): Class folder the shard belongs to
+            name (str): Member name, relative to the class folder
+            data (bytes): File content
+            drive_id (str): Drive file id, recorded in the index
+            md5 (Optional[str]): Drive md5Checksum, recorded in the index
+            modified_time (Optional[str]): Drive modifiedTime, used as the member mtime
+        """
+        state = self._state(class_name)
+        with state.lock:
+            shard = state.open
+            if shard is not None and shard.members and \
+                    shard.tar.offset + tarfile.BLOCKSIZE + _padded(len(data)) > self.pack_size:
+                self._finish(state)
+                shard = None
+            if shard is None:
+                shard = self._open(class_name, state)
+
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o644
+            info.mtime = _mtime(modified_time)
+            try:
+                shard.tar.addfile(info, io.BytesIO(data))
+            except Exception:
+                self._abort(state)
+                raise
+            shard.members.append(PackedMember(
+                name=name,
+                drive_id=drive_id,
+                offset=shard.tar.offset - _padded(len(data)),
+                size=len(data),
+                md5=md5,
+                modified_time=modified_time
+            ))
+            state.packed[drive_id] = md5
+
+    def _open(self, class_name: str, state: _ClassShards) -> _OpenShard:
+        key = f"{self._class_prefix(class_name)}shard-{self.shard_index:02d}-{state.next_number:06d}.tar"
+        state.next_number += 1
+        writer = S3MultipartWriter(
+            self.s3_client, self.bucket_name, key, part_size=self.part_size,
+            part_queue=self.part_queue, extra_args={'ContentType': 'application/x-tar'}
+        )
+        # Stream mode: the tar module never seeks or tells on the writer
+        state.open = _OpenShard(key, writer, tarfile.open(fileobj=writer, mode='w|', format=tarfile.USTAR_FORMAT))
+        return state.open
+
+    def _finish(self, state: _ClassShards) -> None:
+        """Complete the open shard and write its index sidecar"""
+        shard, state.open = state.open, None
+        try:
+            shard.tar.close()
+            shard.writer.finish()
+            index = {
+                'shard': shard.key,
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'members': [asdict(member) for member in shard.members],
+            }
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=shard.key[:-len('.tar')] + '.index.json',
+                Body=json.dumps(index).encode(),
+                ContentType='application/json'
+            )
+        except Exception as e:
+            logging.error(f"Error writing shard {shard.key}: {str(e)}")
+            self._drop(state, shard)
+            return
+        logging.info(f"Wrote {shard.key} with {len(shard.members)} files")
+        if self.on_shard is not None:
+            self.on_shard(shard.key, shard.members)
+
+    def _abort(self, state: _ClassShards) -> None:
+        shard, state.open = state.open, None
+        try:
+            shard.writer.abort()
+        except Exception as e:
+            logging.warning(f"Error aborting shard {shard.key}: {str(e)}")
+        self._drop(state, shard)
+
+    def _drop(self, state: _ClassShards, shard: _OpenShard) -> None:
+        """Forget the members of a failed shard so a later run packs them again"""
+        for member in shard.members:
+            state.packed.pop(member.drive_id, None)
+        self.failed_members += len(shard.members)
+
+    def close(self) -> None:
+        """Finish every open shard"""
+        with self._lock:
+            states = list(self._classes.values())
+        for state in states:
+            with state.lock:
+                if state.open is not None:
+                    self._finish(state)
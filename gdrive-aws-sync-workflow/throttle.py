@@ -0,0 +1,206 @@
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from typing import Callable, Optional
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+from googleapiclient.errors import HttpError
+
+# Drive 403 reasons that mean "slow down" rather than "forbidden"
+DRIVE_THROTTLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+S3_THROTTLE_CODES = {
+    "SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded",
+    "TooManyRequestsException", "RequestThrottled",
+}
+S3_TRANSIENT_CODES = {"RequestTimeout", "InternalError", "ServiceUnavailable", "500", "503"}
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+
+def _drive_error_reasons(error: HttpError) -> set:
+    try:
+        content = error.content.decode() if isinstance(error.content, bytes) else error.content
+        return {detail.get('reason') for detail in json.loads(content)['error'].get('errors', [])}
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return set()
+
+def is_throttle_error(error: BaseException) -> bool:
+    """Whether ``error`` is a quota/rate-limit response from Drive or S3"""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        return status == 429 or (status == 403 and bool(_drive_error_reasons(error) & DRIVE_THROTTLE_REASONS))
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in S3_THROTTLE_CODES
+    return False
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Whether a call that raised ``error`` is worth retrying"""
+    if is_throttle_error(error):
+        return True
+    if isinstance(error, HttpError):
+        return error.resp.status in TRANSIENT_STATUSES
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return code in S3_TRANSIENT_CODES or status in TRANSIENT_STATUSES
+    return isinstance(error, (socket.timeout, ConnectionError, BotoConnectionError, HTTPClientError))
+
+class TokenBucket:
+    """Blocking token bucket limiting the average request rate"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate (float): Tokens added per second
+            burst (Optional[float]): Bucket capacity (defaults to ``rate``)
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit adjusted with AIMD (additive increase, multiplicative decrease).
+
+    Each success raises the limit by ``1 / limit`` (about +1 per round of
+    calls); each throttle response halves it, at most once per cooldown so a
+    burst of throttled calls that were already in flight counts once.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, cooldown: float = 1.0):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.cooldown = cooldown
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self) -> None:
+        with self._cond:
+            if self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self._cond.notify()
+
+    def on_throttle(self) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._last_decrease = now
+                logging.warning(f"Throttled, concurrency limit lowered to {int(self.limit)}")
+
+class ApiThrottle:
+    """
+    Shared rate limiter and retry policy for one API (Drive or S3).
+
+    Every call waits for a token-bucket token and a slot under the adaptive
+    concurrency limit. Throttle responses (Drive 403 rate-limit / 429, S3
+    ``SlowDown``) and transient 5xx or connection errors are retried with
+    exponential backoff and full jitter instead of failing the file.
+    """
+
+    def __init__(self, name: str, rate: float, max_concurrency: int, burst: Optional[float] = None,
+                 max_retries: int = 8, base_delay: float = 0.5, max_delay: float = 60.0):
+        """
+        Args:
+            name (str): Label used in log messages
+            rate (float): Maximum sustained calls per second
+            max_concurrency (int): Upper bound for concurrent in-flight calls
+            burst (Optional[float]): Token bucket capacity
+            max_retries (int): Retries before the error is raised
+            base_delay (float): Backoff base in seconds
+            max_delay (float): Backoff ceiling in seconds
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Call ``fn(*args, **kwargs)`` under the limiter, retrying throttled/transient failures"""
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            with self.concurrency:
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+
+            if error is None:
+                self.concurrency.on_success()
+                return result
+
+            if attempt >= self.max_retries or not is_retryable_error(error):
+                raise error
+
+            throttled = is_throttle_error(error)
+            if throttled:
+                self.concurrency.on_throttle()
+            with self._lock:
+                self.retries += 1
+                self.throttles += int(throttled)
+
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            logging.warning(
+                f"{self.name} call failed ({'throttled' if throttled else str(error)}), "
+                f"retry {attempt + 1}/{self.max_retries} in {delay:.2f}s"
+            )
+            time.sleep(delay)
+            attempt += 1
+
+    def execute(self, request, **kwargs):
+        """Execute a googleapiclient request under the limiter"""
+        return self.call(request.execute, **kwargs)
+
+class ThrottledClient:
+    """Proxy that routes every method call of a boto3 client through an ``ApiThrottle``"""
+
+    def __init__(self, client, throttle: ApiThrottle):
+        self._client = client
+        self._throttle = throttle
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name in ('get_paginator', 'can_paginate'):
+            return attr
+
+        def throttled(*args, **kwargs):
+            return self._throttle.call(attr, *args, **kwargs)
+        return throttled
@@ -0,0 +1,129 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+@dataclass
+class ManifestEntry:
+    """A Drive file that has been transferred to S3"""
+    drive_id: str
+    s3_key: str
+    md5: Optional[str]
+    size: Optional[int]
+    modified_time: Optional[str]
+    etag: Optional[str] = None
+    transferred_at: Optional[float] = None
+
+    def matches(self, s3_key: str, md5: Optional[str], size: Optional[int],
+                modified_time: Optional[str]) -> bool:
+        """
+        Check whether this record still describes the given Drive file.
+
+        The Drive ``md5Checksum`` is authoritative when both sides have one;
+        otherwise size and ``modifiedTime`` are compared.
+        """
+        if self.s3_key != s3_key:
+            return False
+        if md5 and self.md5:
+            return md5 == self.md5
+        return size == self.size and modified_time == self.modified_time
+
+class TransferManifest:
+    """
+    Local SQLite record of every object transferred from Drive to S3.
+
+    Unchanged files are recognised from Drive listing metadata alone, so they
+    need neither a Drive media request nor an S3 request. Safe to share
+    between worker threads.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database (created if missing)
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS transfers (
+                drive_id TEXT PRIMARY KEY,
+                s3_key TEXT NOT NULL,
+                md5 TEXT,
+                size INTEGER,
+                modified_time TEXT,
+                etag TEXT,
+                transferred_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS transfers_s3_key ON transfers (s3_key)")
+        # Measured throughput of past runs, used to estimate how long a plan takes
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                started_at REAL NOT NULL,
+                elapsed_seconds REAL NOT NULL,
+                files INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, drive_id: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT drive_id, s3_key, md5, size, modified_time, etag, transferred_at "
+                "FROM transfers WHERE drive_id = ?",
+                (drive_id,)
+            ).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def record(self, entry: ManifestEntry) -> None:
+        """Insert or replace the record for ``entry.drive_id``"""
+        transferred_at = entry.transferred_at or time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transfers "
+                "(drive_id, s3_key, md5, size, modified_time, etag, transferred_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry.drive_id, entry.s3_key, entry.md5, entry.size,
+                 entry.modified_time, entry.etag, transferred_at)
+            )
+            self._conn.commit()
+
+    def record_run(self, started_at: float, elapsed_seconds: float, files: int, bytes_transferred: int) -> None:
+        """Store the size and duration of a finished run"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runs (started_at, elapsed_seconds, files, bytes) VALUES (?, ?, ?, ?)",
+                (started_at, elapsed_seconds, files, bytes_transferred)
+            )
+            self._conn.commit()
+
+    def recent_throughput(self, runs: int = 5) -> Optional[Tuple[float, float]]:
+        """
+        Average throughput of the most recent runs.
+
+        Returns:
+            Optional[Tuple[float, float]]: ``(files_per_second, bytes_per_second)``,
+            or None when no run has been recorded
+        """
+        with self._lock:
+            files, bytes_transferred, elapsed = self._conn.execute(
+                "SELECT SUM(files), SUM(bytes), SUM(elapsed_seconds) FROM "
+                "(SELECT files, bytes, elapsed_seconds FROM runs ORDER BY started_at DESC LIMIT ?)",
+                (runs,)
+            ).fetchone()
+        if not elapsed:
+            return None
+        return files / elapsed, bytes_transferred / elapsed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transfers").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,459 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from fast metadata calls to large media transfers
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+class Gauge(Counter):
+    """Value that can go up and down, or is read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._callbacks: Dict[LabelKey, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_function(self, fn: Callable[[], float], **labels) -> None:
+        with self._lock:
+            self._callbacks[_label_key(labels)] = fn
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            values = dict(self._values)
+            callbacks = dict(self._callbacks)
+        for key, fn in callbacks.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return [(self.name, key, value) for key, value in values.items()]
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # label key -> (per-bucket counts incl. +Inf, sum, count)
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self, **labels) -> dict:
+        """Count, sum and estimated p50/p95/p99 for one label set"""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if not series:
+                return {'count': 0, 'sum': 0.0, 'p50': None, 'p95': None, 'p99': None}
+            counts, total, count = list(series[0]), series[1], series[2]
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'p50': self._quantile(counts, count, 0.50),
+            'p95': self._quantile(counts, count, 0.95),
+            'p99': self._quantile(counts, count, 0.99),
+        }
+
+    def _quantile(self, counts: List[int], count: int, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return round(lower + (upper - lower) * (rank - seen) / bucket_count, 6)
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        result = []
+        with self._lock:
+            series = {key: (list(value[0]), value[1], value[2]) for key, value in self._series.items()}
+        for key, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                result.append((f"{self.name}_bucket", key + (('le', le),), cumulative))
+            result.append((f"{self.name}_sum", key, total))
+            result.append((f"{self.name}_count", key, count))
+        return result
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+def start_metrics_server(registry: MetricsRegistry, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve ``registry`` on ``http://host:port/metrics`` from a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+class TransferMetrics:
+    """
+    Per-stage instrumentation for the Drive -> S3 pipeline.
+
+    Stages are ``list``, ``skip_check``, ``download``, ``upload``,
+    ``disk`` (writes to ``temp_downloads/``), ``transform`` (HEIC to
+    JPEG conversion) and ``dedup`` (perceptual hashing). Each records a latency
+    histogram, error count and bytes moved; queue depths are sampled once
+    per second so the run report can show which stage the pipeline was
+    waiting on.
+    """
+
+    STAGES = ("list", "skip_check", "download", "upload", "disk", "transform", "dedup")
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        self.started_at = time.time()
+        self.latency = self.registry.histogram(
+            "transfer_stage_duration_seconds", "Latency of one operation in a pipeline stage")
+        self.errors = self.registry.counter(
+            "transfer_stage_errors_total", "Failed operations per pipeline stage")
+        self.bytes = self.registry.counter(
+            "transfer_bytes_total", "Bytes moved per pipeline stage")
+        self.throughput = self.registry.gauge(
+            "transfer_throughput_bytes_per_second", "Average bytes per second since the run started")
+        self.queue_depth = self.registry.gauge(
+            "transfer_queue_depth", "Items waiting in a pipeline queue")
+        self.retries = self.registry.gauge(
+            "transfer_api_retries", "Retried API calls (throttled or transient)")
+        self.throttles = self.registry.gauge(
+            "transfer_api_throttles", "API calls rejected with a throttle response")
+        self.files = self.registry.gauge(
+            "transfer_files", "File counters from TransferStats")
+        # queue name -> [sum of sampled depths, samples, capacity]
+        self._queue_samples: Dict[str, list] = {}
+        self._queues: Dict[str, object] = {}
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        for stage in self.STAGES:
+            self.throughput.set_function(lambda stage=stage: self._rate(stage), stage=stage)
+
+    def _rate(self, stage: str) -> float:
+        elapsed = max(1e-9, time.time() - self.started_at)
+        return round(self.bytes.get(stage=stage) / elapsed, 3)
+
+    @contextmanager
+    def time(self, stage: str):
+        """Time one operation of ``stage``; exceptions are counted as errors"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors.inc(stage=stage)
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start, stage=stage)
+
+    def timed_call(self, stage: str, fn: Callable, *args, **kwargs):
+        with self.time(stage):
+            return fn(*args, **kwargs)
+
+    def add_bytes(self, stage: str, amount: int) -> None:
+        self.bytes.inc(amount, stage=stage)
+
+    def track_api(self, name: str, throttle) -> None:
+        """Expose an ``ApiThrottle``'s retry and throttle counts"""
+        self.retries.set_function(lambda: throttle.retries, api=name)
+        self.throttles.set_function(lambda: throttle.throttles, api=name)
+
+    def track_stats(self, stats) -> None:
+        """Expose the ``TransferStats`` counters"""
+        for name in stats.snapshot():
+            self.files.set_function(lambda name=name: stats.snapshot()[name], counter=name)
+
+    def track_queue(self, name: str, work_queue) -> None:
+        """Report the depth of a pipeline queue and sample it for the run report"""
+        self.queue_depth.set_function(work_queue.qsize, queue=name)
+        with self._lock:
+            self._queues[name] = work_queue
+            self._queue_samples.setdefault(name, [0, 0, work_queue.maxsize])
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_queues, name="queue-sampler", daemon=True)
+                self._sampler.start()
+
+    def _sample_queues(self) -> None:
+        while not self._stop.wait(1.0):
+            with self._lock:
+                for name, work_queue in self._queues.items():
+                    samples = self._queue_samples[name]
+                    samples[0] += work_queue.qsize()
+                    samples[1] += 1
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def report(self, stats: dict, workers: Dict[str, int]) -> dict:
+        """
+        Build the machine-readable run report.
+
+        ``utilization`` is the share of the stage's worker time spent inside
+        operations; together with the average queue fill it shows whether
+        Drive (download), S3 (upload), local disk or listing limited the run.
+        """
+        elapsed = max(1e-9, time.time() - self.started_at)
+        stages = {}
+        for stage in self.STAGES:
+            latency = self.latency.summary(stage=stage)
+            stage_workers = workers.get(stage, 1)
+            stages[stage] = {
+                'operations': latency['count'],
+                'errors': self.errors.get(stage=stage),
+                'bytes': int(self.bytes.get(stage=stage)),
+                'throughput_bytes_per_second': round(self.bytes.get(stage=stage) / elapsed, 3),
+                'latency_seconds': {key: latency[key] for key in ('p50', 'p95', 'p99')},
+                'busy_seconds': latency['sum'],
+                'utilization': round(latency['sum'] / (elapsed * stage_workers), 4),
+            }
+
+        with self._lock:
+            queues = {
+                name: {
+                    'average_depth': round(total / samples, 3) if samples else 0.0,
+                    'capacity': capacity,
+                }
+                for name, (total, samples, capacity) in self._queue_samples.items()
+            }
+
+        api = {}
+        for _, key, value in self.retries.samples():
+            api.setdefault(dict(key)['api'], {})['retries'] = value
+        for _, key, value in self.throttles.samples():
+            api.setdefault(dict(key)['api'], {})['throttles'] = value
+
+        busiest = max(('download', 'upload', 'disk', 'transform', 'list'), key=lambda stage: stages[stage]['utilization'])
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started_at)),
+            'elapsed_seconds': round(elapsed, 3),
+            'files': stats,
+            'files_per_second': round(stats.get('uploaded_files', 0) / elapsed, 3),
+            'stages': stages,
+            'queues': queues,
+            'api': api,
+            'bottleneck': busiest,
+        }
+
+    def busy_seconds(self) -> Dict[str, float]:
+        """Total time spent inside operations, per stage"""
+        return {stage: self.latency.summary(stage=stage)['sum'] for stage in self.STAGES}
+
+    def write_report(self, path: str, stats: dict, workers: Dict[str, int]) -> dict:
+        report = self.report(stats, workers)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Wrote run report to {path}")
+        return report
+
+class MeteredWriter:
+    """File-like wrapper that records the time and bytes of every write as the ``disk`` stage"""
+
+    def __init__(self, f, metrics: TransferMetrics):
+        self._f = f
+        self._metrics = metrics
+
+    def write(self, data) -> int:
+        with self._metrics.time("disk"):
+            written = self._f.write(data)
+        self._metrics.add_bytes("disk", len(data))
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+class ProgressReporter:
+    """
+    Periodically write a small JSON progress snapshot of a running transfer.
+
+    ``snapshot`` returns cumulative counters: ``phase``, ``files_done``,
+    ``files_total``, ``bytes_done``, ``bytes_total``, ``listing_complete``
+    and ``busy`` (busy seconds per stage). The reporter adds rates over a
+    sliding window, an ETA once listing is complete, and the stage that was
+    busiest within the window. The file is replaced atomically, so readers
+    always see a whole snapshot, and only the latest one is kept.
+    """
+
+    def __init__(self, path: str, snapshot: Callable[[], dict], interval: float = 1.0, window: float = 10.0):
+        """
+        Args:
+            path (str): File to write
+            snapshot (Callable[[], dict]): Returns the cumulative counters
+            interval (float): Seconds between writes
+            window (float): Seconds over which rates are averaged
+        """
+        self.path = path
+        self.snapshot = snapshot
+        self.interval = interval
+        self.window = window
+        self._samples: deque = deque()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def progress(self, phase: Optional[str] = None) -> dict:
+        current = self.snapshot()
+        now = time.monotonic()
+        self._samples.append((now, current))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+        then, oldest = self._samples[0]
+        elapsed = now - then
+
+        files_rate = (current['files_done'] - oldest['files_done']) / elapsed if elapsed > 0 else 0.0
+        bytes_rate = (current['bytes_done'] - oldest['bytes_done']) / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if current.get('listing_complete') and (files_rate > 0 or bytes_rate > 0):
+            eta = max(
+                (current['files_total'] - current['files_done']) / files_rate if files_rate > 0 else 0.0,
+                (current['bytes_total'] - current['bytes_done']) / bytes_rate if bytes_rate > 0 else 0.0,
+            )
+        busy = {
+            stage: seconds - oldest.get('busy', {}).get(stage, 0.0)
+            for stage, seconds in current.get('busy', {}).items()
+        }
+        stage = max(busy, key=busy.get) if busy and max(busy.values()) > 0 else None
+
+        return {
+            'phase': phase or current['phase'],
+            'stage': stage,
+            'files_done': current['files_done'],
+            'files_total': current['files_total'],
+            'listing_complete': bool(current.get('listing_complete')),
+            'bytes_done': current['bytes_done'],
+            'bytes_total': current['bytes_total'],
+            'files_per_second': round(files_rate, 3),
+            'bytes_per_second': round(bytes_rate, 1),
+            'eta_seconds': round(max(0.0, eta), 1) if eta is not None else None,
+            'stats': current.get('stats'),
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+
+    def write(self, phase: Optional[str] = None) -> None:
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.progress(phase), f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.warning(f"Error writing progress to {self.path}: {str(e)}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.write()
+        self._thread = threading.Thread(target=self._run, name="progress-reporter", daemon=True)
+        self._thread.start()
+
+    def stop(self, phase: str) -> None:
+        """Stop the periodic writes and write a final snapshot in ``phase``"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write(phase)
@@ -0,0 +1,140 @@
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+PLAN_VERSION = 1
+
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+ORPHANED = "orphaned"
+ACTIONS = (NEW, CHANGED, UNCHANGED, ORPHANED)
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+@dataclass
+class TransferPlan:
+    """
+    Result of diffing Drive against the bucket, without transferring anything.
+
+    ``tasks`` holds every new or changed file with the fields of a
+    ``FileTask``, so ``--execute-plan`` can transfer exactly these files
+    without listing Drive or S3 again. Orphaned objects (in the bucket
+    under a class folder but no longer in Drive) are only reported.
+
+    With ``--dedup``, images already left out as duplicates count as
+    unchanged, but new near-duplicates can only be found once an image is
+    downloaded. ``dedup`` marks such plans: their new and changed counts,
+    and so the estimate, are an upper bound.
+    """
+    bucket: str
+    shard_index: int = 0
+    shard_count: int = 1
+    created_at: str = field(default_factory=lambda: time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+    counts: Dict[str, Dict[str, int]] = field(
+        default_factory=lambda: {action: {'files': 0, 'bytes': 0} for action in ACTIONS}
+    )
+    tasks: List[dict] = field(default_factory=list)
+    orphaned: List[dict] = field(default_factory=list)
+    estimate: Optional[dict] = None
+    dedup: bool = False
+
+    def add(self, action: str, task: dict) -> None:
+        """Count a Drive file; new and changed files are kept for execution"""
+        self.counts[action]['files'] += 1
+        self.counts[action]['bytes'] += task.get('size') or 0
+        if action in (NEW, CHANGED):
+            self.tasks.append(dict(task, action=action))
+
+    def add_orphan(self, key: str, size: int) -> None:
+        self.counts[ORPHANED]['files'] += 1
+        self.counts[ORPHANED]['bytes'] += size
+        self.orphaned.append({'key': key, 'size': size})
+
+    @property
+    def transfer_files(self) -> int:
+        return self.counts[NEW]['files'] + self.counts[CHANGED]['files']
+
+    @property
+    def transfer_bytes(self) -> int:
+        return self.counts[NEW]['bytes'] + self.counts[CHANGED]['bytes']
+
+    def estimate_duration(self, throughput: Optional[Tuple[float, float]]) -> None:
+        """
+        Estimate how long executing the plan takes from measured throughput.
+
+        The slower of the per-file and per-byte rates is used, since runs of
+        small files are limited by request count and runs of large files by
+        bandwidth.
+        """
+        if throughput is None:
+            self.estimate = None
+            return
+        files_per_second, bytes_per_second = throughput
+        seconds = max(
+            self.transfer_files / files_per_second if files_per_second else 0.0,
+            self.transfer_bytes / bytes_per_second if bytes_per_second else 0.0,
+        )
+        self.estimate = {
+            'seconds': round(seconds, 1),
+            'files_per_second': round(files_per_second, 3),
+            'bytes_per_second': round(bytes_per_second, 1),
+        }
+
+    def summary(self) -> str:
+        lines = [f"Plan for s3://{self.bucket} (shard {self.shard_index + 1}/{self.shard_count}):"]
+        for action in ACTIONS:
+            counts = self.counts[action]
+            lines.append(f"  {action:<10} {counts['files']:>8} files  {_format_bytes(counts['bytes']):>12}")
+        lines.append(f"  to transfer {self.transfer_files:>7} files  {_format_bytes(self.transfer_bytes):>12}")
+        if self.estimate:
+            lines.append(
+                f"  estimated duration {self.estimate['seconds'] / 60:.1f} min at "
+                f"{_format_bytes(self.estimate['bytes_per_second'])}/s, "
+                f"{self.estimate['files_per_second']:.1f} files/s"
+            )
+        else:
+            lines.append("  no measured throughput yet, run a transfer first for a duration estimate")
+        if self.dedup:
+            lines.append("  near-duplicate images are only detected while transferring, so this is an upper bound")
+        return "\n".join(lines)
+
+    def save(self, path: str) -> None:
+        body = {
+            'version': PLAN_VERSION,
+            'created_at': self.created_at,
+            'bucket': self.bucket,
+            'shard_index': self.shard_index,
+            'shard_count': self.shard_count,
+            'counts': self.counts,
+            'estimate': self.estimate,
+            'dedup': self.dedup,
+            'tasks': self.tasks,
+            'orphaned': self.orphaned,
+        }
+        with open(path, 'w') as f:
+            json.dump(body, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "TransferPlan":
+        with open(path) as f:
+            body = json.load(f)
+        if body.get('version') != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version {body.get('version')} in {path}")
+        return cls(
+            bucket=body['bucket'],
+            shard_index=body['shard_index'],
+            shard_count=body['shard_count'],
+            created_at=body['created_at'],
+            counts=body['counts'],
+            tasks=body['tasks'],
+            orphaned=body['orphaned'],
+            estimate=body.get('estimate'),
+            dedup=body.get('dedup', False),
+        )
@@ -1,3 +1,4 @@
+import io
 import os
 import logging
 import argparse
@@ -6,7 +7,7 @@ from PIL import Image, UnidentifiedImageError
 from pillow_heif import register_heif_opener
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import shutil
-from typing import Tuple, List, Generator
+from typing import BinaryIO, Tuple, List, Generator, Union
 from dataclasses import dataclass
 from tqdm import tqdm
 
@@ -17,6 +18,34 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+def convert_heic_image(source: Union[Path, BinaryIO], target: Union[Path, BinaryIO], quality: int = 50) -> None:
+    """
+    Decode a HEIC image and write it as JPEG.
+    
+    Args:
+        source (Union[Path, BinaryIO]): HEIC file path or readable file object
+        target (Union[Path, BinaryIO]): JPEG file path or writable file object
+        quality (int): Output JPG quality (1-100)
+    """
+    with Image.open(source) as image:
+        image.save(target, "JPEG", quality=max(1, min(100, quality)))
+
+def convert_heic_bytes(data: bytes, quality: int = 50) -> bytes:
+    """
+    Convert HEIC image bytes to JPEG bytes in memory.
+    
+    Args:
+        data (bytes): HEIC file content
+        quality (int): Output JPG quality (1-100)
+        
+    Returns:
+        bytes: JPEG file content
+    """
+    register_heif_opener()
+    output = io.BytesIO()
+    convert_heic_image(io.BytesIO(data), output, quality)
+    return output.getvalue()
+
 @dataclass
 class ConversionStats:
     """Class to hold conversion statistics"""
@@ -64,8 +93,7 @@ class HeicConverter:
             # Create the parent directory if it doesn't exist
             jpg_path.parent.mkdir(parents=True, exist_ok=True)
             
-            with Image.open(heic_path) as image:
-                image.save(jpg_path, "JPEG", quality=self.output_quality)
+            convert_heic_image(heic_path, jpg_path, self.output_quality)
             
             # Preserve original timestamps
             heic_stat = os.stat(heic_path)